@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Conditioning Benchmark
+Measures the text-encode time saved per panel by encoding shared style blocks
+in their own cached nodes instead of re-encoding the full prompt every time.
+
+Every panel of a prompt set is queued twice against the live ComfyUI server:
+  joint - prefix + panel + suffix concatenated into one CLIPTextEncode
+  split - shared blocks in separate nodes joined with ConditioningConcat
+Sampling is reduced to 1 step at a small size so that the difference between
+the two modes is dominated by text encoding. Execution time is taken from the
+server's execution_start/execution_success timestamps in /history.
+"""
+
+import sys
+import json
+import time
+import logging
+from statistics import mean
+from typing import Any, Dict, List
+from config import configure_logging
+from comfyui_api import (check_server_status, create_basic_workflow, get_poller,
+                         queue_prompt, wait_for_completion)
+from shot_runner import PROMPT_SETS, Shot, get_prompt_set, resolve_request
+
+logger = logging.getLogger(__name__)
+
+SHARED_TITLES = {"CLIP Text Encode (Style Prefix)", "CLIP Text Encode (Style Suffix)",
+                 "CLIP Text Encode (Shared Negative)"}
+
+
+def joint_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Fold the shared blocks back into the prompt texts, as before the split"""
+    joint = dict(request)
+    prefix = joint.pop("prompt_prefix", "")
+    suffix = joint.pop("prompt_suffix", "")
+    negative_suffix = joint.pop("negative_suffix", "")
+    joint["prompt"] = " ".join(part for part in (prefix, request["prompt"], suffix) if part)
+    if negative_suffix:
+        joint["negative_prompt"] = f"{request['negative_prompt']}, {negative_suffix}"
+    return joint
+
+
+def run_prompt(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Queue one workflow and return its execution time and cached nodes
+
+    Returns:
+        Dict with 'seconds' (server-side when available), 'cached' node ids
+        and the ids of the 'shared' style encoders
+    """
+    workflow = create_basic_workflow(**request)
+    shared = [node_id for node_id, node in workflow.items()
+              if node["_meta"]["title"] in SHARED_TITLES]
+    start = time.time()
+    prompt_id = queue_prompt(workflow)["prompt_id"]
+    entry = wait_for_completion(prompt_id, timeout=300, poll_interval=0.2)
+    elapsed = time.time() - start
+    get_poller().release(prompt_id)
+
+    cached = set()
+    timestamps = {}
+    for event, data in entry.get("status", {}).get("messages", []):
+        if event == "execution_cached":
+            cached.update(str(node) for node in data.get("nodes", []))
+        if "timestamp" in data:
+            timestamps[event] = data["timestamp"]
+
+    if "execution_start" in timestamps and "execution_success" in timestamps:
+        # ComfyUI reports millisecond timestamps
+        elapsed = (timestamps["execution_success"] - timestamps["execution_start"]) / 1000
+
+    return {"seconds": elapsed, "cached": sorted(cached), "shared": shared}
+
+
+def benchmark(prompt_set: str, repeats: int = 2, steps: int = 1, size: int = 256) -> Dict[str, Any]:
+    """
+    Run every panel of a prompt set in joint and split mode
+
+    Returns:
+        Report dict with per-mode timings and the saving per panel
+    """
+    overrides = {"steps": steps, "width": size, "height": size, "variations": 1, "seed": 1}
+    requests = [resolve_request(Shot(id=key, prompt_set=prompt_set, key=key, overrides=overrides))
+                for key in get_prompt_set(prompt_set)]
+
+    if not any(r.get("prompt_prefix") or r.get("prompt_suffix") or r.get("negative_suffix")
+               for r in requests):
+        raise ValueError(f"Prompt set '{prompt_set}' has no shared style blocks to split")
+
+    # Warm up: load the checkpoint so neither mode pays for it
+    run_prompt(joint_request(requests[0]))
+
+    results: Dict[str, List[Dict[str, Any]]] = {"joint": [], "split": []}
+    for repeat in range(repeats):
+        for mode in ("joint", "split"):
+            for request in requests:
+                request = joint_request(request) if mode == "joint" else dict(request)
+                # Vary the per-panel text invisibly so repeats can't hit the cache
+                request["prompt"] = request["prompt"] + " " * repeat
+                results[mode].append(run_prompt(request))
+
+    joint_ms = mean(r["seconds"] for r in results["joint"]) * 1000
+    split_ms = mean(r["seconds"] for r in results["split"]) * 1000
+    shared_hits = sum(1 for r in results["split"] if set(r["shared"]).intersection(r["cached"]))
+
+    return {
+        "prompt_set": prompt_set,
+        "panels": len(requests),
+        "repeats": repeats,
+        "joint_ms_per_panel": round(joint_ms, 1),
+        "split_ms_per_panel": round(split_ms, 1),
+        "saved_ms_per_panel": round(joint_ms - split_ms, 1),
+        "shared_cache_hit_rate": round(shared_hits / len(results["split"]), 3),
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark shared-prefix conditioning reuse")
+    parser.add_argument("--set", default="scene1", choices=list(PROMPT_SETS),
+                        help="Prompt set to benchmark")
+    parser.add_argument("--repeats", type=int, default=2, help="Passes over the prompt set")
+    parser.add_argument("--steps", type=int, default=1, help="Sampling steps per prompt")
+    parser.add_argument("--size", type=int, default=256, help="Square image size")
+    parser.add_argument("--json", type=str, help="Write the report to this file")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    if not check_server_status():
+        logger.error("❌ ComfyUI server is not reachable")
+        sys.exit(1)
+
+    logger.info(f"⏱️  Benchmarking conditioning reuse on '{args.set}'...")
+    report = benchmark(args.set, repeats=args.repeats, steps=args.steps, size=args.size)
+
+    logger.info(f"\n📊 {report['panels']} panels x {report['repeats']} repeats:")
+    logger.info(f"   joint encode: {report['joint_ms_per_panel']:8.1f} ms/panel")
+    logger.info(f"   split encode: {report['split_ms_per_panel']:8.1f} ms/panel")
+    logger.info(f"   saved:        {report['saved_ms_per_panel']:8.1f} ms/panel")
+    logger.info(f"   shared encoder cache hits: {report['shared_cache_hit_rate']:.0%}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Sampler Benchmark
+Measures real sampling throughput per sampler, scheduler, resolution and batch size.
+
+Every configuration of the matrix is queued against the live ComfyUI server
+after warm-up renders (checkpoint load, first-run kernels), with a new seed
+per repetition so nothing is served from cache. Timings come from the
+websocket events (see comfyui_events): the KSampler node time and its
+progress events give sec/step, the whole prompt gives images/min. The report
+records the sampler and scheduler that actually ran (after
+SAMPLER_ALIASES), the server's devices and the git revision, and is saved
+as JSON and Markdown under outputs/benchmarks/.
+"""
+
+import sys
+import time
+import logging
+from statistics import median
+from typing import Any, Dict, List, Optional, Tuple
+from config import configure_logging, get_output_path, OUTPUT_DIR
+from comfyui_api import (DEFAULT_CHECKPOINT, check_server_status, create_basic_workflow,
+                         delete_history, get_system_stats, queue_prompt)
+from node_profiler import NodeProfile, to_markdown as profile_markdown
+
+logger = logging.getLogger(__name__)
+
+BENCHMARKS_DIR = "benchmarks"
+REPORT_VERSION = 1
+
+DEFAULT_MATRIX = {
+    "sampler": ["euler", "euler_ancestral", "dpmpp_2m"],
+    "scheduler": ["normal", "karras"],
+    "resolution": ["512x768", "768x1024"],
+    "batch_size": [1, 2],
+}
+DEFAULT_STEPS = 20
+DEFAULT_REPEATS = 3
+DEFAULT_WARMUP = 1
+BENCHMARK_PROMPT = ("film noir detective in a rain-soaked alley, fedora, trench coat, "
+                    "venetian blind shadows, high contrast black and white")
+BENCHMARK_NEGATIVE = "color, blurry, low quality"
+SEED_BASE = 1000
+
+
+def parse_resolution(text: str) -> Tuple[int, int]:
+    """'768x1024' -> (768, 1024)"""
+    width, height = (int(value) for value in text.lower().split("x"))
+    return width, height
+
+
+def benchmark_workflow(sampler: str, scheduler: str, width: int, height: int, batch_size: int,
+                       steps: int, seed: int, ckpt_name: str) -> Dict[str, Any]:
+    """
+    Workflow for one benchmark render
+
+    SaveImage is swapped for PreviewImage, so benchmark images go to the
+    server's temp folder instead of piling up in its output folder.
+    """
+    workflow = create_basic_workflow(prompt=BENCHMARK_PROMPT, negative_prompt=BENCHMARK_NEGATIVE,
+                                     width=width, height=height, steps=steps, cfg_scale=7.0,
+                                     sampler_name=sampler, scheduler=scheduler, seed=seed,
+                                     batch_size=batch_size, ckpt_name=ckpt_name)
+    for node in workflow.values():
+        if node["class_type"] == "SaveImage":
+            node["class_type"] = "PreviewImage"
+            node["inputs"] = {"images": node["inputs"]["images"]}
+    return workflow
+
+
+def run_once(stream, workflow: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    """
+    Queue a workflow and time it from its websocket events
+
+    Returns:
+        Dict with 'seconds' (execution), 'sampler_seconds', 'decode_seconds',
+        'step_seconds', 'steps' and every node's 'timings'
+    """
+    prompt_id = queue_prompt(workflow, client_id=stream.client_id)["prompt_id"]
+    trace = stream.trace(prompt_id)
+    try:
+        if not trace.wait(timeout):
+            raise TimeoutError(f"Prompt {prompt_id} did not finish within {timeout}s")
+        if trace.error:
+            raise RuntimeError(f"Prompt {prompt_id} failed: {trace.error.get('exception_message', trace.error['event'])}")
+    finally:
+        stream.forget(prompt_id)
+
+    node_timings = trace.node_timings(workflow)
+    timings = {t["class_type"]: t for t in node_timings if not t["cached"]}
+    sampler = timings.get("KSampler", {})
+    decode = timings.get("VAEDecode", {})
+    return {
+        "seconds": trace.seconds,
+        "sampler_seconds": sampler.get("seconds"),
+        "decode_seconds": decode.get("seconds"),
+        "step_seconds": sampler.get("step_seconds"),
+        "steps": sampler.get("steps", 0),
+        "prompt_id": prompt_id,
+        "timings": node_timings,
+    }
+
+
+def _median(values: List[Optional[float]]) -> Optional[float]:
+    values = [value for value in values if value is not None]
+    return median(values) if values else None
+
+
+def benchmark(matrix: Dict[str, List[Any]], steps: int = DEFAULT_STEPS, repeats: int = DEFAULT_REPEATS,
+              warmup: int = DEFAULT_WARMUP, ckpt_name: str = DEFAULT_CHECKPOINT,
+              timeout: float = 600, profile: Optional[NodeProfile] = None) -> List[Dict[str, Any]]:
+    """
+    Run every configuration of the matrix
+
+    Args:
+        matrix: Values for sampler, scheduler, resolution ("WxH") and batch_size
+        steps: Sampling steps per render
+        repeats: Timed renders per configuration
+        warmup: Untimed renders per resolution and batch size before timing
+        ckpt_name: Checkpoint to benchmark with
+        timeout: Per-render timeout in seconds
+        profile: Node profile to add the timed renders to
+
+    Returns:
+        One result per configuration with medians over the repeats
+    """
+    from itertools import product
+    from comfyui_events import EventStream
+
+    results = []
+    seed = SEED_BASE
+    finished_prompts = []
+    with EventStream() as stream:
+        warmed = set()
+        for resolution, batch_size in product(matrix["resolution"], matrix["batch_size"]):
+            width, height = parse_resolution(resolution)
+            for sampler, scheduler in product(matrix["sampler"], matrix["scheduler"]):
+                if (resolution, batch_size) not in warmed:
+                    for _ in range(warmup):
+                        seed += 1
+                        warm = run_once(stream, benchmark_workflow(sampler, scheduler, width, height,
+                                                                   batch_size, steps, seed, ckpt_name), timeout)
+                        finished_prompts.append(warm["prompt_id"])
+                    warmed.add((resolution, batch_size))
+
+                runs = []
+                workflow = None
+                for _ in range(repeats):
+                    seed += 1
+                    workflow = benchmark_workflow(sampler, scheduler, width, height, batch_size,
+                                                  steps, seed, ckpt_name)
+                    runs.append(run_once(stream, workflow, timeout))
+                    finished_prompts.append(runs[-1]["prompt_id"])
+                    if profile is not None:
+                        profile.add_workflow(workflow, runs[-1]["timings"])
+
+                sampler_inputs = next(node["inputs"] for node in workflow.values()
+                                      if node["class_type"] == "KSampler")
+                seconds = _median([run["seconds"] for run in runs])
+                sampler_seconds = _median([run["sampler_seconds"] for run in runs])
+                result = {
+                    "sampler": sampler,
+                    "scheduler": scheduler,
+                    "ran_sampler": sampler_inputs["sampler_name"],
+                    "ran_scheduler": sampler_inputs["scheduler"],
+                    "width": width,
+                    "height": height,
+                    "batch_size": batch_size,
+                    "steps": steps,
+                    "repeats": len(runs),
+                    "seconds": seconds,
+                    "sampler_seconds": sampler_seconds,
+                    "decode_seconds": _median([run["decode_seconds"] for run in runs]),
+                    "sec_per_step": _median([run["step_seconds"] for run in runs]),
+                    "images_per_min": batch_size * 60 / seconds if seconds else None,
+                    "runs": [run["seconds"] for run in runs],
+                }
+                results.append(result)
+                logger.info(f"⏱️  {sampler}/{scheduler} {resolution} x{batch_size}: "
+                            f"{_fmt(result['sec_per_step'], '.3f')} s/step, "
+                            f"{_fmt(result['images_per_min'], '.1f')} images/min")
+    try:
+        delete_history(finished_prompts)
+    except OSError as e:
+        logger.warning(f"Could not prune server history: {e}")
+    return results
+
+
+def _fmt(value: Optional[float], spec: str) -> str:
+    return "n/a" if value is None else format(value, spec)
+
+
+def _git_revision() -> Optional[str]:
+    import subprocess
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=str(OUTPUT_DIR.parent), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def build_report(results: List[Dict[str, Any]], settings: Dict[str, Any],
+                 profile: Optional[NodeProfile] = None) -> Dict[str, Any]:
+    """Versioned report: results plus server, revision, settings and the node profile"""
+    from datetime import datetime, timezone
+
+    try:
+        stats = get_system_stats()
+        server = {"system": stats.get("system", {}),
+                  "devices": [device.get("name") for device in stats.get("devices", [])]}
+    except OSError:
+        server = {}
+    return {
+        "version": REPORT_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "server": server,
+        "settings": settings,
+        "results": results,
+        "nodes": profile.report() if profile is not None else None,
+    }
+
+
+def to_markdown(report: Dict[str, Any]) -> str:
+    """Markdown table of a report, fastest sec/step first within each resolution and batch size"""
+    devices = ", ".join(filter(None, report["server"].get("devices", []))) or "unknown device"
+    lines = [
+        f"# Sampler benchmark ({report['created']})",
+        "",
+        f"- Device: {devices}",
+        f"- Revision: {report['revision'] or 'unknown'}, report version {report['version']}",
+        f"- {report['settings']['steps']} steps, {report['settings']['repeats']} repeats after "
+        f"{report['settings']['warmup']} warm-up render(s), checkpoint {report['settings']['checkpoint']}",
+        "",
+        "| Sampler | Scheduler | Runs as | Size | Batch | s/step | Sampling s | Decode s | Total s | Images/min |",
+        "|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    ordered = sorted(report["results"], key=lambda r: (r["width"] * r["height"], r["batch_size"],
+                                                       r["sec_per_step"] or float("inf")))
+    for r in ordered:
+        lines.append(f"| {r['sampler']} | {r['scheduler']} | {r['ran_sampler']}/{r['ran_scheduler']} "
+                     f"| {r['width']}x{r['height']} | {r['batch_size']} | {_fmt(r['sec_per_step'], '.3f')} "
+                     f"| {_fmt(r['sampler_seconds'], '.2f')} | {_fmt(r['decode_seconds'], '.2f')} "
+                     f"| {_fmt(r['seconds'], '.2f')} | {_fmt(r['images_per_min'], '.1f')} |")
+    text = "\n".join(lines) + "\n"
+    if report.get("nodes"):
+        text += "\n" + profile_markdown(report["nodes"])
+    return text
+
+
+def save_report(report: Dict[str, Any]) -> List[str]:
+    """Write a report as JSON and Markdown; returns both paths relative to outputs/"""
+    import json
+
+    stamp = report["created"].replace(":", "").replace("-", "").split("+")[0]
+    base = f"{BENCHMARKS_DIR}/samplers_{stamp}"
+    saved = []
+    for suffix, text in ((".json", json.dumps(report, indent=2)), (".md", to_markdown(report))):
+        target = get_output_path(base + suffix)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(text, encoding="utf-8")
+        saved.append(base + suffix)
+    return saved
+
+
+def main():
+    import argparse
+
+    def values(text: str) -> List[str]:
+        return [value.strip() for value in text.split(",") if value.strip()]
+
+    parser = argparse.ArgumentParser(description="Benchmark sampler/scheduler throughput on the live server")
+    parser.add_argument("--samplers", default=",".join(DEFAULT_MATRIX["sampler"]),
+                        help="Sampler names (ComfyUI or A1111 style)")
+    parser.add_argument("--schedulers", default=",".join(DEFAULT_MATRIX["scheduler"]))
+    parser.add_argument("--resolutions", default=",".join(DEFAULT_MATRIX["resolution"]),
+                        help="Comma-separated WxH sizes")
+    parser.add_argument("--batch-sizes", default=",".join(map(str, DEFAULT_MATRIX["batch_size"])))
+    parser.add_argument("--steps", type=int, default=DEFAULT_STEPS, help="Sampling steps per render")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="Timed renders per configuration")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP,
+                        help="Untimed renders per resolution and batch size")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--timeout", type=int, default=600, help="Per-render timeout in seconds")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    try:
+        matrix = {
+            "sampler": values(args.samplers),
+            "scheduler": values(args.schedulers),
+            "resolution": values(args.resolutions),
+            "batch_size": [int(value) for value in values(args.batch_sizes)],
+        }
+        for resolution in matrix["resolution"]:
+            parse_resolution(resolution)
+    except ValueError:
+        logger.error("❌ Resolutions must look like 768x1024 and batch sizes must be integers")
+        sys.exit(1)
+    if args.repeats < 1:
+        logger.error("❌ --repeats must be at least 1")
+        sys.exit(1)
+
+    if not check_server_status():
+        logger.error("❌ ComfyUI server is not reachable")
+        sys.exit(1)
+
+    configs = 1
+    for options in matrix.values():
+        configs *= len(options)
+    logger.info(f"⏱️  Benchmarking {configs} configuration(s) x {args.repeats} repeat(s), {args.steps} steps")
+    start = time.time()
+    profile = NodeProfile()
+    try:
+        results = benchmark(matrix, steps=args.steps, repeats=args.repeats, warmup=args.warmup,
+                            ckpt_name=args.checkpoint, timeout=args.timeout, profile=profile)
+    except (ConnectionError, TimeoutError, RuntimeError) as e:
+        logger.error(f"❌ Benchmark failed: {e}")
+        sys.exit(1)
+
+    report = build_report(results, {"steps": args.steps, "repeats": args.repeats, "warmup": args.warmup,
+                                    "checkpoint": args.checkpoint, "matrix": matrix}, profile)
+    print(to_markdown(report))
+    for path in save_report(report):
+        logger.info(f"📁 {OUTPUT_DIR / path}")
+    logger.info(f"✅ Done in {time.time() - start:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
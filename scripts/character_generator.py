@@ -5,18 +5,11 @@ Clean geometric noir style character development system
 """
 
 import logging
-from datetime import datetime
-from config import get_config, get_output_path
+from config import configure_logging
 from utils import validate_prompt_key, validate_seed
-from comfyui_api import generate_image, check_server_status
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
-# API Configuration
-COMFYUI_URL = get_config('COMFYUI_URL')
-
 # Main Character Development Prompts
 CHARACTER_PROMPTS = {
     "character_profile_front": {
@@ -138,103 +131,104 @@ CHARACTER_PARAMS = {
     "n_iter": 3,  # More variations for character development
 }
 
-def create_character_prompt(base_prompt):
-    """Enhanced prompt for character consistency"""
-    character_modifiers = """
+FIXED_SEED = 12345678  # Fixed seed for consistency across studies
+
+# Shared blocks added to every character study (encoded once per batch)
+CHARACTER_MODIFIERS = """
     masterpiece, best quality, character design sheet, clean vector illustration,
     geometric character design, consistent facial features, bold graphic style,
     """
-    
-    return f"{character_modifiers} {base_prompt}"
 
-def create_character_negative(base_negative):
-    """Enhanced negative for clean character design"""
-    character_prevention = """
+CHARACTER_PREVENTION = """
     multiple people, inconsistent features, realistic proportions, detailed anatomy,
     cross-hatching, texture, gritty art, photorealistic, soft gradients,
     complex shading, watercolor, painting style, sketchy lines, anime, cartoon,
     """
-    
-    return f"{base_negative}, {character_prevention}"
 
-def generate_character_study(prompt_key, custom_seed=None, use_fixed_seed=False):
-    """Generate character studies with optional seed consistency"""
-    # Validate inputs
+def create_character_prompt(base_prompt):
+    """Enhanced prompt for character consistency"""
+    return f"{CHARACTER_MODIFIERS} {base_prompt}"
+
+def create_character_negative(base_negative):
+    """Enhanced negative for clean character design"""
+    return f"{base_negative}, {CHARACTER_PREVENTION}"
+
+def build_request(prompt_key, seed=-1):
+    """Build generate_image() arguments for a character study"""
     if not validate_prompt_key(prompt_key):
         raise ValueError(f"Invalid prompt key format: {prompt_key}")
     
     if prompt_key not in CHARACTER_PROMPTS:
         raise KeyError(f"Unknown character prompt: {prompt_key}")
     
-    custom_seed = validate_seed(custom_seed)
-    
     char_data = CHARACTER_PROMPTS[prompt_key]
     
-    # Enhanced prompts for character work
-    prompt = create_character_prompt(char_data["prompt"])
-    negative = create_character_negative(char_data["negative"])
+    return {
+        # Enhanced prompts for character work, shared blocks encoded separately
+        "prompt_prefix": CHARACTER_MODIFIERS,
+        "prompt": char_data["prompt"],
+        "negative_prompt": char_data["negative"],
+        "negative_suffix": CHARACTER_PREVENTION,
+        "width": CHARACTER_PARAMS["width"],
+        "height": CHARACTER_PARAMS["height"],
+        "steps": CHARACTER_PARAMS["steps"],
+        "cfg_scale": CHARACTER_PARAMS["cfg_scale"],
+        "sampler_name": CHARACTER_PARAMS["sampler_name"],
+        "scheduler": CHARACTER_PARAMS["scheduler"].lower(),
+        "seed": validate_seed(seed),
+        "batch_size": CHARACTER_PARAMS["n_iter"],
+    }
+
+def generate_character_study(prompt_key, custom_seed=None, use_fixed_seed=False):
+    """Generate character studies with optional seed consistency"""
+    from shot_runner import make_shots, run_shots
+
+    custom_seed = validate_seed(custom_seed)
     
     # Determine seed
     if custom_seed:
         seed = custom_seed
     elif use_fixed_seed:
-        seed = 12345678  # Fixed seed for consistency
+        seed = FIXED_SEED
     else:
         seed = -1  # Random
     
+    # Validates the key before anything is logged
+    build_request(prompt_key, seed)
+    char_data = CHARACTER_PROMPTS[prompt_key]
+    
     logger.info(f"\n👤 Generating Character Study: {prompt_key}")
     logger.info(f"🎭 Style Note: {char_data['style_note']}")
     logger.info(f"🎯 Seed Mode: {'Fixed' if use_fixed_seed else 'Custom' if custom_seed else 'Random'}")
     
-    try:
-        # Generate using ComfyUI
-        images = generate_image(
-            prompt=prompt,
-            negative_prompt=negative,
-            width=CHARACTER_PARAMS["width"],
-            height=CHARACTER_PARAMS["height"],
-            steps=CHARACTER_PARAMS["steps"],
-            cfg_scale=CHARACTER_PARAMS["cfg_scale"],
-            sampler_name=CHARACTER_PARAMS["sampler_name"],
-            scheduler=CHARACTER_PARAMS["scheduler"].lower(),
-            seed=seed,
-            batch_size=CHARACTER_PARAMS["n_iter"],
-            timeout=300
-        )
-        
-        # Save generated images
-        for i, image_data in enumerate(images):
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"character_{prompt_key}_{timestamp}_v{i+1}.png"
-            filepath = get_output_path(filename)
-            
-            # Save image
-            with open(filepath, 'wb') as f:
-                f.write(image_data)
-            
-            file_size = len(image_data) / 1024
-            logger.info(f"✅ Saved: {filename} ({file_size:.1f}KB)")
-        
-        logger.info(f"🔧 Images generated: {len(images)}")
-        logger.info(f"⚙️  Seed: {seed if seed != -1 else 'random'}")
-        logger.info(f"🎯 CFG Scale: {CHARACTER_PARAMS['cfg_scale']}")
-        
-        return True
-        
-    except TimeoutError:
-        logger.error(f"API request timed out after 300s")
-        return False
-    except Exception as e:
-        logger.error(f"Generation Error: {e}")
-        return False
-        logger.critical(f"Unexpected error: {e}", exc_info=True)
+    summary = run_shots(make_shots("character", [prompt_key], seed=seed))
+    if summary["failed"]:
         return False
+    
+    logger.info(f"🔧 Images generated: {len(summary['files'])}")
+    logger.info(f"⚙️  Seed: {seed if seed != -1 else 'random'}")
+    logger.info(f"🎯 CFG Scale: {CHARACTER_PARAMS['cfg_scale']}")
+    
+    return True
 
-def generate_character_sheet():
-    """Generate complete character reference sheet"""
-    print("👤 DRIFTINGME - Character Development Sheet")
+def generate_character_studies(studies, title):
+    """Generate a group of studies with the fixed seed through the shared runner"""
+    from shot_runner import make_shots, run_shots
+
+    print(title)
     print("=" * 50)
     
+    try:
+        summary = run_shots(make_shots("character", studies, seed=FIXED_SEED))
+    except (ValueError, KeyError) as e:
+        logger.error(f"Failed to plan character studies: {e}")
+        return None
+    
+    print("-" * 30)
+    return summary
+
+def generate_character_sheet():
+    """Generate complete character reference sheet"""
     # Core character studies
     core_studies = [
         "character_profile_front",
@@ -243,44 +237,32 @@ def generate_character_sheet():
         "character_silhouette_bed"
     ]
     
-    success_count = 0
-    for study in core_studies:
-        try:
-            if generate_character_study(study, use_fixed_seed=True):
-                success_count += 1
-        except (ValueError, KeyError) as e:
-            logger.error(f"Failed to generate {study}: {e}")
-        print("-" * 30)
+    summary = generate_character_studies(core_studies, "👤 DRIFTINGME - Character Development Sheet")
+    if summary is None:
+        return
     
     print(f"\n📊 Character Sheet Complete:")
-    print(f"✅ Successfully generated: {success_count}/{len(core_studies)} studies")
+    print(f"✅ Successfully generated: {summary['succeeded']}/{len(core_studies)} studies")
 
 def generate_character_details():
     """Generate detailed character feature studies"""
-    print("🔍 DRIFTINGME - Character Detail Studies")
-    print("=" * 50)
-    
     detail_studies = [
         "character_hands_geometric",
         "character_eyes_geometric",
         "character_consistent_test"
     ]
     
-    success_count = 0
-    for study in detail_studies:
-        try:
-            if generate_character_study(study, use_fixed_seed=True):
-                success_count += 1
-        except (ValueError, KeyError) as e:
-            logger.error(f"Failed to generate {study}: {e}")
-        print("-" * 30)
+    summary = generate_character_studies(detail_studies, "🔍 DRIFTINGME - Character Detail Studies")
+    if summary is None:
+        return
     
     print(f"\n📊 Detail Studies Complete:")
-    print(f"✅ Successfully generated: {success_count}/{len(detail_studies)} studies")
+    print(f"✅ Successfully generated: {summary['succeeded']}/{len(detail_studies)} studies")
 
 def main():
     import sys
     
+    configure_logging()
     if len(sys.argv) > 1:
         command = sys.argv[1]
         if command == "sheet":
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Import-Time Budget Check
+Regression check for CLI startup cost using `python -X importtime`.
+
+Each entry point is imported in a fresh interpreter and its cumulative
+import time is compared against a millisecond budget. Heavy dependencies
+that must only be imported on use (e.g. requests) are reported as failures
+if they show up during import.
+"""
+
+import sys
+import argparse
+import logging
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Tuple
+from config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+SCRIPTS_DIR = Path(__file__).parent
+
+# Cumulative import budget per entry point, in milliseconds
+IMPORT_BUDGETS_MS = {
+    "config": 25,
+    "utils": 25,
+    "comfyui_api": 30,
+    "shot_runner": 40,
+    "character_generator": 40,
+    "clear_character_generator": 40,
+    "integrated_generator": 40,
+    "noir_generator": 40,
+    "scene1_generator": 40,
+    "noir_generator_remote": 40,
+}
+
+# Modules that must never be pulled in just by importing an entry point
+FORBIDDEN_IMPORTS = {"requests", "urllib3", "urllib.request", "ssl", "http.client"}
+
+
+def measure_import(module: str) -> Tuple[float, List[str]]:
+    """
+    Import a module in a fresh interpreter with -X importtime
+
+    Args:
+        module: Name of the module to import
+
+    Returns:
+        (cumulative import time in ms, list of all imported module names)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SCRIPTS_DIR,
+        capture_output=True,
+        text=True,
+        timeout=60
+    )
+
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip()}")
+
+    cumulative_us = None
+    imported = []
+
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        name = parts[2].strip()
+        imported.append(name)
+        if name == module:
+            cumulative_us = int(parts[1])
+
+    if cumulative_us is None:
+        raise RuntimeError(f"No importtime entry found for {module}")
+
+    return cumulative_us / 1000, imported
+
+
+def check_budgets(budgets: Dict[str, float], repeats: int = 3) -> bool:
+    """
+    Check every entry point against its budget
+
+    The best of several runs is used so that a cold disk cache on the first
+    import does not cause spurious failures.
+
+    Returns:
+        True if all entry points are within budget
+    """
+    # Warm the bytecode cache so the first measurement isn't a compile
+    for module in budgets:
+        measure_import(module)
+
+    all_ok = True
+    for module, budget_ms in budgets.items():
+        runs = [measure_import(module) for _ in range(repeats)]
+        best_ms = min(ms for ms, _ in runs)
+        forbidden = sorted(FORBIDDEN_IMPORTS.intersection(runs[0][1]))
+
+        ok = best_ms <= budget_ms and not forbidden
+        all_ok = all_ok and ok
+
+        status = "✅" if ok else "❌"
+        logger.info(f"{status} {module:<28} {best_ms:7.1f}ms / {budget_ms:.0f}ms budget")
+        if forbidden:
+            logger.error(f"   {module} imports heavy modules at import time: {', '.join(forbidden)}")
+
+    return all_ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check import-time budgets of the generator CLIs")
+    parser.add_argument("modules", nargs="*",
+                        help="Entry points to check (default: all)")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="Runs per entry point, best one is used")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Multiply all budgets (e.g. 2.0 on slow CI hosts)")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    modules = args.modules or list(IMPORT_BUDGETS_MS)
+    unknown = [m for m in modules if m not in IMPORT_BUDGETS_MS]
+    if unknown:
+        parser.error(f"No budget defined for: {', '.join(unknown)}")
+
+    budgets = {m: IMPORT_BUDGETS_MS[m] * args.scale for m in modules}
+
+    if not check_budgets(budgets, repeats=args.repeats):
+        logger.error("Import-time budget exceeded")
+        sys.exit(1)
+
+    logger.info("🎉 All entry points within import-time budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,12 @@ DriftingMe Character Generator - REFINED CLOSE-UPS
 Clean noir comic character with clear, defined features - NOT abstract/Picasso style
 """
 
-from datetime import datetime
-import os
 import logging
+from config import configure_logging
+from utils import validate_prompt_key, validate_seed
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
-# API Configuration
-COMFYUI_URL = "http://localhost:8188"
-
 # REFINED Character Prompts - Clear Features, Not Abstract
 REFINED_CHARACTER_PROMPTS = {
     "character_closeup_clear": {
@@ -117,85 +112,85 @@ CLEAR_CHARACTER_PARAMS = {
     "n_iter": 3,
 }
 
-def create_clear_character_prompt(base_prompt):
-    """Enhanced prompt for clear, defined character features"""
-    character_modifiers = """
+# Shared blocks added to every clear character study (encoded once per batch)
+CLEAR_CHARACTER_MODIFIERS = """
     professional comic book art, clear character design, defined human features,
     realistic proportions, clean illustration, classic comic book style,
     """
-    
-    return f"{character_modifiers} {base_prompt}"
 
-def create_clear_negative(base_negative):
-    """Strong negative to prevent abstract/Picasso-style distortion"""
-    distortion_prevention = """
+DISTORTION_PREVENTION = """
     abstract art, cubism, picasso, surrealism, distorted anatomy, weird proportions,
     fragmented features, artistic distortion, deformed face, multiple features,
     avant-garde art, experimental style, unrealistic anatomy, bizarre features,
     """
+
+def create_clear_character_prompt(base_prompt):
+    """Enhanced prompt for clear, defined character features"""
+    return f"{CLEAR_CHARACTER_MODIFIERS} {base_prompt}"
+
+def create_clear_negative(base_negative):
+    """Strong negative to prevent abstract/Picasso-style distortion"""
+    return f"{base_negative}, {DISTORTION_PREVENTION}"
+
+def build_request(prompt_key, seed=-1):
+    """Build generate_image() arguments for a clear character study"""
+    if not validate_prompt_key(prompt_key) or prompt_key not in REFINED_CHARACTER_PROMPTS:
+        raise KeyError(f"Unknown character prompt: {prompt_key}")
     
-    return f"{base_negative}, {distortion_prevention}"
+    char_data = REFINED_CHARACTER_PROMPTS[prompt_key]
+    
+    return {
+        # Enhanced prompts for clear character work, shared blocks encoded separately
+        "prompt_prefix": CLEAR_CHARACTER_MODIFIERS,
+        "prompt": char_data["prompt"],
+        "negative_prompt": char_data["negative"],
+        "negative_suffix": DISTORTION_PREVENTION,
+        "width": CLEAR_CHARACTER_PARAMS["width"],
+        "height": CLEAR_CHARACTER_PARAMS["height"],
+        "steps": CLEAR_CHARACTER_PARAMS["steps"],
+        "cfg_scale": CLEAR_CHARACTER_PARAMS["cfg_scale"],
+        "sampler_name": CLEAR_CHARACTER_PARAMS["sampler_name"],
+        "scheduler": CLEAR_CHARACTER_PARAMS["scheduler"].lower(),
+        "seed": validate_seed(seed),
+        "batch_size": CLEAR_CHARACTER_PARAMS["n_iter"],
+    }
 
 def generate_clear_character(prompt_key, custom_seed=None):
     """Generate clear, defined character features"""
+    from shot_runner import make_shots, run_shots
+
     if prompt_key not in REFINED_CHARACTER_PROMPTS:
         logger.info(f"Unknown character prompt: {prompt_key}")
         return False
     
     char_data = REFINED_CHARACTER_PROMPTS[prompt_key]
-    
-    # Enhanced prompts for clear character work
-    prompt = create_clear_character_prompt(char_data["prompt"])
-    negative = create_clear_negative(char_data["negative"])
-    
-    # Prepare payload
-    payload = {
-        **CLEAR_CHARACTER_PARAMS,
-        "prompt": prompt,
-        "negative_prompt": negative,
-    }
-    
-    if custom_seed:
-        payload["seed"] = custom_seed
+    seed = custom_seed if custom_seed else CLEAR_CHARACTER_PARAMS["seed"]
     
     logger.info(f"\n👤 Generating CLEAR Character: {prompt_key}")
     logger.info(f"🎭 Style Note: {char_data['style_note']}")
     logger.info(f"🚫 Anti-Picasso: Strong distortion prevention active")
     
     try:
-        response = requests.post(f"{COMFYUI_URL}/sdapi/v1/txt2img", json=payload, timeout=120)
-        
-        if images:
-            
-            # Save generated images
-            for i, image_data in enumerate(images):
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"generated_{timestamp}_v{i+1}.png"
-                filepath = get_output_path(filename)
-                
-                # Save image
-                image_bytes = image_data
-                with open(filepath, 'wb') as f:
-                    f.write(image_bytes)
-                
-                file_size = len(image_bytes) / 1024
-                logger.info(f"✅ Saved: {filename} ({file_size:.1f}KB)")
-            
-            # Generation complete
-            
-            logger.info(f"⚙️  Seed: {info.get('seed', 'Unknown')}")
-            logger.info(f"🎯 CFG Scale: {payload['cfg_scale']}")
-            logger.info(f"🔄 Sampler: {payload['sampler_name']}")
-            
-            return True
-            
-        else:
-            logger.info(f"❌ API Error: {response.status_code} - {response.text}")
-            return False
-            
-    except Exception as e:
-        logger.info(f"❌ Connection Error: {e}")
+        summary = run_shots(make_shots("clear_character", [prompt_key], seed=seed))
+    except (ValueError, KeyError) as e:
+        logger.info(f"❌ Invalid request: {e}")
+        return False
+    
+    if summary["failed"]:
         return False
+    
+    logger.info(f"⚙️  Seed: {seed if seed != -1 else 'random'}")
+    logger.info(f"🎯 CFG Scale: {CLEAR_CHARACTER_PARAMS['cfg_scale']}")
+    logger.info(f"🔄 Sampler: {CLEAR_CHARACTER_PARAMS['sampler_name']}")
+    
+    return True
+
+def generate_clear_characters(prompt_keys):
+    """Generate several clear character studies through the shared runner"""
+    from shot_runner import make_shots, run_shots
+
+    summary = run_shots(make_shots("clear_character", prompt_keys))
+    return summary["succeeded"]
 
 def generate_clear_character_set():
     """Generate complete set of clear character studies"""
@@ -210,11 +205,8 @@ def generate_clear_character_set():
         "character_awakening_clear"
     ]
     
-    success_count = 0
-    for study in clear_studies:
-        if generate_clear_character(study):
-            success_count += 1
-        logger.info("-" * 40)
+    success_count = generate_clear_characters(clear_studies)
+    logger.info("-" * 40)
     
     logger.info(f"\n📊 Clear Character Studies Complete:")
     logger.info(f"✅ Successfully generated: {success_count}/{len(clear_studies)} clear characters")
@@ -222,16 +214,14 @@ def generate_clear_character_set():
 def main():
     import sys
     
+    configure_logging()
     if len(sys.argv) > 1:
         command = sys.argv[1]
         if command == "clear-set":
             generate_clear_character_set()
         elif command == "all-clear":
             logger.info("Generating all clear character studies...")
-            success = 0
-            for key in REFINED_CHARACTER_PROMPTS.keys():
-                if generate_clear_character(key):
-                    success += 1
+            success = generate_clear_characters(list(REFINED_CHARACTER_PROMPTS))
             logger.info(f"Generated {success}/{len(REFINED_CHARACTER_PROMPTS)} clear characters")
         elif command in REFINED_CHARACTER_PROMPTS:
             custom_seed = None
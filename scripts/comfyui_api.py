@@ -5,20 +5,239 @@ Provides simplified interface for text-to-image generation via ComfyUI API
 """
 
 import json
-import uuid
 import time
-import urllib.request
-import urllib.parse
 import logging
-from typing import Dict, Any, Optional, List
+import threading
+from typing import Dict, Any, Optional, List, NamedTuple, Tuple, Union
 from config import get_config
+from session_recorder import get_recorder
+import run_metrics
+import run_trace
 
 logger = logging.getLogger(__name__)
 
-# API Configuration
-COMFYUI_URL = get_config('COMFYUI_URL')
+DEFAULT_CHECKPOINT = "deliberate_v3.safetensors"
 
-def create_basic_workflow(
+# Server-side SaveImage prefix: everything our workflows save lands in the
+# ComfyUI output subfolder "driftingme", which output_retention manages
+SERVER_SUBFOLDER = "driftingme"
+SERVER_OUTPUT_PREFIX = f"{SERVER_SUBFOLDER}/render"
+
+# Submission retries after a failed POST, and the HTTP statuses worth retrying
+SUBMIT_RETRIES = 3
+RETRY_STATUS = {502, 503, 504}
+
+# Recent history entries scanned for an idempotency key on servers that
+# assign their own prompt ids
+HISTORY_SCAN_ITEMS = 200
+
+# Shared history poller: seconds between ticks, entries fetched beyond the
+# in-flight count, and ticks after which a missing prompt is looked up alone
+DEFAULT_POLL_INTERVAL = 2
+HISTORY_MARGIN = 32
+STALE_TICKS = 10
+
+# A1111-style sampler names used by the generator scripts -> ComfyUI names
+SAMPLER_ALIASES = {
+    "dpm++ 2m karras": "dpmpp_2m",
+    "dpm++ 2m": "dpmpp_2m",
+    "dpm++ sde": "dpmpp_sde",
+    "dpm++ 2m sde": "dpmpp_2m_sde",
+    "euler a": "euler_ancestral",
+    "euler": "euler",
+}
+
+
+def get_server_url() -> str:
+    """Resolve the ComfyUI base URL from configuration on first use"""
+    return get_config('COMFYUI_URL')
+
+
+def _urlopen(path: str, data: Optional[bytes] = None, timeout: float = 30,
+             headers: Optional[Dict[str, str]] = None):
+    """
+    Open a ComfyUI endpoint
+    
+    urllib.request pulls in http.client, email and ssl, so it is imported
+    here on first request rather than when the module is loaded. With
+    COMFYUI_RECORD set the exchange is recorded (see session_recorder).
+    """
+    import urllib.request
+    
+    req = urllib.request.Request(f"{get_server_url()}{path}", data=data, headers=headers or {})
+    recorder = get_recorder()
+    if recorder is not None:
+        return recorder.urlopen(req, timeout)
+    return urllib.request.urlopen(req, timeout=timeout)
+
+
+class NodeOutput(NamedTuple):
+    """Typed reference to one output slot of a workflow node"""
+    node_id: str
+    index: int
+    type: str
+
+    def ref(self) -> List:
+        """Link format used in the /prompt JSON"""
+        return [self.node_id, self.index]
+
+
+# Output types of the node classes used by the WorkflowGraph helpers
+NODE_OUTPUT_TYPES = {
+    "CheckpointLoaderSimple": ("MODEL", "CLIP", "VAE"),
+    "CLIPTextEncode": ("CONDITIONING",),
+    "ConditioningConcat": ("CONDITIONING",),
+    "EmptyLatentImage": ("LATENT",),
+    "KSampler": ("LATENT",),
+    "VAEDecode": ("IMAGE",),
+    "SaveImage": (),
+}
+
+
+class Node:
+    """
+    Handle to a node in a WorkflowGraph
+    
+    Outputs are addressed by slot index or by type name, e.g.
+    checkpoint["CLIP"] is the same as checkpoint[1].
+    """
+    
+    __slots__ = ("id", "class_type", "output_types")
+    
+    def __init__(self, node_id: str, class_type: str, output_types: Tuple[str, ...]):
+        self.id = node_id
+        self.class_type = class_type
+        self.output_types = output_types
+    
+    def __getitem__(self, key: Union[int, str]) -> NodeOutput:
+        if isinstance(key, str):
+            if key not in self.output_types:
+                raise KeyError(f"{self.class_type} has no {key} output "
+                               f"(outputs: {', '.join(self.output_types) or 'none'})")
+            return NodeOutput(self.id, self.output_types.index(key), key)
+        if self.output_types and not 0 <= key < len(self.output_types):
+            raise IndexError(f"{self.class_type} has {len(self.output_types)} output(s), not {key + 1}")
+        output_type = self.output_types[key] if self.output_types else "*"
+        return NodeOutput(self.id, key, output_type)
+    
+    def __repr__(self) -> str:
+        return f"Node({self.id!r}, {self.class_type})"
+
+
+class WorkflowGraph:
+    """
+    Builder for ComfyUI API workflows
+    
+    Node ids are derived from the node's class and inputs (including the ids
+    of the nodes it links to), so:
+    - identical nodes are merged: composing several outputs into one graph
+      loads the checkpoint and encodes each distinct text only once
+    - the same node gets the same id in every workflow, which keeps ComfyUI's
+      node cache effective across prompts
+    """
+    
+    def __init__(self):
+        self._nodes: Dict[str, Dict[str, Any]] = {}
+        self.merged = 0  # nodes deduplicated by add()
+    
+    def add(self, class_type: str, inputs: Dict[str, Any], title: Optional[str] = None,
+            output_types: Optional[Tuple[str, ...]] = None) -> Node:
+        """
+        Add a node, or return the existing identical node
+        
+        Args:
+            class_type: ComfyUI node class
+            inputs: Input values; links are NodeOutput (or single-output Node) handles
+            title: Display title; the first title wins when nodes are merged
+            output_types: Output types for classes not in NODE_OUTPUT_TYPES
+            
+        Returns:
+            Node handle
+        """
+        serialised = {}
+        for name, value in inputs.items():
+            if isinstance(value, Node):
+                value = value[0]
+            serialised[name] = value.ref() if isinstance(value, NodeOutput) else value
+        
+        node_id = _node_id(class_type, serialised)
+        if node_id in self._nodes:
+            self.merged += 1
+        else:
+            self._nodes[node_id] = {
+                "inputs": serialised,
+                "class_type": class_type,
+                "_meta": {"title": title or class_type}
+            }
+        
+        return Node(node_id, class_type, output_types or NODE_OUTPUT_TYPES.get(class_type, ()))
+    
+    def to_prompt(self) -> Dict[str, Any]:
+        """Serialise to the workflow format expected by /prompt"""
+        return {node_id: {**node, "inputs": dict(node["inputs"])}
+                for node_id, node in self._nodes.items()}
+    
+    def __len__(self) -> int:
+        return len(self._nodes)
+    
+    # Typed helpers for the nodes our workflows use
+    
+    def checkpoint(self, ckpt_name: str) -> Node:
+        return self.add("CheckpointLoaderSimple", {"ckpt_name": ckpt_name}, "Load Checkpoint")
+    
+    def text_encode(self, clip: NodeOutput, text: str,
+                    title: str = "CLIP Text Encode") -> NodeOutput:
+        return self.add("CLIPTextEncode", {"text": text, "clip": clip}, title)["CONDITIONING"]
+    
+    def concat(self, to: NodeOutput, source: NodeOutput, title: str = "Conditioning Concat") -> NodeOutput:
+        """ConditioningConcat appends the tokens of `source` after those of `to`"""
+        return self.add("ConditioningConcat", {"conditioning_to": to, "conditioning_from": source},
+                        title)["CONDITIONING"]
+    
+    def empty_latent(self, width: int, height: int, batch_size: int = 1) -> NodeOutput:
+        return self.add("EmptyLatentImage",
+                        {"width": width, "height": height, "batch_size": batch_size},
+                        "Empty Latent Image")["LATENT"]
+    
+    def ksampler(self, model: NodeOutput, positive: NodeOutput, negative: NodeOutput,
+                 latent: NodeOutput, seed: int, steps: int, cfg: float, sampler_name: str,
+                 scheduler: str, denoise: float = 1) -> NodeOutput:
+        return self.add("KSampler", {
+            "seed": seed,
+            "steps": steps,
+            "cfg": cfg,
+            "sampler_name": sampler_name,
+            "scheduler": scheduler,
+            "denoise": denoise,
+            "model": model,
+            "positive": positive,
+            "negative": negative,
+            "latent_image": latent
+        }, "KSampler")["LATENT"]
+    
+    def vae_decode(self, samples: NodeOutput, vae: NodeOutput) -> NodeOutput:
+        return self.add("VAEDecode", {"samples": samples, "vae": vae}, "VAE Decode")["IMAGE"]
+    
+    def save_image(self, images: NodeOutput, filename_prefix: str = "ComfyUI") -> Node:
+        return self.add("SaveImage", {"filename_prefix": filename_prefix, "images": images},
+                        "Save Image")
+
+
+def _node_id(class_type: str, inputs: Dict[str, Any]) -> str:
+    """Content-derived node id; linked inputs contribute their own ids"""
+    import hashlib  # loads OpenSSL; deferred to keep generator startup fast
+    
+    canonical = json.dumps([class_type, inputs], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:12]
+
+
+def random_seed() -> int:
+    """Seed used when a request asks for a random one (-1)"""
+    return int(time.time() * 1000) % 2**32
+
+
+def add_text_to_image(
+    graph: WorkflowGraph,
     prompt: str,
     negative_prompt: str = "",
     width: int = 512,
@@ -28,138 +247,253 @@ def create_basic_workflow(
     sampler_name: str = "euler",
     scheduler: str = "normal",
     seed: int = -1,
-    batch_size: int = 1
-) -> Dict[str, Any]:
+    batch_size: int = 1,
+    ckpt_name: str = DEFAULT_CHECKPOINT,
+    prompt_prefix: str = "",
+    prompt_suffix: str = "",
+    negative_suffix: str = "",
+    filename_prefix: str = SERVER_OUTPUT_PREFIX
+) -> Node:
     """
-    Create a basic text-to-image workflow for ComfyUI
+    Add a text-to-image pipeline to a graph
     
-    This creates a simple workflow with:
+    This adds:
     - CLIP Text Encode for positive/negative prompts
     - KSampler for generation
     - VAE Decode for final image
     - Save Image node
+    
+    Shared style blocks (prompt_prefix, prompt_suffix, negative_suffix) are
+    encoded in their own CLIPTextEncode nodes and joined to the per-panel
+    conditioning with ConditioningConcat. Their inputs are identical for every
+    panel of a batch, so ComfyUI serves them from its node cache (or, within
+    one graph, they are merged) and only the panel-specific text is encoded.
+    
+    Returns:
+        The SaveImage node; its id is the key of this pipeline's images in
+        the prompt's history outputs
     """
     
     # Generate random seed if not provided
     if seed == -1:
-        seed = int(time.time() * 1000) % 2**32
-    
-    # Map common sampler names to ComfyUI format
-    sampler_mapping = {
-        "dpm++ 2m karras": "dpmpp_2m",
-        "dpm++ 2m": "dpmpp_2m",
-        "euler a": "euler_ancestral",
-        "euler": "euler",
-    }
-    sampler_name = sampler_mapping.get(sampler_name.lower(), "euler")
-    
-    workflow = {
-        "3": {
-            "inputs": {
-                "seed": seed,
-                "steps": steps,
-                "cfg": cfg_scale,
-                "sampler_name": sampler_name,
-                "scheduler": scheduler,
-                "denoise": 1,
-                "model": ["4", 0],
-                "positive": ["6", 0],
-                "negative": ["7", 0],
-                "latent_image": ["5", 0]
-            },
-            "class_type": "KSampler",
-            "_meta": {"title": "KSampler"}
-        },
-        "4": {
-            "inputs": {
-                "ckpt_name": "deliberate_v3.safetensors"
-            },
-            "class_type": "CheckpointLoaderSimple",
-            "_meta": {"title": "Load Checkpoint"}
-        },
-        "5": {
-            "inputs": {
-                "width": width,
-                "height": height,
-                "batch_size": batch_size
-            },
-            "class_type": "EmptyLatentImage",
-            "_meta": {"title": "Empty Latent Image"}
-        },
-        "6": {
-            "inputs": {
-                "text": prompt,
-                "clip": ["4", 1]
-            },
-            "class_type": "CLIPTextEncode",
-            "_meta": {"title": "CLIP Text Encode (Prompt)"}
-        },
-        "7": {
-            "inputs": {
-                "text": negative_prompt,
-                "clip": ["4", 1]
-            },
-            "class_type": "CLIPTextEncode",
-            "_meta": {"title": "CLIP Text Encode (Negative)"}
-        },
-        "8": {
-            "inputs": {
-                "samples": ["3", 0],
-                "vae": ["4", 2]
-            },
-            "class_type": "VAEDecode",
-            "_meta": {"title": "VAE Decode"}
-        },
-        "9": {
-            "inputs": {
-                "filename_prefix": "ComfyUI",
-                "images": ["8", 0]
-            },
-            "class_type": "SaveImage",
-            "_meta": {"title": "Save Image"}
-        }
-    }
+        seed = random_seed()
+    
+    # Map A1111-style sampler names to ComfyUI format; anything else is passed
+    # through and checked against the server schema when queued
+    sampler_name = SAMPLER_ALIASES.get(sampler_name.lower(), sampler_name)
+    
+    checkpoint = graph.checkpoint(ckpt_name)
+    clip = checkpoint["CLIP"]
     
-    return workflow
+    positive = graph.text_encode(clip, prompt, "CLIP Text Encode (Prompt)")
+    negative = graph.text_encode(clip, negative_prompt, "CLIP Text Encode (Negative)")
+    
+    if prompt_prefix:
+        prefix = graph.text_encode(clip, prompt_prefix, "CLIP Text Encode (Style Prefix)")
+        positive = graph.concat(prefix, positive, "Concat Style Prefix")
+    if prompt_suffix:
+        suffix = graph.text_encode(clip, prompt_suffix, "CLIP Text Encode (Style Suffix)")
+        positive = graph.concat(positive, suffix, "Concat Style Suffix")
+    if negative_suffix:
+        shared = graph.text_encode(clip, negative_suffix, "CLIP Text Encode (Shared Negative)")
+        negative = graph.concat(negative, shared, "Concat Shared Negative")
+    
+    latent = graph.ksampler(checkpoint["MODEL"], positive, negative,
+                            graph.empty_latent(width, height, batch_size),
+                            seed=seed, steps=steps, cfg=cfg_scale,
+                            sampler_name=sampler_name, scheduler=scheduler)
+    images = graph.vae_decode(latent, checkpoint["VAE"])
+    return graph.save_image(images, filename_prefix)
 
 
-def queue_prompt(workflow: Dict[str, Any], client_id: Optional[str] = None) -> Dict[str, Any]:
+def create_basic_workflow(
+    prompt: str,
+    negative_prompt: str = "",
+    width: int = 512,
+    height: int = 512,
+    steps: int = 20,
+    cfg_scale: float = 8.0,
+    sampler_name: str = "euler",
+    scheduler: str = "normal",
+    seed: int = -1,
+    batch_size: int = 1,
+    ckpt_name: str = DEFAULT_CHECKPOINT,
+    prompt_prefix: str = "",
+    prompt_suffix: str = "",
+    negative_suffix: str = ""
+) -> Dict[str, Any]:
+    """
+    Create a basic text-to-image workflow for ComfyUI
+    
+    See add_text_to_image() for the nodes it contains.
+    """
+    graph = WorkflowGraph()
+    add_text_to_image(
+        graph, prompt, negative_prompt, width=width, height=height, steps=steps,
+        cfg_scale=cfg_scale, sampler_name=sampler_name, scheduler=scheduler, seed=seed,
+        batch_size=batch_size, ckpt_name=ckpt_name, prompt_prefix=prompt_prefix,
+        prompt_suffix=prompt_suffix, negative_suffix=negative_suffix
+    )
+    return graph.to_prompt()
+
+
+def create_batch_workflow(requests: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Compose several text-to-image requests into one workflow
+    
+    Nodes shared between requests (checkpoint loader, style encodes, the
+    negative prompt) are merged, so they load and encode once per batch.
+    
+    Args:
+        requests: add_text_to_image() keyword arguments, one dict per request
+        
+    Returns:
+        (workflow, SaveImage node id of each request; identical requests share one)
+    """
+    graph = WorkflowGraph()
+    save_ids = [add_text_to_image(graph, **request).id for request in requests]
+    logger.debug(f"Batch workflow: {len(graph)} nodes, {graph.merged} merged")
+    return graph.to_prompt(), save_ids
+
+
+def queue_prompt(workflow: Dict[str, Any], client_id: Optional[str] = None,
+                 validate: bool = True, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
     """
     Queue a workflow for execution in ComfyUI
     
+    Submission is idempotent: the prompt carries an idempotency key (as its
+    prompt_id and in extra_data). If the POST fails in a way that may have
+    reached the server (timeout, dropped connection, gateway error), the
+    server's queue and history are checked for that key before re-posting,
+    and the existing prompt is re-attached instead of being queued twice.
+    
     Args:
         workflow: The workflow dictionary
         client_id: Optional client ID for websocket tracking
+        validate: Check the workflow against the server's node schema first
+        idempotency_key: Key identifying this job; a new one is generated if omitted
         
     Returns:
-        Response data including prompt_id
+        Response data including prompt_id ('reattached' is set if the prompt
+        was found on the server after a failed POST)
+        
+    Raises:
+        WorkflowValidationError: If validation finds unknown nodes, inputs or values
     """
+    import uuid
+    import urllib.error
+    
+    if validate:
+        from workflow_schema import validate_workflow
+        validate_workflow(workflow)
+    
     if client_id is None:
         client_id = str(uuid.uuid4())
+    if idempotency_key is None:
+        idempotency_key = str(uuid.uuid4())
     
     payload = {
         "prompt": workflow,
-        "client_id": client_id
+        "client_id": client_id,
+        "prompt_id": prompt_id_for(idempotency_key),
+        "extra_data": {"idempotency_key": idempotency_key}
     }
     
     data = json.dumps(payload).encode('utf-8')
+    checkpoint = workflow_checkpoint(workflow)
     
-    req = urllib.request.Request(
-        f"{COMFYUI_URL}/prompt",
-        data=data,
-        headers={'Content-Type': 'application/json'}
-    )
+    for attempt in range(SUBMIT_RETRIES + 1):
+        if attempt:
+            run_metrics.inc("submit_retries_total", checkpoint=checkpoint)
+            time.sleep(2 ** attempt)  # 2, 4, 8 seconds between retries
+            existing = find_submitted(idempotency_key)
+            if existing:
+                logger.info(f"🔗 Prompt {existing} was already queued, re-attaching")
+                run_metrics.inc("reattached_total", checkpoint=checkpoint)
+                return {"prompt_id": existing, "number": None, "node_errors": {},
+                        "reattached": True}
+        
+        try:
+            start = time.time()
+            with _urlopen("/prompt", data=data, timeout=30,
+                          headers={'Content-Type': 'application/json'}) as response:
+                result = json.loads(response.read().decode('utf-8'))
+            run_metrics.observe("submit_seconds", time.time() - start, checkpoint=checkpoint)
+            return result
+        except urllib.error.HTTPError as e:
+            # 4xx means the server rejected the workflow; only gateway errors
+            # (e.g. the SSH tunnel dropping the response) are worth retrying
+            if e.code not in RETRY_STATUS or attempt == SUBMIT_RETRIES:
+                logger.error(f"Failed to queue prompt: {e}")
+                raise
+            logger.warning(f"⚠️  Queueing failed ({e}), checking whether the server received it")
+        except OSError as e:
+            # URLError, timeouts and dropped connections are all OSErrors
+            if attempt == SUBMIT_RETRIES:
+                logger.error(f"Failed to queue prompt: {e}")
+                raise
+            logger.warning(f"⚠️  Queueing failed ({e}), checking whether the server received it")
+        except Exception as e:
+            logger.error(f"Unexpected error queueing prompt: {e}")
+            raise
+
+
+def workflow_checkpoint(workflow: Dict[str, Any]) -> Optional[str]:
+    """Checkpoint a workflow loads, or None if it has no checkpoint loader"""
+    for node in workflow.values():
+        if node.get("class_type") == "CheckpointLoaderSimple":
+            return node.get("inputs", {}).get("ckpt_name")
+    return None
+
+
+def prompt_id_for(idempotency_key: str) -> str:
+    """Deterministic prompt_id for an idempotency key"""
+    import uuid
+    
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"driftingme:{idempotency_key}"))
+
+
+def get_queue() -> Dict[str, Any]:
+    """Running and pending queue items from /queue"""
+    with _urlopen("/queue", timeout=10) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def find_submitted(idempotency_key: str) -> Optional[str]:
+    """
+    Look up a prompt submitted with an idempotency key
+    
+    Servers that honour the client's prompt_id are matched by id; older ones
+    that assign their own are matched by the key in the prompt's extra_data.
+    Queue items and history entries both store the prompt as
+    [number, prompt_id, workflow, extra_data, outputs_to_execute].
+    
+    Returns:
+        The prompt_id if the server has the prompt queued, running or finished,
+        None if it does not (or cannot be reached)
+    """
+    prompt_id = prompt_id_for(idempotency_key)
+    
+    def matches(item: list) -> bool:
+        extra_data = item[3] if len(item) > 3 and isinstance(item[3], dict) else {}
+        return item[1] == prompt_id or extra_data.get("idempotency_key") == idempotency_key
     
     try:
-        with urllib.request.urlopen(req, timeout=30) as response:
-            result = json.loads(response.read().decode('utf-8'))
-            return result
-    except urllib.error.URLError as e:
-        logger.error(f"Failed to queue prompt: {e}")
-        raise
-    except Exception as e:
-        logger.error(f"Unexpected error queueing prompt: {e}")
-        raise
+        queue = get_queue()
+        for item in queue.get("queue_running", []) + queue.get("queue_pending", []):
+            if matches(item):
+                return item[1]
+        
+        if prompt_id in get_history(prompt_id):
+            return prompt_id
+        
+        for entry_id, entry in get_recent_history(HISTORY_SCAN_ITEMS).items():
+            if matches(entry.get("prompt", [None, entry_id])):
+                return entry_id
+    except OSError as e:
+        logger.warning(f"Could not check for an earlier submission: {e}")
+    
+    return None
 
 
 def get_history(prompt_id: str) -> Dict[str, Any]:
@@ -172,16 +506,30 @@ def get_history(prompt_id: str) -> Dict[str, Any]:
     Returns:
         History data for the prompt
     """
-    req = urllib.request.Request(f"{COMFYUI_URL}/history/{prompt_id}")
+    import urllib.error
     
     try:
-        with urllib.request.urlopen(req, timeout=10) as response:
+        with _urlopen(f"/history/{prompt_id}", timeout=10) as response:
             return json.loads(response.read().decode('utf-8'))
     except urllib.error.URLError as e:
         logger.error(f"Failed to get history: {e}")
         raise
 
 
+def get_recent_history(max_items: int) -> Dict[str, Any]:
+    """History of the most recent prompts, keyed by prompt_id"""
+    with _urlopen(f"/history?max_items={max_items}", timeout=30) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def delete_history(prompt_ids: List[str]):
+    """Delete prompts from the server's history (their output files are kept)"""
+    data = json.dumps({"delete": prompt_ids}).encode('utf-8')
+    with _urlopen("/history", data=data, timeout=30,
+                  headers={'Content-Type': 'application/json'}):
+        pass
+
+
 def get_image(filename: str, subfolder: str = "", folder_type: str = "output") -> bytes:
     """
     Download an image from ComfyUI
@@ -194,31 +542,181 @@ def get_image(filename: str, subfolder: str = "", folder_type: str = "output") -
     Returns:
         Image data as bytes
     """
+    import urllib.error
+    from urllib.parse import urlencode
+    
     params = {
         "filename": filename,
         "subfolder": subfolder,
         "type": folder_type
     }
     
-    url = f"{COMFYUI_URL}/view?{urllib.parse.urlencode(params)}"
-    req = urllib.request.Request(url)
-    
     try:
-        with urllib.request.urlopen(req, timeout=30) as response:
-            return response.read()
+        start = time.time()
+        with _urlopen(f"/view?{urlencode(params)}", timeout=30) as response:
+            data = response.read()
+        run_metrics.observe("download_seconds", time.time() - start)
+        run_metrics.inc("downloaded_bytes_total", len(data))
+        return data
     except urllib.error.URLError as e:
         logger.error(f"Failed to download image: {e}")
         raise
 
 
-def wait_for_completion(prompt_id: str, timeout: int = 300, poll_interval: int = 2) -> Dict[str, Any]:
+class HistoryPoller:
+    """
+    Shared completion poller for all in-flight prompts
+    
+    Instead of one /history/<id> request per job per tick, a single thread
+    fetches the recent history once per tick and resolves every in-flight
+    prompt found in it. Prompts whose outputs have been retrieved are passed
+    to release() and deleted from the server's history on the next tick, so
+    the server's history (and its memory and response size) stays flat
+    during long batch runs.
+    """
+    
+    def __init__(self, interval: float = DEFAULT_POLL_INTERVAL, prune: bool = True):
+        """
+        Args:
+            interval: Seconds between ticks (a watcher may ask for a shorter one)
+            prune: Delete released prompts from the server history
+        """
+        self.interval = interval
+        self.prune = prune
+        self._watches: Dict[str, Dict[str, Any]] = {}
+        self._released: List[str] = []
+        self._wakeup = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self.stats = {"ticks": 0, "requests": 0, "completed": 0, "deleted": 0}
+    
+    def watch(self, prompt_id: str, interval: Optional[float] = None):
+        """
+        Start watching a prompt
+        
+        Returns:
+            concurrent.futures.Future resolving to the prompt's history entry
+        """
+        from concurrent.futures import Future
+        
+        with self._wakeup:
+            if prompt_id in self._watches:
+                return self._watches[prompt_id]["future"]
+            future = Future()
+            self._watches[prompt_id] = {"future": future, "interval": interval or self.interval,
+                                        "misses": 0}
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="history-poller",
+                                                daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+            return future
+    
+    def unwatch(self, prompt_id: str):
+        """Stop watching a prompt, e.g. after a timeout"""
+        with self._wakeup:
+            self._watches.pop(prompt_id, None)
+    
+    def release(self, prompt_id: str):
+        """Outputs of a prompt are retrieved; its history entry can be deleted"""
+        if not self.prune:
+            return
+        with self._wakeup:
+            self._released.append(prompt_id)
+    
+    def stop(self):
+        """Stop the poller thread after deleting released entries"""
+        with self._wakeup:
+            self._stopped = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+    
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._watches and not self._released and not self._stopped:
+                    self._wakeup.wait()
+                watches = dict(self._watches)
+                released, self._released = self._released, []
+                stopped = self._stopped
+            
+            if released:
+                self._delete(released)
+            if stopped:
+                return
+            if watches:
+                self._tick(watches)
+            
+            interval = min((w["interval"] for w in watches.values()), default=self.interval)
+            with self._wakeup:
+                self._wakeup.wait_for(lambda: self._stopped, timeout=interval)
+    
+    def _delete(self, prompt_ids: List[str]):
+        try:
+            delete_history(prompt_ids)
+            self.stats["requests"] += 1
+            self.stats["deleted"] += len(prompt_ids)
+        except OSError as e:
+            logger.warning(f"Could not prune server history: {e}")
+            with self._wakeup:
+                self._released.extend(prompt_ids)
+    
+    def _tick(self, watches: Dict[str, Dict[str, Any]]):
+        self.stats["ticks"] += 1
+        try:
+            history = get_recent_history(len(watches) + HISTORY_MARGIN)
+            self.stats["requests"] += 1
+        except OSError as e:
+            logger.warning(f"Error checking history: {e}")
+            return
+        
+        for prompt_id, watch in watches.items():
+            entry = history.get(prompt_id)
+            if entry is None:
+                watch["misses"] += 1
+                # Entries older than the recent window (e.g. on a server shared
+                # with other clients) are looked up individually now and then
+                if watch["misses"] % STALE_TICKS == 0:
+                    try:
+                        entry = get_history(prompt_id).get(prompt_id)
+                        self.stats["requests"] += 1
+                    except OSError as e:
+                        logger.warning(f"Error checking history: {e}")
+            
+            if entry is not None and "outputs" in entry:
+                with self._wakeup:
+                    self._watches.pop(prompt_id, None)
+                self.stats["completed"] += 1
+                watch["future"].set_result(entry)
+
+
+_poller: Optional[HistoryPoller] = None
+_poller_lock = threading.Lock()
+
+
+def get_poller() -> HistoryPoller:
+    """The process-wide HistoryPoller, created on first use"""
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            import atexit
+            _poller = HistoryPoller()
+            # Delete the history of prompts retrieved just before exit
+            atexit.register(_poller.stop)
+        return _poller
+
+
+def wait_for_completion(prompt_id: str, timeout: int = 300,
+                        poll_interval: Optional[float] = None) -> Dict[str, Any]:
     """
     Wait for a prompt to complete execution
     
     Args:
         prompt_id: The prompt ID to wait for
         timeout: Maximum time to wait in seconds
-        poll_interval: How often to check for completion
+        poll_interval: How often to check for completion (default: the
+            shared poller's interval)
         
     Returns:
         Final history data when complete
@@ -226,26 +724,14 @@ def wait_for_completion(prompt_id: str, timeout: int = 300, poll_interval: int =
     Raises:
         TimeoutError: If execution doesn't complete in time
     """
-    start_time = time.time()
-    
-    while True:
-        if time.time() - start_time > timeout:
-            raise TimeoutError(f"Prompt {prompt_id} did not complete within {timeout}s")
-        
-        try:
-            history = get_history(prompt_id)
-            
-            if prompt_id in history:
-                # Check if execution is complete
-                prompt_history = history[prompt_id]
-                if "outputs" in prompt_history:
-                    return prompt_history
-            
-            time.sleep(poll_interval)
-            
-        except Exception as e:
-            logger.warning(f"Error checking history: {e}")
-            time.sleep(poll_interval)
+    poller = get_poller()
+    future = poller.watch(prompt_id, poll_interval)
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        poller.unwatch(prompt_id)
+        run_metrics.inc("timeouts_total")
+        raise TimeoutError(f"Prompt {prompt_id} did not complete within {timeout}s")
 
 
 def generate_image(
@@ -259,7 +745,12 @@ def generate_image(
     scheduler: str = "normal",
     seed: int = -1,
     batch_size: int = 1,
-    timeout: int = 300
+    timeout: int = 300,
+    ckpt_name: str = DEFAULT_CHECKPOINT,
+    prompt_prefix: str = "",
+    prompt_suffix: str = "",
+    negative_suffix: str = "",
+    idempotency_key: Optional[str] = None
 ) -> List[bytes]:
     """
     High-level function to generate images using ComfyUI
@@ -276,6 +767,12 @@ def generate_image(
         seed: Random seed (-1 for random)
         batch_size: Number of images to generate
         timeout: Maximum time to wait for generation
+        ckpt_name: Checkpoint file to load
+        prompt_prefix: Shared style text encoded before the prompt
+        prompt_suffix: Shared style text encoded after the prompt
+        negative_suffix: Shared negative text encoded after the negative prompt
+        idempotency_key: Key that makes a retried submission re-attach instead
+            of queueing twice (see queue_prompt)
         
     Returns:
         List of image data as bytes
@@ -291,38 +788,134 @@ def generate_image(
         sampler_name=sampler_name,
         scheduler=scheduler,
         seed=seed,
-        batch_size=batch_size
+        batch_size=batch_size,
+        ckpt_name=ckpt_name,
+        prompt_prefix=prompt_prefix,
+        prompt_suffix=prompt_suffix,
+        negative_suffix=negative_suffix
     )
     
-    # Queue the prompt
-    result = queue_prompt(workflow)
-    prompt_id = result.get('prompt_id')
-    
-    if not prompt_id:
-        raise RuntimeError("Failed to get prompt_id from queue response")
+    images = run_workflow(workflow, timeout=timeout, idempotency_key=idempotency_key)
+    return [image.data for node_images in images.values() for image in node_images]
+
+
+class GeneratedImage(NamedTuple):
+    """An image downloaded from ComfyUI, with its location on the server"""
+    data: bytes
+    filename: str
+    subfolder: str
+    type: str
+    prompt_id: str
+
+
+def run_workflow(workflow: Dict[str, Any], timeout: int = 300,
+                 idempotency_key: Optional[str] = None) -> Dict[str, List[GeneratedImage]]:
+    """
+    Queue a workflow, wait for it and download its images
     
-    logger.info(f"Queued prompt with ID: {prompt_id}")
+    Once the images are downloaded the prompt is released, so the shared
+    poller deletes its server history entry.
     
-    # Wait for completion
-    history = wait_for_completion(prompt_id, timeout=timeout)
+    Args:
+        workflow: The workflow dictionary
+        timeout: Maximum time to wait for completion
+        idempotency_key: See queue_prompt
+        
+    Returns:
+        Downloaded images per output node id
+    """
+    stream = _event_stream()
     
-    # Extract image information
-    images = []
-    outputs = history.get('outputs', {})
+    with run_metrics.labelled(checkpoint=workflow_checkpoint(workflow)):
+        with run_trace.span("submit"):
+            result = queue_prompt(workflow, client_id=stream.client_id if stream else None,
+                                  idempotency_key=idempotency_key)
+        prompt_id = result.get('prompt_id')
+        
+        if not prompt_id:
+            raise RuntimeError("Failed to get prompt_id from queue response")
+        
+        logger.info(f"Queued prompt with ID: {prompt_id}")
+        
+        queued = time.time()
+        try:
+            with run_trace.span("wait", prompt_id=prompt_id):
+                history = wait_for_completion(prompt_id, timeout=timeout)
+            _record_execution(workflow, history, time.time() - queued)
+            run_trace.record_prompt(prompt_id, workflow, history, queued)
+        finally:
+            if stream is not None:
+                from comfyui_events import release
+                release(stream, prompt_id)
+        
+        images = {}
+        with run_trace.span("download"):
+            for node_id, node_output in history.get('outputs', {}).items():
+                images[node_id] = [
+                    GeneratedImage(
+                        data=get_image(info['filename'], info.get('subfolder', ''), info.get('type', 'output')),
+                        filename=info['filename'],
+                        subfolder=info.get('subfolder', ''),
+                        type=info.get('type', 'output'),
+                        prompt_id=prompt_id
+                    )
+                    for info in node_output.get('images', [])
+                ]
     
-    for node_id, node_output in outputs.items():
-        if 'images' in node_output:
-            for image_info in node_output['images']:
-                filename = image_info['filename']
-                subfolder = image_info.get('subfolder', '')
-                
-                # Download the image
-                image_data = get_image(filename, subfolder)
-                images.append(image_data)
+    # The images are retrieved; the server no longer needs the history entry
+    get_poller().release(prompt_id)
     
     return images
 
 
+def _event_stream():
+    """The shared websocket stream while tracing or recording (both want per-node events), else None"""
+    if run_trace.get_tracer() is None and get_recorder() is None:
+        return None
+    from comfyui_events import shared_stream
+    return shared_stream()
+
+
+def _record_execution(workflow: Dict[str, Any], history: Dict[str, Any], waited: float):
+    """
+    Record a finished prompt's execution time, queue wait and cache hits
+    
+    Execution time comes from the server's own timestamps in the history
+    status messages; the queue wait is what's left of the client's wait, so
+    it includes the poll interval but is free of clock skew between hosts.
+    """
+    status = history.get('status', {})
+    started = finished = None
+    cached = 0
+    for event, data in status.get('messages', []):
+        if event == "execution_start":
+            started = data.get('timestamp')
+        elif event in ("execution_success", "execution_error", "execution_interrupted"):
+            finished = data.get('timestamp')
+        elif event == "execution_cached":
+            cached += len(data.get('nodes', []))
+    
+    run_metrics.inc("prompts_total", status=status.get('status_str', "unknown"))
+    run_metrics.inc("nodes_total", len(workflow))
+    run_metrics.inc("cached_nodes_total", cached)
+    if started is not None and finished is not None:
+        execution = max(0.0, (finished - started) / 1000)
+        run_metrics.observe("execution_seconds", execution)
+        run_metrics.observe("queue_wait_seconds", max(0.0, waited - execution))
+
+
+def get_system_stats() -> Dict[str, Any]:
+    """Server, Python and device information from /system_stats"""
+    with _urlopen("/system_stats", timeout=10) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def get_object_info() -> Dict[str, Any]:
+    """Input/output schema of every node class the server knows"""
+    with _urlopen("/object_info", timeout=60) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
 def check_server_status() -> bool:
     """
     Check if ComfyUI server is accessible
@@ -331,8 +924,7 @@ def check_server_status() -> bool:
         True if server is accessible, False otherwise
     """
     try:
-        req = urllib.request.Request(f"{COMFYUI_URL}/system_stats")
-        with urllib.request.urlopen(req, timeout=5) as response:
+        with _urlopen("/system_stats", timeout=5) as response:
             return response.status == 200
     except:
         return False
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+ComfyUI Event Stream
+Per-node execution events from the ComfyUI websocket (/ws).
+
+/history only reports when a prompt started and finished. The websocket
+also says which node is executing, which nodes were served from cache and
+how far the sampler has got, so it is the only source of per-node timings.
+ComfyUI sends these events to the client_id a prompt was queued with:
+
+    stream = EventStream()
+    trace = stream.trace(queue_prompt(workflow, client_id=stream.client_id)["prompt_id"])
+    trace.wait(timeout=300)
+    trace.node_timings(workflow)
+
+The websocket client is a minimal RFC 6455 implementation on the standard
+library (text frames, ping/pong, close); binary preview frames are skipped.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from comfyui_api import get_server_url
+from session_recorder import get_recorder
+
+logger = logging.getLogger(__name__)
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# Events that end a prompt
+FINAL_EVENTS = ("execution_success", "execution_error", "execution_interrupted")
+# Events can trail the history poll that saw a prompt finish
+TRAILING_EVENT_SECONDS = 2.0
+
+
+def ws_accept_key(key: str) -> str:
+    """Sec-WebSocket-Accept value for a Sec-WebSocket-Key"""
+    import base64
+    import hashlib
+
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+
+
+def encode_frame(opcode: int, payload: bytes, mask: bool = True) -> bytes:
+    """One final frame; clients must mask, servers must not"""
+    import struct
+
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    if len(payload) < 126:
+        header.append(mask_bit | len(payload))
+    elif len(payload) < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack(">H", len(payload))
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack(">Q", len(payload))
+    if not mask:
+        return bytes(header) + payload
+    key = os.urandom(4)
+    return bytes(header) + key + _xor(payload, key)
+
+
+def read_frame(stream) -> Tuple[bool, int, bytes]:
+    """
+    Read one frame from a binary file object
+
+    Returns:
+        (final, opcode, unmasked payload)
+
+    Raises:
+        ConnectionError: If the connection closes mid-frame
+    """
+    import struct
+
+    def read_exact(count: int) -> bytes:
+        data = stream.read(count)
+        if len(data) < count:
+            raise ConnectionError("WebSocket connection closed")
+        return data
+
+    first, second = read_exact(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", read_exact(2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", read_exact(8))[0]
+    key = read_exact(4) if second & 0x80 else None
+    payload = read_exact(length) if length else b""
+    if key:
+        payload = _xor(payload, key)
+    return bool(first & 0x80), first & 0x0F, payload
+
+
+def _xor(payload: bytes, key: bytes) -> bytes:
+    # int.from_bytes keeps masking fast for large frames without numpy
+    if not payload:
+        return payload
+    repeated = (key * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(len(payload), "big")
+
+
+class WebSocket:
+    """Blocking websocket client connection"""
+
+    def __init__(self, url: str, timeout: float = 10):
+        """
+        Args:
+            url: ws:// or wss:// URL
+            timeout: Connect and handshake timeout in seconds
+        """
+        import base64
+        import socket
+        from urllib.parse import urlsplit
+
+        parts = urlsplit(url)
+        secure = parts.scheme == "wss"
+        port = parts.port or (443 if secure else 80)
+        path = parts.path or "/"
+        if parts.query:
+            path += f"?{parts.query}"
+
+        self._sock = socket.create_connection((parts.hostname, port), timeout=timeout)
+        if secure:
+            import ssl
+            self._sock = ssl.create_default_context().wrap_socket(self._sock, server_hostname=parts.hostname)
+        self._reader = self._sock.makefile("rb")
+        self._send_lock = threading.Lock()
+
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        self._sock.sendall((f"GET {path} HTTP/1.1\r\nHost: {parts.hostname}:{port}\r\n"
+                            f"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode("ascii"))
+        status = self._reader.readline().decode("latin-1")
+        headers = {}
+        while True:
+            line = self._reader.readline().decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if " 101 " not in status or headers.get("sec-websocket-accept") != ws_accept_key(key):
+            self.close()
+            raise ConnectionError(f"WebSocket handshake failed: {status.strip()}")
+        # Event streams idle for minutes between prompts
+        self._sock.settimeout(None)
+
+    def recv(self) -> Tuple[int, bytes]:
+        """
+        Next data message, answering pings on the way
+
+        Returns:
+            (OP_TEXT or OP_BINARY, payload)
+
+        Raises:
+            ConnectionError: When the server closes the connection
+        """
+        message_opcode, parts = None, []
+        while True:
+            final, opcode, payload = read_frame(self._reader)
+            if opcode == OP_PING:
+                self.send(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                raise ConnectionError("WebSocket closed by server")
+            if opcode != OP_CONTINUATION:
+                message_opcode, parts = opcode, []
+            parts.append(payload)
+            if final:
+                return message_opcode, b"".join(parts)
+
+    def send(self, opcode: int, payload: bytes):
+        with self._send_lock:
+            self._sock.sendall(encode_frame(opcode, payload))
+
+    def close(self):
+        import socket
+
+        try:
+            self.send(OP_CLOSE, b"")
+        except OSError:
+            pass
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._reader.close()
+        self._sock.close()
+
+
+class PromptTrace:
+    """Timestamped websocket events of one prompt, and the node timings derived from them"""
+
+    def __init__(self, prompt_id: str):
+        self.prompt_id = prompt_id
+        self.events: List[Tuple[float, str, Dict[str, Any]]] = []
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.cached: List[str] = []
+        # node id -> {"start", "end", "steps", "max_steps", "progress": [timestamps]}
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self._running: Optional[str] = None
+        self._done = threading.Event()
+
+    def record(self, timestamp: float, event: str, data: Dict[str, Any]):
+        """Add one event (timestamps are client receive times from time.time())"""
+        self.events.append((timestamp, event, data))
+        if event == "execution_start":
+            self.started = timestamp
+        elif event == "execution_cached":
+            self.cached.extend(str(node) for node in data.get("nodes", []))
+        elif event == "executing":
+            self._close_running(timestamp)
+            node = data.get("node")
+            if node is None:  # servers without execution_success end here
+                self._finish(timestamp)
+            else:
+                self._running = str(node)
+                self.nodes.setdefault(self._running, {"start": timestamp, "end": None, "steps": 0,
+                                                      "max_steps": 0, "progress": []})
+        elif event == "progress":
+            node = self.nodes.get(str(data.get("node", self._running)))
+            if node is not None:
+                node["steps"] = data.get("value", node["steps"])
+                node["max_steps"] = data.get("max", node["max_steps"])
+                node["progress"].append(timestamp)
+        elif event in FINAL_EVENTS:
+            self._close_running(timestamp)
+            if event != "execution_success":
+                self.error = {"event": event, **data}
+            self._finish(timestamp)
+
+    def _close_running(self, timestamp: float):
+        if self._running is not None:
+            self.nodes[self._running]["end"] = timestamp
+            self._running = None
+
+    def _finish(self, timestamp: float):
+        if self.finished is None:
+            self.finished = timestamp
+        self._done.set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the prompt to finish; False on timeout"""
+        return self._done.wait(timeout)
+
+    @property
+    def seconds(self) -> Optional[float]:
+        """Execution time from execution_start to the final event"""
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def node_timings(self, workflow: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Per-node timings in execution order, cached nodes last
+
+        Args:
+            workflow: The submitted workflow, to add each node's class_type
+
+        Returns:
+            Dicts with 'node', 'class_type', 'seconds', 'cached', 'steps' and
+            'step_seconds' (mean time between sampler progress events, which
+            excludes the sampler's setup)
+        """
+        def class_type(node: str) -> Optional[str]:
+            return (workflow or {}).get(node, {}).get("class_type")
+
+        timings = []
+        for node, info in self.nodes.items():
+            progress = info["progress"]
+            step_seconds = (progress[-1] - progress[0]) / (len(progress) - 1) if len(progress) > 1 else None
+            seconds = info["end"] - info["start"] if info["end"] is not None else None
+            timings.append({"node": node, "class_type": class_type(node), "start": info["start"],
+                            "seconds": seconds, "cached": False, "steps": info["steps"],
+                            "step_seconds": step_seconds})
+        for node in self.cached:
+            timings.append({"node": node, "class_type": class_type(node), "start": None,
+                            "seconds": 0.0, "cached": True, "steps": 0, "step_seconds": None})
+        return timings
+
+
+class EventStream:
+    """
+    Background reader of the ComfyUI websocket for one client_id
+
+    Events are grouped into a PromptTrace per prompt_id; listeners added with
+    add_listener() see every event, including queue 'status' broadcasts.
+    The connection is re-established with backoff if it drops.
+    """
+
+    def __init__(self, client_id: Optional[str] = None, connect_timeout: float = 10):
+        """
+        Args:
+            client_id: Client id to queue prompts with (default: a new uuid)
+            connect_timeout: Seconds to wait for the first connection
+
+        Raises:
+            ConnectionError: If the websocket cannot be opened
+        """
+        import uuid
+
+        self.client_id = client_id or str(uuid.uuid4())
+        base = get_server_url()
+        scheme = "wss" if base.startswith("https") else "ws"
+        self.url = f"{scheme}://{base.split('://', 1)[-1].rstrip('/')}/ws?clientId={self.client_id}"
+        self._traces: Dict[str, PromptTrace] = {}
+        self._listeners: List[Callable[[float, str, Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"events": 0, "reconnects": 0}
+
+        self._ws = WebSocket(self.url, timeout=connect_timeout)
+        self._thread = threading.Thread(target=self._run, name="comfyui-events", daemon=True)
+        self._thread.start()
+
+    def trace(self, prompt_id: str) -> PromptTrace:
+        """The trace of a prompt, created on first use (events may arrive before the POST returns)"""
+        with self._lock:
+            if prompt_id not in self._traces:
+                self._traces[prompt_id] = PromptTrace(prompt_id)
+            return self._traces[prompt_id]
+
+    def forget(self, prompt_id: str) -> Optional[PromptTrace]:
+        """Stop keeping a prompt's trace; returns it"""
+        with self._lock:
+            return self._traces.pop(prompt_id, None)
+
+    def add_listener(self, callback: Callable[[float, str, Dict[str, Any]], None]):
+        """Call callback(timestamp, event, data) for every event, from the reader thread"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def _dispatch(self, message: Dict[str, Any]):
+        timestamp = time.time()
+        event, data = message.get("type"), message.get("data") or {}
+        self.stats["events"] += 1
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.event(timestamp, event, data)
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(timestamp, event, data)
+            except Exception as e:
+                logger.warning(f"Event listener failed: {e}")
+        prompt_id = data.get("prompt_id")
+        if prompt_id:
+            self.trace(prompt_id).record(timestamp, event, data)
+
+    def _run(self):
+        backoff = 1.0
+        while not self._closed:
+            try:
+                while True:
+                    opcode, payload = self._ws.recv()
+                    if opcode == OP_TEXT:
+                        self._dispatch(json.loads(payload.decode("utf-8")))
+                    backoff = 1.0
+            except (OSError, ValueError) as e:
+                if self._closed:
+                    return
+                logger.warning(f"⚠️  ComfyUI event stream dropped ({e}), reconnecting in {backoff:.0f}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+            try:
+                self._ws = WebSocket(self.url)
+                self.stats["reconnects"] += 1
+            except OSError:
+                continue
+
+    def close(self):
+        self._closed = True
+        self._ws.close()
+        self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+_shared: Optional[EventStream] = None
+_shared_failed = False
+_shared_lock = threading.Lock()
+
+
+def shared_stream() -> Optional[EventStream]:
+    """
+    Process-wide EventStream, opened on first use
+
+    Used by run_workflow while tracing or recording, which both want every
+    node's events. Returns None (after one warning) if the websocket cannot
+    be opened; callers then do without per-node events.
+    """
+    global _shared, _shared_failed
+    if _shared is None and not _shared_failed:
+        with _shared_lock:
+            if _shared is None and not _shared_failed:
+                try:
+                    _shared = EventStream()
+                except OSError as e:
+                    _shared_failed = True
+                    logger.warning(f"⚠️  No ComfyUI event stream ({e}); per-node timings are unavailable")
+    return _shared
+
+
+def release(stream: EventStream, prompt_id: str):
+    """Let a finished prompt's trailing events arrive, then stop tracking it"""
+    trace = stream.trace(prompt_id)
+    if trace.started is not None:
+        trace.wait(TRAILING_EVENT_SECONDS)
+    stream.forget(prompt_id)
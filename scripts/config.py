@@ -6,13 +6,16 @@ Environment configuration loader for DriftingMe scripts
 import os
 import re
 import logging
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, Mapping, NamedTuple
 from urllib.parse import urlparse
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
+LOG_FORMAT = '%(levelname)s: %(message)s'
+
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent
 OUTPUT_DIR = PROJECT_ROOT / "outputs"
@@ -21,7 +24,8 @@ MODEL_DIR = PROJECT_ROOT / "models"
 # Allowed environment variables for security
 ALLOWED_ENV_VARS = {
     'A1111_URL', 'COMFYUI_URL', 'REMOTE_HOST', 
-    'REMOTE_PROJECT_DIR', 'LOG_LEVEL'
+    'REMOTE_PROJECT_DIR', 'LOG_LEVEL', 'CLIP_TOKENIZER', 'COMFYUI_RECORD',
+    'METRICS_DIR', 'TRACE_DIR', 'OUTPUT_SYNC_BATCH'
 }
 
 # Default configuration
@@ -29,7 +33,8 @@ DEFAULTS = {
     'A1111_URL': 'http://localhost:7860',
     'COMFYUI_URL': 'http://localhost:8188',
     'REMOTE_HOST': 'user@remote-server.com',
-    'REMOTE_PROJECT_DIR': '~/DriftingMe'
+    'REMOTE_PROJECT_DIR': '~/DriftingMe',
+    'CLIP_TOKENIZER': 'openai/clip-vit-large-patch14'
 }
 
 def validate_url(url: str) -> bool:
@@ -56,6 +61,9 @@ def validate_env_value(key: str, value: str) -> str:
         # Validate SSH host format (user@host or just host)
         if not re.match(r'^([\w\.-]+@)?[\w\.-]+$', value):
             raise ValueError(f"Invalid host format for {key}: {value}")
+    elif key == 'OUTPUT_SYNC_BATCH':
+        if not value.isdigit():
+            raise ValueError(f"{key} must be a whole number of images: {value}")
     
     # Prevent command injection
     if any(char in value for char in ['`', '$', ';', '&', '\n', '\r']):
@@ -107,13 +115,75 @@ def load_env():
         logger.critical(f"Failed to load .env: {e}")
         raise
 
+class Settings(NamedTuple):
+    """Immutable snapshot of the environment after .env has been applied"""
+    values: Mapping[str, str]
+    project_root: Path = PROJECT_ROOT
+    output_dir: Path = OUTPUT_DIR
+    model_dir: Path = MODEL_DIR
+
+    def get(self, key: str, default=None) -> str:
+        """Get a value, falling back to the caller's default and then DEFAULTS"""
+        return self.values.get(key, default or DEFAULTS.get(key))
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """
+    Load and validate configuration on first use
+    
+    The result is cached for the lifetime of the process, so the .env file
+    is read and validated at most once and never at import time.
+    """
+    load_env()
+    
+    try:
+        validate_configuration()
+    except ValueError as e:
+        logger.error(f"Configuration validation failed: {e}")
+        # Don't raise - allow scripts to run with defaults
+    
+    values = {key: os.environ[key] for key in ALLOWED_ENV_VARS if key in os.environ}
+    return Settings(values=MappingProxyType(values))
+
+# Values set by CLI flags, see override_config()
+_overrides: Dict[str, str] = {}
+
+def override_config(key: str, value: str):
+    """
+    Set a configuration value for this process, over .env and the environment
+    
+    For CLI flags such as --api-url; the value is validated like a .env entry.
+    
+    Raises:
+        ValueError: If the key is not configurable or the value is invalid
+    """
+    if key not in ALLOWED_ENV_VARS:
+        raise ValueError(f"Unknown configuration key: {key}")
+    _overrides[key] = validate_env_value(key, value)
+
 def get_config(key: str, default=None) -> str:
     """Get configuration value with fallback to defaults"""
-    return os.environ.get(key, default or DEFAULTS.get(key))
+    if key in _overrides:
+        return _overrides[key]
+    if key not in ALLOWED_ENV_VARS:
+        return os.environ.get(key, default or DEFAULTS.get(key))
+    return get_settings().get(key, default)
+
+def configure_logging(level: str = None):
+    """Configure root logging for a CLI entry point (call from main, not at import)"""
+    level = level or os.environ.get('LOG_LEVEL', 'INFO')
+    logging.basicConfig(level=getattr(logging, level.upper(), logging.INFO), format=LOG_FORMAT)
+
+@lru_cache(maxsize=None)
+def _ensure_output_dir() -> Path:
+    """Create the output directory once per process"""
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    return OUTPUT_DIR
 
 def get_output_path(filename: str) -> Path:
     """Get validated output path, preventing path traversal"""
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    _ensure_output_dir()
     filepath = OUTPUT_DIR / filename
     
     # Prevent path traversal attacks
@@ -130,7 +200,7 @@ def validate_configuration():
     
     # Validate URLs
     for url_var in ['COMFYUI_URL']:
-        url = get_config(url_var)
+        url = os.environ.get(url_var, DEFAULTS.get(url_var))
         if not validate_url(url):
             errors.append(f"{url_var} has invalid URL: {url}")
     
@@ -143,13 +213,3 @@ def validate_configuration():
     
     if errors:
         raise ValueError(f"Configuration errors:\n" + "\n".join(errors))
-
-# Auto-load when module is imported
-load_env()
-
-# Validate configuration
-try:
-    validate_configuration()
-except ValueError as e:
-    logger.error(f"Configuration validation failed: {e}")
-    # Don't raise - allow scripts to run with defaults
\ No newline at end of file
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Contact Sheets
+Tiles outputs into labelled grids for picking variations and comparing seeds.
+
+Two layouts:
+
+  - sheet: every selected image in order, labelled with scene key, seed and cfg
+  - grid:  one row per scene key, one column per seed (or cfg), so the same
+           seed can be compared across prompts at a glance
+
+Images are decoded and downscaled in a process pool (existing thumb
+derivatives are used when they are large enough) and pasted row by row;
+large selections are split into several pages, so memory stays bounded by
+one page and a few rows of cells no matter how big the sweep is.
+"""
+
+import os
+import sys
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from config import configure_logging, get_output_path, OUTPUT_DIR
+from output_store import get_store
+
+logger = logging.getLogger(__name__)
+
+SHEETS_DIR = "contact_sheets"
+DEFAULT_CELL = 256
+DEFAULT_COLUMNS = 8
+DEFAULT_ROWS = 8
+LABEL_HEIGHT = 14
+HEADER_WIDTH = 160
+PADDING = 4
+BACKGROUND = (24, 24, 24)
+LABEL_COLOUR = (230, 230, 230)
+
+
+class Item(NamedTuple):
+    """One image to place on a sheet"""
+    path: str           # source, relative to outputs/
+    label: str
+    scene: str = ""
+    seed: Optional[int] = None
+    cfg: Optional[float] = None
+    preview: Optional[str] = None   # smaller copy to decode instead, if any
+
+
+def load_cell(path: str, cell: int) -> Tuple[str, Tuple[int, int], bytes]:
+    """
+    Decode an image and shrink it to fit a cell (runs in a worker process)
+
+    Returns:
+        (mode, size, raw pixels), small enough to send back cheaply
+    """
+    from PIL import Image
+
+    with Image.open(get_output_path(path)) as image:
+        image.draft("RGB", (cell, cell))  # JPEG previews decode at reduced scale
+        image.thumbnail((cell, cell), Image.BILINEAR, reducing_gap=2.0)
+        image = image.convert("RGB")
+        return image.mode, image.size, image.tobytes()
+
+
+def _load_cell_safely(path: str, cell: int):
+    try:
+        return load_cell(path, cell)
+    except Exception as e:
+        logger.warning(f"⚠️  Could not read {path}: {e}")
+        return None
+
+
+def select_items(scene: Optional[str] = None, prompt_set: Optional[str] = None,
+                 seed: Optional[int] = None, files: Optional[List[str]] = None,
+                 cell: int = DEFAULT_CELL) -> List[Item]:
+    """
+    Items from the manifest (filtered by scene/set/seed) or from explicit files
+
+    Args:
+        files: Paths relative to outputs/; used instead of the manifest
+        cell: Cell size, to decide whether a thumb derivative is big enough
+    """
+    store = get_store()
+    previews = {}
+    for row in store.get_derivatives():
+        if row["name"] == "thumb":
+            previews[row["source"]] = row["path"]
+    # thumbs are 320px; only use them when they are not upscaled
+    use_previews = cell <= 320
+
+    if files is not None:
+        return [Item(path, Path(path).stem, preview=previews.get(path) if use_previews else None)
+                for path in files]
+
+    filters = {name: value for name, value in
+               (("scene", scene), ("prompt_set", prompt_set), ("seed", seed)) if value is not None}
+    items = []
+    for row in reversed(store.query(**filters)):  # oldest first, in render order
+        cfg = row["params"].get("cfg_scale")
+        label = f"{row['scene']}  s{row['seed']}" + (f"  cfg {cfg:g}" if cfg is not None else "")
+        items.append(Item(row["path"], label, row["scene"] or "", row["seed"], cfg,
+                          previews.get(row["path"]) if use_previews else None))
+    return items
+
+
+def _cells(items: List[Optional[Item]], cell: int, workers: int, pool) -> Iterator[Optional[Any]]:
+    """Decoded cells in order, at most a few rows ahead of the consumer"""
+    paths = [(item.preview or item.path) if item else None for item in items]
+    window = max(workers * 4, 16)
+    pending = []
+    index = 0
+    while index < len(paths) or pending:
+        while index < len(paths) and len(pending) < window:
+            path = paths[index]
+            pending.append(pool.submit(_load_cell_safely, path, cell) if path else None)
+            index += 1
+        future = pending.pop(0)
+        yield future.result() if future else None
+
+
+def _font():
+    from PIL import ImageFont
+
+    return ImageFont.load_default()
+
+
+def _fit(draw, text: str, width: int, font) -> str:
+    """Truncate text with an ellipsis to fit a width in pixels"""
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text + "…"
+
+
+def render_pages(items: List[Optional[Item]], columns: int, rows: int, cell: int,
+                 pool, workers: int, row_headers: Optional[List[str]] = None,
+                 column_headers: Optional[List[str]] = None):
+    """
+    Yield pages as PIL images, filling each one row by row
+
+    Args:
+        items: Cells in row-major order; None leaves a cell empty
+        row_headers: Label per grid row (grid layout), or None
+        column_headers: Label per column (grid layout), or None
+    """
+    from PIL import Image, ImageDraw
+
+    font = _font()
+    pitch_x = cell + PADDING
+    pitch_y = cell + LABEL_HEIGHT + PADDING
+    left = HEADER_WIDTH if row_headers else PADDING
+    top = LABEL_HEIGHT + PADDING if column_headers else PADDING
+    per_page = columns * rows
+    cells = _cells(items, cell, workers, pool)
+
+    for page_start in range(0, len(items), per_page):
+        count = min(per_page, len(items) - page_start)
+        page_rows = -(-count // columns)
+        page = Image.new("RGB", (left + columns * pitch_x, top + page_rows * pitch_y), BACKGROUND)
+        draw = ImageDraw.Draw(page)
+
+        if column_headers:
+            for col, header in enumerate(column_headers):
+                header = _fit(draw, header, cell, font)
+                x = left + col * pitch_x + (cell - draw.textlength(header, font=font)) // 2
+                draw.text((x, PADDING // 2), header, fill=LABEL_COLOUR, font=font)
+
+        for offset in range(count):
+            row, col = divmod(offset, columns)
+            x, y = left + col * pitch_x, top + row * pitch_y
+            if col == 0 and row_headers:
+                header = row_headers[(page_start + offset) // columns]
+                draw.text((PADDING, y + cell // 2), _fit(draw, header, HEADER_WIDTH - 2 * PADDING, font),
+                          fill=LABEL_COLOUR, font=font)
+
+            item = items[page_start + offset]
+            decoded = next(cells)
+            if decoded is None:
+                continue
+            mode, size, pixels = decoded
+            tile = Image.frombytes(mode, size, pixels)
+            page.paste(tile, (x + (cell - size[0]) // 2, y + (cell - size[1]) // 2))
+            if item.label and not row_headers:
+                draw.text((x, y + cell + 1), _fit(draw, item.label, cell, font),
+                          fill=LABEL_COLOUR, font=font)
+
+        yield page
+
+
+def comparison_grid(items: List[Item], by: str = "seed",
+                    columns: int = DEFAULT_COLUMNS) -> Iterator[Tuple[List[Optional[Item]], List[str], List[str]]]:
+    """
+    Pivot items into scene x seed (or cfg) grids of at most `columns` values each
+
+    Yields:
+        (cells in row-major order, row headers, column headers); each cell is
+        the newest image for that scene and value, or None
+    """
+    values = sorted({getattr(item, by) for item in items if getattr(item, by) is not None})
+    scenes = sorted({item.scene for item in items})
+    latest: Dict[Tuple[str, Any], Item] = {}
+    for item in items:
+        latest[(item.scene, getattr(item, by))] = item
+
+    for start in range(0, len(values), columns):
+        chunk = values[start:start + columns]
+        cells = [latest.get((scene, value)) for scene in scenes for value in chunk]
+        headers = [f"{by} {value:g}" if isinstance(value, float) else f"{by} {value}"
+                   for value in chunk]
+        yield cells, scenes, headers
+
+
+def build(items: List[Item], name: str, layout: str = "sheet", by: str = "seed",
+          columns: int = DEFAULT_COLUMNS, rows: int = DEFAULT_ROWS, cell: int = DEFAULT_CELL,
+          workers: Optional[int] = None) -> List[str]:
+    """
+    Render contact sheets or comparison grids to outputs/contact_sheets/
+
+    Args:
+        items: Images from select_items()
+        name: Output name; pages are saved as <name>_01.jpg, <name>_02.jpg, ...
+        layout: "sheet" or "grid"
+        by: Grid column field, "seed" or "cfg"
+        columns: Columns per page (grids with more values continue on further pages)
+        rows: Rows per page
+
+    Returns:
+        Saved page paths, relative to outputs/
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if layout == "grid":
+        sections = list(comparison_grid(items, by, columns))
+    else:
+        sections = [(list(items), None, None)]
+
+    workers = workers or os.cpu_count() or 1
+    saved = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for cells, row_headers, column_headers in sections:
+            section_columns = len(column_headers) if column_headers else columns
+            for page in render_pages(cells, section_columns, rows, cell, pool, workers,
+                                     row_headers, column_headers):
+                rel_path = f"{SHEETS_DIR}/{name}_{len(saved) + 1:02d}.jpg"
+                target = get_output_path(rel_path)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                page.save(target, quality=88, optimize=True)
+                saved.append(rel_path)
+                logger.info(f"🗂️  Saved: {rel_path} ({page.width}x{page.height})")
+    return saved
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tile outputs into labelled contact sheets or seed grids")
+    parser.add_argument("--scene", help="Prompt key to include")
+    parser.add_argument("--set", dest="prompt_set", help="Prompt set to include")
+    parser.add_argument("--seed", type=int, help="Seed to include")
+    parser.add_argument("--files", nargs="+", type=Path,
+                        help="Images to tile instead of a manifest selection")
+    parser.add_argument("--grid", choices=["seed", "cfg"],
+                        help="Comparison grid: one row per scene key, one column per seed or cfg")
+    parser.add_argument("--name", default="sheet", help="Output name (default: sheet)")
+    parser.add_argument("--columns", type=int, default=DEFAULT_COLUMNS)
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="Rows per page")
+    parser.add_argument("--cell", type=int, default=DEFAULT_CELL, help="Cell size in pixels")
+    parser.add_argument("--workers", type=int, help="Decoder processes (default: one per CPU)")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    files = None
+    if args.files:
+        root = OUTPUT_DIR.resolve()
+        files = []
+        for path in args.files:
+            path = path.resolve()
+            if not path.is_relative_to(root):
+                logger.error(f"❌ {path} is not below {OUTPUT_DIR}")
+                sys.exit(1)
+            files.append(path.relative_to(root).as_posix())
+
+    items = select_items(args.scene, args.prompt_set, args.seed, files, args.cell)
+    if not items:
+        logger.error("❌ No outputs match")
+        sys.exit(1)
+
+    logger.info(f"🖼️  {len(items)} image(s)")
+    pages = build(items, args.name, layout="grid" if args.grid else "sheet", by=args.grid or "seed",
+                  columns=args.columns, rows=args.rows, cell=args.cell, workers=args.workers)
+    logger.info(f"✅ {len(pages)} page(s) in {OUTPUT_DIR / SHEETS_DIR}")
+
+
+if __name__ == "__main__":
+    main()
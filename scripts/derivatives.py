@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Derivatives
+Builds thumbnails, review copies and archival copies of rendered images.
+
+Each source image is decoded once in a worker process and every configured
+derivative is encoded from it. Derivatives are content-addressed
+(outputs/derivatives/<name>/<hash[:2]>/<hash>.<ext>) and recorded in the
+manifest next to their source, so a run only processes images that are new,
+changed, or missing a derivative whose settings changed:
+
+  - sources whose size and mtime match the manifest are skipped unread
+  - touched or renamed files are re-hashed, and reuse existing derivatives
+    when the content is unchanged
+"""
+
+import os
+import sys
+import time
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from config import configure_logging, get_output_path, OUTPUT_DIR
+from output_store import get_store, STORE_DIR
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = "derivatives"
+SOURCE_SUFFIXES = (".png",)
+DEFAULT_CHUNKSIZE = 8
+
+
+class DerivativeSpec(NamedTuple):
+    """How to build one derivative"""
+    name: str
+    max_size: int       # longest side in pixels, 0 keeps the original size
+    format: str         # JPEG, WEBP or PNG
+    quality: int = 80   # lossy formats only
+    lossless: bool = False
+
+    @property
+    def key(self) -> str:
+        """Changes whenever the output would change"""
+        return f"{self.format}:{self.max_size}:{self.quality}:{int(self.lossless)}"
+
+    @property
+    def extension(self) -> str:
+        return {"JPEG": "jpg", "WEBP": "webp", "PNG": "png"}[self.format]
+
+
+DEFAULT_SPECS = {
+    "thumb": DerivativeSpec("thumb", 320, "JPEG", quality=80),
+    "review": DerivativeSpec("review", 1280, "WEBP", quality=82),
+    "archive": DerivativeSpec("archive", 0, "WEBP", lossless=True),
+    "archive_png": DerivativeSpec("archive_png", 0, "PNG"),
+}
+DEFAULT_SPEC_NAMES = ("thumb", "review", "archive")
+
+
+def derivative_path(spec: DerivativeSpec, file_hash: str) -> str:
+    """Path of a derivative, relative to outputs/"""
+    return f"{DERIVATIVES_DIR}/{spec.name}/{file_hash[:2]}/{file_hash[:32]}.{spec.extension}"
+
+
+def _encode(image, spec: DerivativeSpec, target: Path):
+    """Encode one derivative of a decoded image"""
+    from PIL import Image
+
+    if spec.max_size and max(image.size) > spec.max_size:
+        image = image.copy()
+        image.thumbnail((spec.max_size, spec.max_size), Image.LANCZOS)
+
+    if spec.format == "JPEG":
+        image = image.convert("RGB")
+        options = {"quality": spec.quality, "optimize": True, "progressive": True}
+    elif spec.format == "WEBP":
+        options = {"lossless": True, "quality": 100, "method": 4} if spec.lossless \
+            else {"quality": spec.quality, "method": 4}
+    else:
+        options = {"optimize": True}
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(target.name + ".tmp")
+    image.save(tmp_path, format=spec.format, **options)
+    os.replace(tmp_path, target)
+
+
+def build_derivatives(source: str, specs: List[DerivativeSpec]) -> Dict[str, Any]:
+    """
+    Hash a source image and build its missing derivatives (runs in a worker process)
+
+    Args:
+        source: Source path relative to outputs/
+        specs: Derivatives to build
+
+    Returns:
+        Dict with the source 'stat', 'file_hash', manifest 'rows' and
+        counts of 'built' and 'reused' derivatives
+    """
+    import hashlib
+    from PIL import Image
+
+    source_path = get_output_path(source)
+    stat = source_path.stat()
+    with open(source_path, "rb") as f:
+        data = f.read()
+    file_hash = hashlib.sha256(data).hexdigest()
+
+    rows, built, reused = [], 0, 0
+    image = None
+    try:
+        for spec in specs:
+            rel_path = derivative_path(spec, file_hash)
+            target = get_output_path(rel_path)
+            if target.exists():
+                reused += 1
+            else:
+                if image is None:
+                    import io
+
+                    image = Image.open(io.BytesIO(data))
+                    image.load()
+                _encode(image, spec, target)
+                built += 1
+            rows.append({"source": source, "name": spec.name, "spec": spec.key,
+                         "path": rel_path, "size": target.stat().st_size,
+                         "file_hash": file_hash, "source_size": stat.st_size,
+                         "source_mtime": stat.st_mtime, "created": time.time()})
+    finally:
+        if image is not None:
+            image.close()
+
+    return {"source": source, "bytes": len(data), "file_hash": file_hash,
+            "rows": rows, "built": built, "reused": reused}
+
+
+def list_sources(directory: Optional[Path] = None) -> List[str]:
+    """
+    Source images relative to outputs/
+
+    Args:
+        directory: Walk this directory below outputs/ (default: every output
+            recorded in the manifest, without a directory walk)
+    """
+    if directory is None:
+        return sorted({row["path"] for row in get_store().query()})
+
+    directory = Path(directory).resolve()
+    sources = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d != DERIVATIVES_DIR and not d.startswith(".")]
+        rel_root = Path(root).relative_to(OUTPUT_DIR.resolve()).as_posix()
+        sources.extend(f"{rel_root}/{name}" for name in files
+                       if name.lower().endswith(SOURCE_SUFFIXES))
+    return sorted(sources)
+
+
+def plan(sources: Iterable[str], specs: List[DerivativeSpec]) -> List[Tuple[str, List[DerivativeSpec]]]:
+    """
+    Work left to do: sources paired with the derivatives they still need
+
+    A derivative is up to date when the manifest has it with the same spec
+    for a source of the same size and mtime.
+    """
+    known: Dict[Tuple[str, str], Dict[str, Any]] = {
+        (row["source"], row["name"]): row for row in get_store().get_derivatives()}
+
+    work = []
+    for source in sources:
+        try:
+            stat = get_output_path(source).stat()
+        except FileNotFoundError:
+            continue
+        needed = []
+        for spec in specs:
+            row = known.get((source, spec.name))
+            if row is None or row["spec"] != spec.key or row["source_size"] != stat.st_size \
+                    or row["source_mtime"] != stat.st_mtime:
+                needed.append(spec)
+        if needed:
+            work.append((source, needed))
+    return work
+
+
+def run(sources: Iterable[str], specs: List[DerivativeSpec], workers: Optional[int] = None,
+        chunksize: int = DEFAULT_CHUNKSIZE) -> Dict[str, Any]:
+    """
+    Build missing derivatives in a process pool
+
+    Args:
+        sources: Source paths relative to outputs/
+        specs: Derivatives to build
+        workers: Worker processes (default: one per CPU)
+        chunksize: Sources handed to a worker at a time
+
+    Returns:
+        Summary with counts, elapsed time and throughput
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    sources = list(sources)
+    start = time.time()
+    work = plan(sources, specs)
+    summary = {"sources": len(sources), "processed": 0, "failed": 0, "built": 0,
+               "reused": 0, "input_bytes": 0, "output_bytes": 0}
+
+    if work:
+        store = get_store()
+        workers = workers or os.cpu_count() or 1
+        paths = [source for source, _ in work]
+        needed = [spec_list for _, spec_list in work]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_build_safely, paths, needed, chunksize=chunksize)
+            batch = []
+            for result in results:
+                if "error" in result:
+                    summary["failed"] += 1
+                    logger.warning(f"⚠️  {result['source']}: {result['error']}")
+                    continue
+                summary["processed"] += 1
+                summary["built"] += result["built"]
+                summary["reused"] += result["reused"]
+                summary["input_bytes"] += result["bytes"]
+                summary["output_bytes"] += sum(row["size"] for row in result["rows"])
+                batch.extend(result["rows"])
+                if len(batch) >= 256:
+                    store.record_derivatives(batch)
+                    batch = []
+            store.record_derivatives(batch)
+
+    elapsed = time.time() - start
+    summary["elapsed"] = elapsed
+    summary["images_per_s"] = summary["processed"] / elapsed if elapsed > 0 else 0.0
+    summary["input_mb_s"] = summary["input_bytes"] / 1024**2 / elapsed if elapsed > 0 else 0.0
+    return summary
+
+
+def _build_safely(source: str, specs: List[DerivativeSpec]) -> Dict[str, Any]:
+    # One unreadable image must not abort the whole pool.map()
+    try:
+        return build_derivatives(source, specs)
+    except Exception as e:
+        return {"source": source, "error": str(e)}
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build thumbnails, review and archival copies of outputs")
+    parser.add_argument("--specs", default=",".join(DEFAULT_SPEC_NAMES),
+                        help=f"Comma-separated derivatives ({', '.join(DEFAULT_SPECS)})")
+    parser.add_argument("--dir", type=Path,
+                        help=f"Process every PNG below this directory instead of the manifest "
+                             f"(e.g. outputs/{STORE_DIR})")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help="Images handed to a worker at a time")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    try:
+        specs = [DEFAULT_SPECS[name.strip()] for name in args.specs.split(",") if name.strip()]
+    except KeyError as e:
+        logger.error(f"❌ Unknown derivative {e}. Available: {', '.join(DEFAULT_SPECS)}")
+        sys.exit(1)
+
+    if args.dir is not None and not args.dir.resolve().is_relative_to(OUTPUT_DIR.resolve()):
+        logger.error(f"❌ {args.dir} is not below {OUTPUT_DIR}")
+        sys.exit(1)
+
+    sources = list_sources(args.dir)
+    logger.info(f"🖼️  {len(sources)} source image(s), derivatives: {', '.join(s.name for s in specs)}")
+
+    summary = run(sources, specs, workers=args.workers, chunksize=args.chunksize)
+
+    logger.info(f"✅ Processed {summary['processed']} image(s) "
+                f"({summary['built']} built, {summary['reused']} reused), "
+                f"{summary['sources'] - summary['processed'] - summary['failed']} up to date")
+    if summary["processed"]:
+        logger.info(f"⚡ {summary['images_per_s']:.1f} images/s, {summary['input_mb_s']:.1f}MB/s in, "
+                    f"{summary['output_bytes'] / 1024**2:.1f}MB written ({summary['elapsed']:.1f}s)")
+    if summary["failed"]:
+        logger.error(f"❌ {summary['failed']} image(s) failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
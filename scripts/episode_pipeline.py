@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Episode Pipeline
+Renders a structured episode script as a dependency graph:
+
+    panels -> upscales -> page layouts, plus character reference sheets
+
+Panels are text-to-image renders that share their character's seed with
+the reference sheets; they do not read the sheets, so they do not wait
+for them.
+
+Tasks are list-scheduled by critical path across the GPU backend (ComfyUI)
+and a local CPU pool, only tasks whose inputs changed are rebuilt, and a
+critical-path report is printed at the end of each build.
+
+Episode files live in config/episodes/, see ep01.yaml for the format.
+"""
+
+import os
+import sys
+import time
+import json
+import logging
+from concurrent.futures import FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from config import configure_logging, get_output_path, OUTPUT_DIR
+from job_scheduler import JobScheduler, job_key, read_state
+from output_store import derivative_row, get_store
+from shot_runner import Shot, execute_shot, load_document, resolve_request
+
+logger = logging.getLogger(__name__)
+
+# Rough cost model used for scheduling priority and dry-run estimates.
+# Refine from real runs; only the relative order of tasks matters here.
+ESTIMATED_SECONDS_PER_STEP = 0.3  # at 768x1024, batch 1
+ESTIMATED_UPSCALE_SECONDS = 0.5   # per image
+ESTIMATED_PAGE_SECONDS = 1.0
+
+PAGE_MARGIN = 48
+PAGE_GUTTER = 24
+PANEL_BORDER = 4
+
+
+class Task:
+    """A node of the episode build graph"""
+
+    def __init__(self, task_id: str, kind: str, resource: str, deps: List[str],
+                 spec: Dict[str, Any], run: Callable, estimate: float):
+        self.id = task_id
+        self.kind = kind
+        self.resource = resource
+        self.deps = deps
+        self.spec = spec
+        self.run = run
+        self.estimate = estimate
+        self.hash = None
+        self.status = "pending"
+        self.started = None
+        self.finished = None
+
+    @property
+    def duration(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+
+def _render_task(episode: str, shot: Shot, request: Dict[str, Any], kind: str,
+                 timeout: int) -> Callable:
+    def run(dep_results):
+        return execute_shot(shot, request, timeout=timeout, subdir=f"episodes/{episode}/{kind}")
+    return run
+
+
+def _upscale_task(episode: str, factor: float) -> Callable:
+    def run(dep_results):
+        import io
+        from PIL import Image
+
+        upscaled, rows = [], []
+        for filename in dep_results[0]:
+            rel_path = f"episodes/{episode}/upscaled/{Path(filename).name}"
+            target = get_output_path(rel_path)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with Image.open(get_output_path(filename)) as img:
+                size = (round(img.width * factor), round(img.height * factor))
+                buffer = io.BytesIO()
+                img.resize(size, Image.LANCZOS).save(buffer, format="PNG", optimize=True)
+            data = buffer.getvalue()
+            tmp_path = target.with_name(target.name + ".tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, target)
+            rows.append(derivative_row(filename, "upscale", f"LANCZOS:{factor:g}", rel_path, data))
+            upscaled.append(rel_path)
+            logger.info(f"🔍 Upscaled: {target.name} ({size[0]}x{size[1]})")
+        # Recorded next to their render in the manifest
+        get_store().record_derivatives(rows)
+        return upscaled
+    return run
+
+
+def _page_task(episode: str, page_number: int, columns: int, picks: List[int]) -> Callable:
+    def run(dep_results):
+        from PIL import Image, ImageOps
+
+        panels = [files[min(pick, len(files) - 1)] for files, pick in zip(dep_results, picks)]
+        images = [Image.open(get_output_path(f)) for f in panels]
+        try:
+            cell_w = max(img.width for img in images)
+            cell_h = max(img.height for img in images)
+            rows = -(-len(images) // columns)
+
+            page = Image.new("RGB", (
+                2 * PAGE_MARGIN + columns * cell_w + (columns - 1) * PAGE_GUTTER,
+                2 * PAGE_MARGIN + rows * cell_h + (rows - 1) * PAGE_GUTTER,
+            ), "white")
+
+            for index, img in enumerate(images):
+                row, col = divmod(index, columns)
+                panel = ImageOps.contain(img.convert("RGB"), (cell_w, cell_h))
+                panel = ImageOps.expand(panel, border=PANEL_BORDER, fill="black")
+                x = PAGE_MARGIN + col * (cell_w + PAGE_GUTTER) + (cell_w - panel.width) // 2
+                y = PAGE_MARGIN + row * (cell_h + PAGE_GUTTER) + (cell_h - panel.height) // 2
+                page.paste(panel, (x, y))
+        finally:
+            for img in images:
+                img.close()
+
+        target = get_output_path(f"episodes/{episode}/pages/page_{page_number:02d}.png")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        page.save(target, optimize=True)
+        logger.info(f"📄 Page {page_number} laid out: {target.name} ({page.width}x{page.height})")
+        return [str(target.relative_to(OUTPUT_DIR))]
+    return run
+
+
+def _estimate_render(request: Dict[str, Any]) -> float:
+    pixels = request["width"] * request["height"] / (768 * 1024)
+    return ESTIMATED_SECONDS_PER_STEP * request["steps"] * request["batch_size"] * pixels
+
+
+def build_graph(document: Dict[str, Any], timeout: int = 300) -> Dict[str, Task]:
+    """
+    Turn an episode document into build tasks in topological order
+
+    Raises:
+        ValueError/KeyError for an invalid episode document
+    """
+    episode = document.get("episode")
+    if not episode or not isinstance(document.get("pages"), list):
+        raise ValueError("Episode file needs 'episode' and a 'pages' list")
+
+    tasks: Dict[str, Task] = {}
+    character_seeds: Dict[str, int] = {}
+
+    def add(task: Task):
+        if task.id in tasks:
+            raise ValueError(f"Duplicate task id: {task.id}")
+        tasks[task.id] = task
+
+    # Stage 1: character reference sheets
+    for name, character in (document.get("characters") or {}).items():
+        overrides = {k: v for k, v in character.items() if k not in ("set", "keys")}
+        if "seed" in character:
+            character_seeds[name] = character["seed"]
+        for key in character.get("keys", []):
+            shot = Shot(id=f"{name}:{key}", prompt_set=character.get("set", "character"),
+                        key=key, overrides=overrides)
+            request = resolve_request(shot)
+            task = Task(f"ref:{name}:{key}", "reference", "gpu", [],
+                        {"set": shot.prompt_set, "key": key, "request": request},
+                        _render_task(episode, shot, request, "references", timeout),
+                        _estimate_render(request))
+            add(task)
+
+    default_upscale = document.get("upscale", 1)
+
+    # Stages 2-4: panels, upscales and page layouts
+    for page_number, page in enumerate(document["pages"], 1):
+        page_inputs, picks = [], []
+        for panel in page.get("panels", []):
+            if "id" not in panel or "set" not in panel or "key" not in panel:
+                raise ValueError(f"Page {page_number}: every panel needs 'id', 'set' and 'key'")
+
+            characters = panel.get("characters", [])
+            unknown = [c for c in characters if c not in (document.get("characters") or {})]
+            if unknown:
+                raise KeyError(f"Panel {panel['id']}: unknown character(s) {unknown}")
+
+            overrides = {k: v for k, v in panel.items()
+                         if k not in ("id", "set", "key", "characters", "upscale", "pick")}
+            # Panels inherit their character's seed for consistency with the reference sheet
+            for character in characters:
+                if "seed" not in overrides and character in character_seeds:
+                    overrides["seed"] = character_seeds[character]
+
+            shot = Shot(id=panel["id"], prompt_set=panel["set"], key=panel["key"], overrides=overrides)
+            request = resolve_request(shot)
+            # The inherited seed is part of the request, so it is covered by the panel's hash
+            panel_task = Task(f"panel:{panel['id']}", "panel", "gpu", [],
+                              {"set": shot.prompt_set, "key": shot.key, "request": request},
+                              _render_task(episode, shot, request, "panels", timeout),
+                              _estimate_render(request))
+            add(panel_task)
+            last = panel_task
+
+            factor = panel.get("upscale", default_upscale)
+            if factor and factor != 1:
+                last = Task(f"upscale:{panel['id']}", "upscale", "cpu", [panel_task.id],
+                            {"factor": factor}, _upscale_task(episode, factor),
+                            ESTIMATED_UPSCALE_SECONDS * request["batch_size"])
+                add(last)
+
+            page_inputs.append(last.id)
+            picks.append(int(panel.get("pick", 0)))
+
+        if page_inputs:
+            columns = int(page.get("columns", 2))
+            add(Task(f"page:{page_number}", "page", "cpu", page_inputs,
+                     {"columns": columns, "picks": picks},
+                     _page_task(episode, page_number, columns, picks),
+                     ESTIMATED_PAGE_SECONDS))
+
+    # Content hashes: a task is rebuilt when its spec or any upstream task changes
+    for task in tasks.values():
+        task.hash = job_key({"kind": task.kind, "spec": task.spec,
+                             "deps": [tasks[d].hash for d in task.deps]})
+
+    return tasks
+
+
+def _bottom_levels(tasks: Dict[str, Task]) -> Dict[str, float]:
+    """Longest estimated path from each task to the end of the graph"""
+    levels: Dict[str, float] = {}
+    children: Dict[str, List[str]] = {tid: [] for tid in tasks}
+    for task in tasks.values():
+        for dep in task.deps:
+            children[dep].append(task.id)
+
+    for tid in reversed(list(tasks)):
+        levels[tid] = tasks[tid].estimate + max((levels[c] for c in children[tid]), default=0.0)
+    return levels
+
+
+def _outputs_exist(files) -> bool:
+    return bool(files) and all((OUTPUT_DIR / f).exists() for f in files)
+
+
+def run_pipeline(tasks: Dict[str, Task], state_file: Path, gpu_workers: int = 1,
+                 cpu_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Execute the build graph with critical-path list scheduling
+
+    Ready tasks are started in order of their longest remaining path, as long
+    as their resource has a free slot. Tasks whose content hash was built
+    before (and whose outputs still exist) are reused instead of re-rendered.
+
+    Returns:
+        Dict mapping task id to its output files
+    """
+    cpu_workers = cpu_workers or min(4, os.cpu_count() or 1)
+    slots = {"gpu": gpu_workers, "cpu": cpu_workers}
+    priority = _bottom_levels(tasks)
+    results: Dict[str, List[str]] = {}
+
+    def run_task(task: Task, dep_results):
+        task.started = time.time()
+        try:
+            return task.run(dep_results)
+        finally:
+            task.finished = time.time()
+
+    with JobScheduler(max_workers=gpu_workers + cpu_workers, state_file=state_file) as scheduler:
+        pending = dict(tasks)
+        # Identical tasks (same content hash) share one future and one build
+        running: Dict[Any, List[Task]] = {}
+        busy = {"gpu": 0, "cpu": 0}
+
+        while pending or running:
+            waiting = len(pending)
+            ready = []
+            for tid, task in list(pending.items()):
+                if any(tasks[d].status in ("failed", "skipped") for d in task.deps):
+                    task.status = "skipped"
+                    del pending[tid]
+                elif all(d in results for d in task.deps):
+                    ready.append(task)
+
+            for task in sorted(ready, key=lambda t: priority[t.id], reverse=True):
+                cached = scheduler.completed_result(task.hash)
+                if cached is not None and _outputs_exist(cached):
+                    task.status = "cached"
+                    results[task.id] = cached
+                    del pending[task.id]
+                    continue
+                if cached is not None:
+                    scheduler.invalidate(task.hash)
+
+                if busy[task.resource] >= slots[task.resource]:
+                    continue
+
+                dep_results = [results[d] for d in task.deps]
+                future = scheduler.submit(task.hash, run_task, task, dep_results)
+                if future not in running:
+                    running[future] = []
+                    busy[task.resource] += 1
+                running[future].append(task)
+                task.status = "running"
+                del pending[task.id]
+
+            if not running:
+                if len(pending) == waiting:
+                    stuck = ", ".join(sorted(pending))
+                    raise RuntimeError(f"Tasks can never become ready: {stuck}")
+                # Cached or skipped tasks may have unblocked others; go again
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                shared = running.pop(future)
+                busy[shared[0].resource] -= 1
+                for task in shared:
+                    try:
+                        results[task.id] = future.result()
+                        task.status = "built"
+                    except Exception as e:
+                        task.status = "failed"
+                        logger.error(f"❌ {task.id} failed: {e}")
+
+    return results
+
+
+def critical_path(tasks: Dict[str, Task], durations: Dict[str, float]) -> List[str]:
+    """Longest path through the graph for the given per-task durations"""
+    finish: Dict[str, float] = {}
+    via: Dict[str, Optional[str]] = {}
+    for tid, task in tasks.items():
+        parent = max(task.deps, key=lambda d: finish[d], default=None)
+        finish[tid] = (finish[parent] if parent else 0.0) + durations[tid]
+        via[tid] = parent
+
+    if not finish:
+        return []
+
+    node = max(finish, key=finish.get)
+    path = []
+    while node:
+        path.append(node)
+        node = via[node]
+    return list(reversed(path))
+
+
+def build_report(tasks: Dict[str, Task], wall_time: float,
+                 slots: Dict[str, int]) -> Dict[str, Any]:
+    """Summarise a build: per-task timings, critical path and resource utilisation"""
+    durations = {tid: t.duration for tid, t in tasks.items()}
+    path = critical_path(tasks, durations)
+
+    busy = {}
+    for task in tasks.values():
+        busy[task.resource] = busy.get(task.resource, 0.0) + task.duration
+
+    return {
+        "wall_time": round(wall_time, 2),
+        "critical_path": path,
+        "critical_path_time": round(sum(durations[t] for t in path), 2),
+        "utilisation": {r: round(busy.get(r, 0.0) / (wall_time * n), 3) if wall_time else 0.0
+                        for r, n in slots.items()},
+        "tasks": {tid: {"status": t.status, "resource": t.resource,
+                        "duration": round(t.duration, 2), "hash": t.hash}
+                  for tid, t in tasks.items()},
+    }
+
+
+def print_plan(tasks: Dict[str, Task], scheduler_state: Path):
+    """Dry run: show what would be rebuilt and the estimated critical path"""
+    completed = read_state(scheduler_state)
+
+    estimates = {}
+    for tid, task in tasks.items():
+        cached = completed.get(task.hash)
+        up_to_date = cached is not None and _outputs_exist(cached) and \
+            all(estimates[d] == 0 for d in task.deps)
+        estimates[tid] = 0.0 if up_to_date else task.estimate
+        marker = "✓" if up_to_date else "•"
+        logger.info(f"  {marker} {tid:<40} {task.resource}  ~{estimates[tid]:6.1f}s")
+
+    path = critical_path(tasks, estimates)
+    rebuild = sum(1 for e in estimates.values() if e > 0)
+    logger.info(f"\n📋 {rebuild}/{len(tasks)} task(s) to build")
+    logger.info(f"⏱️  Estimated critical path ({sum(estimates[t] for t in path):.1f}s): "
+                f"{' → '.join(path)}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render a DriftingMe episode")
+    parser.add_argument("episode_file", type=Path, help="Episode YAML/JSON file")
+    parser.add_argument("--gpu-workers", type=int, default=1,
+                        help="Render tasks in flight on the ComfyUI backend")
+    parser.add_argument("--cpu-workers", type=int,
+                        help="Local upscale/layout workers")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Show what would be rebuilt and the estimated critical path")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Ignore previous builds and render everything")
+    parser.add_argument("--timeout", type=int, default=300,
+                        help="Per-render timeout in seconds")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    try:
+        document = load_document(args.episode_file)
+        tasks = build_graph(document, timeout=args.timeout)
+    except (ValueError, KeyError, RuntimeError, OSError) as e:
+        logger.error(f"Invalid episode file: {e}")
+        sys.exit(1)
+
+    episode = document["episode"]
+    episode_dir = OUTPUT_DIR / "episodes" / episode
+    state_file = episode_dir / "build_state.jsonl"
+
+    logger.info(f"🎞️  DriftingMe Episode Build: {document.get('title', episode)}")
+    logger.info("=" * 60)
+
+    if args.dry_run:
+        print_plan(tasks, state_file)
+        return
+
+    if args.rebuild and state_file.exists():
+        state_file.unlink()
+
+    slots = {"gpu": args.gpu_workers, "cpu": args.cpu_workers or min(4, os.cpu_count() or 1)}
+    start = time.time()
+    run_pipeline(tasks, state_file, gpu_workers=slots["gpu"], cpu_workers=slots["cpu"])
+    report = build_report(tasks, time.time() - start, slots)
+
+    episode_dir.mkdir(parents=True, exist_ok=True)
+    with open(episode_dir / "build_report.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    counts = {}
+    for task in tasks.values():
+        counts[task.status] = counts.get(task.status, 0) + 1
+
+    logger.info(f"\n📊 Episode Build Complete in {report['wall_time']:.1f}s:")
+    logger.info("   " + "  ".join(f"{status}: {n}" for status, n in sorted(counts.items())))
+    logger.info(f"⏱️  Critical path ({report['critical_path_time']:.1f}s): "
+                f"{' → '.join(report['critical_path'])}")
+    for tid in report["critical_path"]:
+        logger.info(f"     {tid:<40} {tasks[tid].duration:6.1f}s")
+    logger.info("📈 Utilisation: " + ", ".join(f"{r} {u:.0%}" for r, u in report["utilisation"].items()))
+    logger.info(f"📁 Report: {episode_dir / 'build_report.json'}")
+
+    if counts.get("failed") or counts.get("skipped"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,762 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Fake ComfyUI
+Local stand-in for a ComfyUI server, for client tests and load tests without a GPU.
+
+Implements the endpoints comfyui_api uses: /prompt, /history, /view, /queue,
+/interrupt, /system_stats, /object_info and the /ws event stream. Prompts
+run one at a time, like on a single GPU, and emit the same websocket events
+as ComfyUI (execution_start, execution_cached, executing, progress,
+executed, execution_success/error). Execution time follows a simple model:
+
+  - checkpoint load when the checkpoint changes
+  - a fixed cost per text-encode node
+  - sampling: seconds per step, scaled by batch size and megapixels
+  - VAE decode: seconds per megapixel per image
+
+Nodes unchanged since the previous prompt are reported as cached, as in
+ComfyUI. SaveImage/PreviewImage produce synthetic PNGs (smooth random
+fields, so perceptual hashes behave) at the requested size. Failures can be
+injected: execution errors, 503s on /prompt, and 502s after the prompt was
+queued (the response is "lost", which exercises idempotent resubmission).
+
+    python scripts/fake_comfyui.py --port 8190 --step-seconds 0.05
+    COMFYUI_URL=http://127.0.0.1:8190 python scripts/shot_runner.py ...
+"""
+
+import json
+import time
+import random
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from config import configure_logging
+from comfyui_api import DEFAULT_CHECKPOINT
+from comfyui_events import OP_CLOSE, OP_TEXT, encode_frame, read_frame, ws_accept_key
+
+logger = logging.getLogger(__name__)
+
+FAKE_VERSION = "0.0.0-fake"
+
+SAMPLERS = ["euler", "euler_ancestral", "heun", "dpm_2", "dpm_2_ancestral", "lms", "dpm_fast",
+            "dpm_adaptive", "dpmpp_2s_ancestral", "dpmpp_sde", "dpmpp_2m", "dpmpp_2m_sde",
+            "dpmpp_3m_sde", "ddim", "uni_pc", "lcm"]
+SCHEDULERS = ["normal", "karras", "exponential", "sgm_uniform", "simple", "ddim_uniform", "beta"]
+CHECKPOINTS = [DEFAULT_CHECKPOINT, "sd_xl_base_1.0.safetensors", "dreamshaper_8.safetensors"]
+OUTPUT_NODES = ("SaveImage", "PreviewImage")
+
+
+class FakeSettings(NamedTuple):
+    """Latency model and failure injection of the fake server"""
+    load_seconds: float = 0.5          # checkpoint load (first use or model switch)
+    encode_seconds: float = 0.01       # per CLIPTextEncode / ConditioningConcat
+    step_seconds: float = 0.02         # per sampling step at 512x512, batch 1
+    decode_seconds: float = 0.02       # per megapixel per image
+    fail_rate: float = 0.0             # share of prompts ending in execution_error
+    http_error_rate: float = 0.0       # share of POST /prompt answered 503 (not queued)
+    lost_response_rate: float = 0.0    # share of POST /prompt queued but answered 502
+    max_images: int = 256              # generated images kept for /view
+    checkpoints: Tuple[str, ...] = tuple(CHECKPOINTS)
+
+
+def object_info(checkpoints: List[str]) -> Dict[str, Any]:
+    """/object_info for the node classes our workflows use"""
+    def node(required: Dict[str, Any], output: List[str], category: str) -> Dict[str, Any]:
+        return {"input": {"required": required}, "output": output, "output_node": not output,
+                "category": category}
+
+    image_size = ["INT", {"default": 512, "min": 16, "max": 16384, "step": 8}]
+    return {
+        "CheckpointLoaderSimple": node({"ckpt_name": [list(checkpoints)]},
+                                       ["MODEL", "CLIP", "VAE"], "loaders"),
+        "CLIPTextEncode": node({"text": ["STRING", {"multiline": True}], "clip": ["CLIP"]},
+                               ["CONDITIONING"], "conditioning"),
+        "ConditioningConcat": node({"conditioning_to": ["CONDITIONING"],
+                                    "conditioning_from": ["CONDITIONING"]},
+                                   ["CONDITIONING"], "conditioning"),
+        "EmptyLatentImage": node({"width": image_size, "height": image_size,
+                                  "batch_size": ["INT", {"default": 1, "min": 1, "max": 4096}]},
+                                 ["LATENT"], "latent"),
+        "KSampler": node({
+            "model": ["MODEL"],
+            "seed": ["INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}],
+            "steps": ["INT", {"default": 20, "min": 1, "max": 10000}],
+            "cfg": ["FLOAT", {"default": 8.0, "min": 0.0, "max": 100.0}],
+            "sampler_name": [SAMPLERS],
+            "scheduler": [SCHEDULERS],
+            "positive": ["CONDITIONING"],
+            "negative": ["CONDITIONING"],
+            "latent_image": ["LATENT"],
+            "denoise": ["FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0}],
+        }, ["LATENT"], "sampling"),
+        "VAEDecode": node({"samples": ["LATENT"], "vae": ["VAE"]}, ["IMAGE"], "latent"),
+        "SaveImage": node({"images": ["IMAGE"], "filename_prefix": ["STRING", {"default": "ComfyUI"}]},
+                          [], "image"),
+        "PreviewImage": node({"images": ["IMAGE"]}, [], "image"),
+    }
+
+
+def synthetic_png(width: int, height: int, seed: int, size: Optional[int] = None) -> bytes:
+    """
+    A smooth random greyscale field with light grain, encoded as RGB PNG
+
+    Args:
+        size: Pad the file to this many bytes with a private ancillary chunk
+            (decoders skip it), e.g. to match the size of a recorded image
+    """
+    import io
+    import zlib
+    import struct
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    coarse = rng.random((max(2, height // 128), max(2, width // 128)))
+    field = Image.fromarray((coarse * 255).astype(np.uint8)).resize((width, height), Image.BICUBIC)
+    pixels = np.asarray(field, dtype=np.int16) + rng.integers(-6, 7, (height, width), dtype=np.int16)
+    grey = np.clip(pixels, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(np.stack([grey] * 3, axis=-1)).save(buffer, format="PNG", compress_level=1)
+    data = buffer.getvalue()
+
+    padding = (size or 0) - len(data) - 12  # chunk length, type and CRC
+    if padding >= 0:
+        chunk = b"dmPd" + bytes(padding)
+        iend = len(data) - 12
+        data = (data[:iend] + struct.pack(">I", padding) + chunk
+                + struct.pack(">I", zlib.crc32(chunk)) + data[iend:])
+    return data
+
+
+def execution_order(workflow: Dict[str, Any]) -> List[str]:
+    """Node ids with every node after the nodes it links to"""
+    order: List[str] = []
+    seen = set()
+
+    def visit(node_id: str):
+        if node_id in seen or node_id not in workflow:
+            return
+        seen.add(node_id)
+        for value in workflow[node_id].get("inputs", {}).values():
+            if isinstance(value, list) and len(value) == 2 and isinstance(value[1], int):
+                visit(str(value[0]))
+        order.append(node_id)
+
+    for node_id in workflow:
+        visit(node_id)
+    return order
+
+
+class ExecutionPlan(NamedTuple):
+    """How the fake GPU runs one prompt"""
+    cached: List[str]                  # node ids reported as cached (not run)
+    seconds: Dict[str, float]          # time spent per executed node
+    failing: Optional[str] = None      # node raising an execution error
+    images: Optional[List[Tuple[int, int, int]]] = None  # (width, height, bytes) per output image
+
+
+class _Interrupted(Exception):
+    pass
+
+
+class FakeComfyUI:
+    """
+    In-process fake server
+
+        with FakeComfyUI(FakeSettings(step_seconds=0.01)) as server:
+            override_config("COMFYUI_URL", server.url)
+    """
+
+    def __init__(self, settings: FakeSettings = FakeSettings(), host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            settings: Latency model and failure injection
+            host: Interface to listen on
+            port: Port to listen on (0: any free port)
+        """
+        from http.server import ThreadingHTTPServer
+
+        self.settings = settings
+        self._random = random.Random()
+        self._lock = threading.Condition()
+        self._queue: deque = deque()
+        self._running: Optional[list] = None
+        self._interrupt = threading.Event()
+        self._history: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._images: "OrderedDict[Tuple[str, str, str], bytes]" = OrderedDict()
+        self._sockets: Dict[str, List[Any]] = {}
+        self._loaded_checkpoint: Optional[str] = None
+        self._cache: set = set()
+        self._counter = 0
+        self._number = 0
+        self._png_seconds_per_pixel = 0.0
+        self._stopped = False
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self.stats = {"requests": {}, "connections": 0, "open_connections": 0, "peak_connections": 0,
+                      "websockets": 0, "prompts": 0, "failed": 0, "interrupted": 0,
+                      "http_errors": 0, "lost_responses": 0, "bytes_served": 0}
+
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self.url = f"http://{host}:{self._httpd.server_address[1]}"
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "FakeComfyUI":
+        for target, name in ((self._httpd.serve_forever, "fake-http"), (self._execute_loop, "fake-gpu")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._lock.notify_all()
+        self._interrupt.set()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        for connections in list(self._sockets.values()):
+            for connection in list(connections):
+                connection.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    # Bookkeeping used by the request handler
+
+    def node_schema(self) -> Dict[str, Any]:
+        """Response of /object_info"""
+        return object_info(list(self.settings.checkpoints))
+
+    def response_delay(self, endpoint: str, query: Dict[str, str]) -> float:
+        """Seconds to hold a response back (network latency); none by default"""
+        return 0.0
+
+    def count(self, endpoint: str):
+        with self._lock:
+            self.stats["requests"][endpoint] = self.stats["requests"].get(endpoint, 0) + 1
+
+    def connection_opened(self):
+        with self._lock:
+            self.stats["connections"] += 1
+            self.stats["open_connections"] += 1
+            self.stats["peak_connections"] = max(self.stats["peak_connections"],
+                                                 self.stats["open_connections"])
+
+    def connection_closed(self):
+        with self._lock:
+            self.stats["open_connections"] -= 1
+
+    # Websocket events
+
+    def add_socket(self, client_id: str, connection):
+        with self._lock:
+            self._sockets.setdefault(client_id, []).append(connection)
+            self.stats["websockets"] += 1
+
+    def remove_socket(self, client_id: str, connection):
+        with self._lock:
+            connections = self._sockets.get(client_id, [])
+            if connection in connections:
+                connections.remove(connection)
+
+    def send_event(self, event: str, data: Dict[str, Any], client_id: Optional[str] = None):
+        """Send to one client's sockets, or broadcast when client_id is None"""
+        frame = encode_frame(OP_TEXT, json.dumps({"type": event, "data": data}).encode("utf-8"), mask=False)
+        with self._lock:
+            targets = self._sockets.get(client_id, []) if client_id else \
+                [c for connections in self._sockets.values() for c in connections]
+            targets = list(targets)
+        for connection in targets:
+            connection.send(frame)
+
+    def _status_event(self):
+        with self._lock:
+            remaining = len(self._queue) + (1 if self._running else 0)
+        self.send_event("status", {"status": {"exec_info": {"queue_remaining": remaining}}})
+
+    # API
+
+    def submit(self, payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """POST /prompt; returns (HTTP status, response body)"""
+        import uuid
+
+        workflow = payload.get("prompt")
+        if not isinstance(workflow, dict) or not workflow:
+            return 400, {"error": {"type": "no_prompt", "message": "No prompt provided"}, "node_errors": {}}
+        known = self.node_schema()
+        node_errors = {node_id: {"errors": [{"type": "invalid_node", "message": f"Unknown node {node.get('class_type')}"}],
+                                 "class_type": node.get("class_type")}
+                       for node_id, node in workflow.items() if node.get("class_type") not in known}
+        if node_errors:
+            return 400, {"error": {"type": "prompt_outputs_failed_validation",
+                                   "message": "Prompt outputs failed validation"}, "node_errors": node_errors}
+        if not any(node.get("class_type") in OUTPUT_NODES for node in workflow.values()):
+            return 400, {"error": {"type": "prompt_no_outputs", "message": "Prompt has no outputs"},
+                         "node_errors": {}}
+
+        if self._random.random() < self.settings.http_error_rate:
+            with self._lock:
+                self.stats["http_errors"] += 1
+            return 503, {"error": "injected: service unavailable"}
+
+        prompt_id = payload.get("prompt_id") or str(uuid.uuid4())
+        outputs = [node_id for node_id, node in workflow.items() if node.get("class_type") in OUTPUT_NODES]
+        with self._lock:
+            self._number += 1
+            item = [self._number, prompt_id, workflow, payload.get("extra_data", {}), outputs,
+                    payload.get("client_id")]
+            self._queue.append(item)
+            self.timings[prompt_id] = {"queued": time.time()}
+            self._lock.notify_all()
+        self._status_event()
+
+        if self._random.random() < self.settings.lost_response_rate:
+            with self._lock:
+                self.stats["lost_responses"] += 1
+            return 502, {"error": "injected: bad gateway after queueing"}
+        return 200, {"prompt_id": prompt_id, "number": item[0], "node_errors": {}}
+
+    def queue_snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            running = [self._running[:5]] if self._running else []
+            return {"queue_running": running, "queue_pending": [item[:5] for item in self._queue]}
+
+    def delete_queued(self, prompt_ids: Optional[List[str]] = None):
+        """Remove pending prompts (all when prompt_ids is None)"""
+        with self._lock:
+            self._queue = deque(item for item in self._queue
+                                if prompt_ids is not None and item[1] not in prompt_ids)
+
+    def interrupt(self):
+        with self._lock:
+            if self._running:
+                self._interrupt.set()
+
+    def history(self, prompt_id: Optional[str] = None, max_items: Optional[int] = None) -> Dict[str, Any]:
+        with self._lock:
+            if prompt_id is not None:
+                return {prompt_id: self._history[prompt_id]} if prompt_id in self._history else {}
+            items = list(self._history.items())
+            if max_items is not None:
+                items = items[-max_items:] if max_items > 0 else []
+            return dict(items)
+
+    def delete_history(self, prompt_ids: Optional[List[str]] = None):
+        """Forget finished prompts (all when prompt_ids is None)"""
+        with self._lock:
+            if prompt_ids is None:
+                self._history.clear()
+            for prompt_id in prompt_ids or []:
+                self._history.pop(prompt_id, None)
+
+    def image(self, filename: str, subfolder: str, folder_type: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._images.get((folder_type, subfolder, filename))
+            if data is not None:
+                self.stats["bytes_served"] += len(data)
+            return data
+
+    # Execution
+
+    def _execute_loop(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._stopped:
+                    self._lock.wait()
+                if self._stopped:
+                    return
+                self._running = self._queue.popleft()
+                self._interrupt.clear()
+            self._execute(self._running)
+            with self._lock:
+                self._running = None
+            self._status_event()
+
+    def plan(self, prompt_id: str, workflow: Dict[str, Any], order: List[str]) -> ExecutionPlan:
+        """
+        Decide how a prompt runs: the latency model, the node cache and fail_rate
+
+        Called on the executor thread just before the prompt starts.
+        """
+        settings = self.settings
+        cached = [node_id for node_id in order if node_id in self._cache
+                  and workflow[node_id]["class_type"] not in OUTPUT_NODES]
+        seconds = {}
+        for node_id in order:
+            if node_id in cached:
+                continue
+            class_type, inputs = workflow[node_id]["class_type"], workflow[node_id]["inputs"]
+            if class_type == "CheckpointLoaderSimple":
+                switch = inputs["ckpt_name"] != self._loaded_checkpoint
+                seconds[node_id] = settings.load_seconds if switch else 0.0
+                self._loaded_checkpoint = inputs["ckpt_name"]
+            elif class_type in ("CLIPTextEncode", "ConditioningConcat"):
+                seconds[node_id] = settings.encode_seconds
+            elif class_type == "KSampler":
+                width, height, batch = self._latent_size(workflow, inputs["latent_image"])
+                seconds[node_id] = inputs["steps"] * settings.step_seconds * batch * width * height / (512 * 512)
+            elif class_type == "VAEDecode":
+                width, height, batch = self._latent_size(workflow, inputs["samples"])
+                seconds[node_id] = settings.decode_seconds * batch * width * height / 1e6
+            else:
+                seconds[node_id] = 0.0
+        failing = None
+        if self._random.random() < settings.fail_rate:
+            failing = next((n for n in order if workflow[n]["class_type"] == "KSampler"), order[-1])
+        return ExecutionPlan(cached=cached, seconds=seconds, failing=failing)
+
+    def _execute(self, item: list):
+        number, prompt_id, workflow, extra_data, outputs, client_id = item
+        messages: List[list] = []
+
+        def emit(event: str, data: Dict[str, Any], record: bool = False):
+            data = {**data, "prompt_id": prompt_id}
+            if record:
+                messages.append([event, {**data, "timestamp": int(time.time() * 1000)}])
+            if client_id:
+                self.send_event(event, data, client_id)
+
+        self.timings[prompt_id]["started"] = time.time()
+        emit("execution_start", {}, record=True)
+        order = execution_order(workflow)
+        plan = self.plan(prompt_id, workflow, order)
+        emit("execution_cached", {"nodes": plan.cached}, record=True)
+
+        results: Dict[str, Any] = {}
+        images = list(plan.images) if plan.images else None
+        status = "success"
+        try:
+            for node_id in order:
+                if node_id in plan.cached:
+                    continue
+                emit("executing", {"node": node_id, "display_node": node_id})
+                if node_id == plan.failing:
+                    raise RuntimeError("injected: CUDA out of memory")
+                output = self._run_node(node_id, workflow, emit, plan.seconds.get(node_id, 0.0), images)
+                if output is not None:
+                    results[node_id] = output
+                    emit("executed", {"node": node_id, "display_node": node_id, "output": output})
+            emit("execution_success", {}, record=True)
+        except _Interrupted:
+            status = "error"
+            emit("execution_interrupted", {"node_id": node_id, "node_type": workflow[node_id]["class_type"],
+                                           "executed": []}, record=True)
+            with self._lock:
+                self.stats["interrupted"] += 1
+        except Exception as e:
+            status = "error"
+            emit("execution_error", {"node_id": node_id, "node_type": workflow[node_id]["class_type"],
+                                     "exception_message": str(e), "exception_type": type(e).__name__},
+                 record=True)
+            with self._lock:
+                self.stats["failed"] += 1
+        emit("executing", {"node": None})
+
+        # Like ComfyUI, the next prompt reuses outputs of unchanged nodes
+        self._cache = set(order) if status == "success" else set(plan.cached)
+        self.timings[prompt_id]["finished"] = time.time()
+        with self._lock:
+            self.stats["prompts"] += 1
+            self._history[prompt_id] = {
+                "prompt": [number, prompt_id, workflow, extra_data, outputs],
+                "outputs": results,
+                "status": {"status_str": status, "completed": status == "success", "messages": messages},
+                "meta": {},
+            }
+
+    def _sleep(self, seconds: float):
+        if self._interrupt.wait(max(0.0, seconds)):
+            raise _Interrupted()
+
+    def _run_node(self, node_id: str, workflow: Dict[str, Any], emit, seconds: float,
+                  images: Optional[List[Tuple[int, int, int]]] = None) -> Optional[Dict[str, Any]]:
+        """Spend a node's planned time; output nodes return their images"""
+        node = workflow[node_id]
+        if node["class_type"] == "KSampler":
+            steps = node["inputs"]["steps"]
+            for step in range(1, steps + 1):
+                self._sleep(seconds / steps)
+                emit("progress", {"value": step, "max": steps, "node": node_id})
+        elif node["class_type"] in OUTPUT_NODES:
+            start = time.time()
+            saved = self._save_images(workflow, node_id, images)
+            # Encoding the PNGs counts towards the node's time
+            self._sleep(seconds - (time.time() - start))
+            return {"images": saved}
+        else:
+            self._sleep(seconds)
+        return None
+
+    def png_seconds(self, images: List[Tuple[int, int]]) -> float:
+        """Estimated time to generate synthetic PNGs of these sizes, from the ones made so far"""
+        if not self._png_seconds_per_pixel:
+            start = time.time()
+            synthetic_png(512, 512, 0)
+            self._png_seconds_per_pixel = (time.time() - start) / (512 * 512)
+        return self._png_seconds_per_pixel * sum(width * height for width, height in images)
+
+    def _latent_size(self, workflow: Dict[str, Any], link: list) -> Tuple[int, int, int]:
+        """(width, height, batch) of the EmptyLatentImage upstream of a link"""
+        node = workflow.get(str(link[0]), {})
+        while node and node.get("class_type") != "EmptyLatentImage":
+            links = [v for v in node.get("inputs", {}).values()
+                     if isinstance(v, list) and len(v) == 2 and isinstance(v[1], int)
+                     and workflow.get(str(v[0]), {}).get("class_type") in ("EmptyLatentImage", "KSampler",
+                                                                            "VAEDecode")]
+            node = workflow.get(str(links[0][0]), {}) if links else {}
+        if not node:
+            return 512, 512, 1
+        inputs = node["inputs"]
+        return inputs["width"], inputs["height"], inputs.get("batch_size", 1)
+
+    def _save_images(self, workflow: Dict[str, Any], node_id: str,
+                     recorded: Optional[List[Tuple[int, int, int]]] = None) -> List[Dict[str, str]]:
+        """
+        Generate a save node's images
+
+        Args:
+            recorded: (width, height, bytes) of images to imitate, consumed from
+                the front; the workflow's size is used once it runs out
+        """
+        node = workflow[node_id]
+        width, height, batch = self._latent_size(workflow, node["inputs"]["images"])
+        sampler = next((n["inputs"] for n in workflow.values() if n["class_type"] == "KSampler"), {})
+        if node["class_type"] == "SaveImage":
+            prefix = node["inputs"].get("filename_prefix", "ComfyUI")
+            subfolder, _, name = prefix.rpartition("/")
+            folder_type = "output"
+        else:
+            subfolder, name, folder_type = "", "ComfyUI_temp", "temp"
+
+        images = []
+        for index in range(batch):
+            seed = hash((sampler.get("seed", 0), index, sampler.get("cfg"), sampler.get("steps"))) & 0xffffffff
+            size = None
+            if recorded:
+                width, height, size = recorded.pop(0)
+            start = time.time()
+            data = synthetic_png(width, height, seed, size)
+            rate = (time.time() - start) / (width * height)
+            self._png_seconds_per_pixel = rate if not self._png_seconds_per_pixel else \
+                0.8 * self._png_seconds_per_pixel + 0.2 * rate
+            with self._lock:
+                self._counter += 1
+                filename = f"{name}_{self._counter:05d}_.png"
+                self._images[(folder_type, subfolder, filename)] = data
+                while len(self._images) > self.settings.max_images:
+                    self._images.popitem(last=False)
+            images.append({"filename": filename, "subfolder": subfolder, "type": folder_type})
+        return images
+
+    def system_stats(self) -> Dict[str, Any]:
+        import sys
+        import platform
+
+        return {
+            "system": {"os": platform.system().lower(), "python_version": sys.version,
+                       "comfyui_version": FAKE_VERSION, "embedded_python": False},
+            "devices": [{"name": "Fake GPU (no CUDA)", "type": "cpu", "index": 0,
+                         "vram_total": 24 * 1024**3, "vram_free": 20 * 1024**3,
+                         "torch_vram_total": 0, "torch_vram_free": 0}],
+        }
+
+
+class _WebSocketConnection:
+    """Server side of one /ws connection"""
+
+    def __init__(self, handler):
+        self._handler = handler
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def send(self, frame: bytes):
+        with self._lock:
+            if self.closed:
+                return
+            try:
+                self._handler.wfile.write(frame)
+                self._handler.wfile.flush()
+            except OSError:
+                self.closed = True
+
+    def close(self):
+        self.send(encode_frame(OP_CLOSE, b"", mask=False))
+        self.closed = True
+
+
+def _make_handler(app: FakeComfyUI):
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import parse_qs, urlsplit
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        server_version = "FakeComfyUI"
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def setup(self):
+            super().setup()
+            app.connection_opened()
+
+        def finish(self):
+            try:
+                super().finish()
+            finally:
+                app.connection_closed()
+
+        def _json(self, status: int, body: Any):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _hold(self, endpoint: str, query: Dict[str, str]):
+            delay = app.response_delay(endpoint, query)
+            if delay > 0:
+                time.sleep(delay)
+
+        def _body(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            path = url.path.rstrip("/") or "/"
+            endpoint = f"GET /{path.split('/')[1]}"
+            app.count(endpoint)
+
+            if path == "/ws":
+                return self._websocket(query.get("clientId", ""))
+            self._hold(endpoint, query)
+            if path == "/system_stats":
+                return self._json(200, app.system_stats())
+            if path == "/object_info":
+                return self._json(200, app.node_schema())
+            if path == "/queue":
+                return self._json(200, app.queue_snapshot())
+            if path == "/history":
+                max_items = int(query["max_items"]) if "max_items" in query else None
+                return self._json(200, app.history(max_items=max_items))
+            if path.startswith("/history/"):
+                return self._json(200, app.history(prompt_id=path.split("/", 2)[2]))
+            if path == "/view":
+                data = app.image(query.get("filename", ""), query.get("subfolder", ""),
+                                 query.get("type", "output"))
+                if data is None:
+                    return self._json(404, {"error": "image not found"})
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            if path == "/fake/stats":
+                return self._json(200, {**app.stats, "timings": app.timings})
+            self._json(404, {"error": f"unknown endpoint {path}"})
+
+        def do_POST(self):
+            path = urlsplit(self.path).path.rstrip("/")
+            endpoint = f"POST {path}"
+            app.count(endpoint)
+            try:
+                body = self._body()
+            except ValueError:
+                return self._json(400, {"error": "invalid JSON"})
+            self._hold(endpoint, {})
+
+            if path == "/prompt":
+                return self._json(*app.submit(body))
+            if path == "/history":
+                app.delete_history(None if body.get("clear") else body.get("delete", []))
+                return self._json(200, {})
+            if path == "/queue":
+                app.delete_queued(None if body.get("clear") else body.get("delete", []))
+                return self._json(200, {})
+            if path == "/interrupt":
+                app.interrupt()
+                return self._json(200, {})
+            self._json(404, {"error": f"unknown endpoint {path}"})
+
+        def _websocket(self, client_id: str):
+            key = self.headers.get("Sec-WebSocket-Key")
+            if not key or self.headers.get("Upgrade", "").lower() != "websocket":
+                return self._json(400, {"error": "websocket upgrade required"})
+            self.send_response(101)
+            self.send_header("Upgrade", "websocket")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Sec-WebSocket-Accept", ws_accept_key(key))
+            self.end_headers()
+            self.wfile.flush()
+
+            connection = _WebSocketConnection(self)
+            app.add_socket(client_id, connection)
+            connection.send(encode_frame(OP_TEXT, json.dumps({
+                "type": "status", "data": {"status": {"exec_info": {"queue_remaining": 0}}, "sid": client_id}
+            }).encode("utf-8"), mask=False))
+            try:
+                while not connection.closed:
+                    _, opcode, _ = read_frame(self.rfile)
+                    if opcode == OP_CLOSE:
+                        break
+            except (OSError, ConnectionError):
+                pass
+            finally:
+                app.remove_socket(client_id, connection)
+                connection.closed = True
+                self.close_connection = True
+
+    return Handler
+
+
+def main():
+    import argparse
+
+    defaults = FakeSettings()
+    parser = argparse.ArgumentParser(description="Run a fake ComfyUI server for tests and load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8190)
+    parser.add_argument("--load-seconds", type=float, default=defaults.load_seconds,
+                        help="Checkpoint load time")
+    parser.add_argument("--encode-seconds", type=float, default=defaults.encode_seconds,
+                        help="Time per text-encode node")
+    parser.add_argument("--step-seconds", type=float, default=defaults.step_seconds,
+                        help="Time per sampling step at 512x512, batch 1")
+    parser.add_argument("--decode-seconds", type=float, default=defaults.decode_seconds,
+                        help="VAE decode time per megapixel per image")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of prompts that fail")
+    parser.add_argument("--http-error-rate", type=float, default=0.0,
+                        help="Share of POST /prompt answered 503 without queueing")
+    parser.add_argument("--lost-response-rate", type=float, default=0.0,
+                        help="Share of POST /prompt queued but answered 502")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    settings = FakeSettings(load_seconds=args.load_seconds, encode_seconds=args.encode_seconds,
+                            step_seconds=args.step_seconds, decode_seconds=args.decode_seconds,
+                            fail_rate=args.fail_rate, http_error_rate=args.http_error_rate,
+                            lost_response_rate=args.lost_response_rate)
+    server = FakeComfyUI(settings, host=args.host, port=args.port).start()
+    logger.info(f"🧪 Fake ComfyUI listening on {server.url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        logger.info(f"📊 {server.stats['prompts']} prompt(s), {server.stats['connections']} connection(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,19 +5,11 @@ Combines character design with clean environment style for complete scene genera
 """
 
 import logging
-from datetime import datetime
-from config import get_config, get_output_path
-from comfyui_api import generate_image, check_server_status
-from utils import validate_seed
+from config import configure_logging
+from utils import validate_prompt_key, validate_seed
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
-# API Configuration
-COMFYUI_URL = get_config('COMFYUI_URL')
-
-
 # Integrated Scene Prompts - Character + Environment
 INTEGRATED_SCENES = {
     "scene1_awakening_integrated": {
@@ -116,108 +108,86 @@ INTEGRATED_PARAMS = {
     "n_iter": 2,
 }
 
-def create_integrated_prompt(base_prompt):
-    """Enhanced prompt for integrated character + environment"""
-    style_modifiers = """
+# Shared blocks added to every integrated scene (encoded once per batch)
+INTEGRATED_STYLE_MODIFIERS = """
     masterpiece, best quality, clean vector illustration, geometric character design,
     architectural interior design, bold graphic style, consistent visual language,
     """
-    
-    return f"{style_modifiers} {base_prompt}"
 
-def create_integrated_negative(base_negative):
-    """Enhanced negative for clean integrated scenes"""
-    prevention_terms = """
+INTEGRATED_PREVENTION_TERMS = """
     inconsistent art styles, mixed techniques, realistic photography, detailed textures,
     complex shading, watercolor, painting style, soft gradients, anime, cartoon,
     """
-    
-    return f"{base_negative}, {prevention_terms}"
 
-def generate_integrated_scene(scene_key, custom_seed=None):
-    """Generate integrated character + environment scenes"""
-    # Validate inputs
+def create_integrated_prompt(base_prompt):
+    """Enhanced prompt for integrated character + environment"""
+    return f"{INTEGRATED_STYLE_MODIFIERS} {base_prompt}"
+
+def create_integrated_negative(base_negative):
+    """Enhanced negative for clean integrated scenes"""
+    return f"{base_negative}, {INTEGRATED_PREVENTION_TERMS}"
+
+def build_request(scene_key, seed=-1):
+    """Build generate_image() arguments for an integrated scene"""
     if not validate_prompt_key(scene_key):
         raise ValueError(f"Invalid scene key format: {scene_key}")
     
     if scene_key not in INTEGRATED_SCENES:
         raise KeyError(f"Unknown integrated scene: {scene_key}")
     
-    custom_seed = validate_seed(custom_seed)
-    
     scene_data = INTEGRATED_SCENES[scene_key]
     
-    # Enhanced prompts
-    prompt = create_integrated_prompt(scene_data["prompt"])
-    negative = create_integrated_negative(scene_data["negative"])
-    
-    payload = {
-        **INTEGRATED_PARAMS,
-        "prompt": prompt,
-        "negative_prompt": negative,
+    return {
+        # Enhanced prompts, shared blocks encoded separately
+        "prompt_prefix": INTEGRATED_STYLE_MODIFIERS,
+        "prompt": scene_data["prompt"],
+        "negative_prompt": scene_data["negative"],
+        "negative_suffix": INTEGRATED_PREVENTION_TERMS,
+        "width": INTEGRATED_PARAMS["width"],
+        "height": INTEGRATED_PARAMS["height"],
+        "steps": INTEGRATED_PARAMS["steps"],
+        "cfg_scale": INTEGRATED_PARAMS["cfg_scale"],
+        "sampler_name": INTEGRATED_PARAMS["sampler_name"],
+        "scheduler": INTEGRATED_PARAMS["scheduler"].lower(),
+        "seed": validate_seed(seed),
+        "batch_size": INTEGRATED_PARAMS["n_iter"],
     }
+
+def generate_integrated_scene(scene_key, custom_seed=None):
+    """Generate integrated character + environment scenes"""
+    from shot_runner import make_shots, run_shots
+
+    custom_seed = validate_seed(custom_seed)
+    seed = custom_seed if custom_seed else INTEGRATED_PARAMS["seed"]
     
-    if custom_seed:
-        payload["seed"] = custom_seed
+    # Validates the key before anything is logged
+    build_request(scene_key, seed)
+    scene_data = INTEGRATED_SCENES[scene_key]
     
     logger.info(f"\n🎬👤 Generating Integrated Scene: {scene_key}")
     logger.info(f"🎭 Style Note: {scene_data['style_note']}")
     logger.info(f"🎯 Integration: Character + Environment")
     
-    try:
-        images = generate_image(
-            prompt=payload["prompt"],
-            negative_prompt=payload["negative_prompt"],
-            width=payload["width"],
-            height=payload["height"],
-            steps=payload["steps"],
-            cfg_scale=payload["cfg_scale"],
-            sampler_name=payload["sampler_name"],
-            scheduler=payload["scheduler"].lower(),
-            seed=payload.get("seed", -1),
-            batch_size=payload.get("n_iter", 1),
-            timeout=300
-        )
-        
-        if images:
-            
-            # Save generated images
-            for i, image_data in enumerate(images):
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"generated_{timestamp}_v{i+1}.png"
-                filepath = get_output_path(filename)
-                
-                # Save image
-                image_bytes = image_data
-                with open(filepath, 'wb') as f:
-                    f.write(image_bytes)
-                
-                file_size = len(image_bytes) / 1024
-                logger.info(f"✅ Saved: {filename} ({file_size:.1f}KB)")
-            
-            # Generation complete
-            
-            logger.info(f"⚙️  Seed: {info.get('seed', 'Unknown')}")
-            logger.info(f"🎯 CFG Scale: {payload['cfg_scale']}")
-            
-            return True
-            
-        else:
-            logger.error(f"API Error: {response.status_code} - {response.text}")
-            return False
-            
-    except TimeoutError:
-        logger.error(f"API request timed out after 120s")
-        return False
-    except ConnectionError as e:
-        logger.error(f"Connection Error: {e}")
-        return False
-    except Exception as e:
-        logger.error(f"Request Error: {e}")
-        return False
-    except Exception as e:
-        logger.critical(f"Unexpected error: {e}", exc_info=True)
+    summary = run_shots(make_shots("integrated", [scene_key], seed=seed))
+    if summary["failed"]:
         return False
+    
+    logger.info(f"⚙️  Seed: {seed if seed != -1 else 'random'}")
+    logger.info(f"🎯 CFG Scale: {INTEGRATED_PARAMS['cfg_scale']}")
+    
+    return True
+
+def generate_integrated_scenes(scene_keys):
+    """Generate several integrated scenes through the shared runner"""
+    from shot_runner import make_shots, run_shots
+
+    try:
+        summary = run_shots(make_shots("integrated", scene_keys))
+    except (ValueError, KeyError) as e:
+        logger.error(f"Failed to plan integrated scenes: {e}")
+        return 0
+    
+    return summary["succeeded"]
 
 def generate_complete_scene1():
     """Generate complete Scene 1 with integrated character design"""
@@ -232,14 +202,8 @@ def generate_complete_scene1():
         "scene1_shadow_character"
     ]
     
-    success_count = 0
-    for shot in scene1_shots:
-        try:
-            if generate_integrated_scene(shot):
-                success_count += 1
-        except (ValueError, KeyError) as e:
-            logger.error(f"Failed to generate {shot}: {e}")
-        logger.info("-" * 40)
+    success_count = generate_integrated_scenes(scene1_shots)
+    logger.info("-" * 40)
     
     logger.info(f"\n📊 Scene 1 Integration Complete:")
     logger.info(f"✅ Successfully generated: {success_count}/{len(scene1_shots)} integrated scenes")
@@ -247,19 +211,14 @@ def generate_complete_scene1():
 def main():
     import sys
     
+    configure_logging()
     if len(sys.argv) > 1:
         command = sys.argv[1]
         if command == "scene1":
             generate_complete_scene1()
         elif command == "all":
             logger.info("Generating all integrated scenes...")
-            success = 0
-            for key in INTEGRATED_SCENES.keys():
-                try:
-                    if generate_integrated_scene(key):
-                        success += 1
-                except (ValueError, KeyError) as e:
-                    logger.error(f"Failed to generate {key}: {e}")
+            success = generate_integrated_scenes(list(INTEGRATED_SCENES))
             logger.info(f"Generated {success}/{len(INTEGRATED_SCENES)} integrated scenes")
         elif command in INTEGRATED_SCENES:
             custom_seed = None
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Shared job scheduler for DriftingMe generators
+Runs generation jobs concurrently with deduplication and resume support
+"""
+
+import json
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# ComfyUI executes one prompt at a time per GPU; a second in-flight job keeps
+# the server queue full while the previous job downloads and saves.
+DEFAULT_MAX_WORKERS = 2
+
+
+def job_key(payload: Dict[str, Any]) -> str:
+    """
+    Stable key for a job payload
+
+    Identical payloads get the same key, so they are only executed once.
+    """
+    import hashlib  # loads OpenSSL; deferred to keep generator startup fast
+
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def read_state(state_file: Optional[Path]) -> Dict[str, Any]:
+    """
+    Read completed job results from a JSONL state file
+
+    Returns:
+        Dict mapping job key to its recorded result
+    """
+    completed = {}
+    if not state_file or not Path(state_file).exists():
+        return completed
+
+    with open(state_file, "r", encoding="utf-8") as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+                completed[entry["key"]] = entry.get("result")
+            except (json.JSONDecodeError, KeyError):
+                # A crash mid-write leaves a truncated last line
+                logger.warning(f"Ignoring invalid line {line_num} in {state_file}")
+
+    return completed
+
+
+class JobScheduler:
+    """
+    Thread-pool scheduler shared by all shot loops
+
+    - Parallelism: up to max_workers jobs in flight at once
+    - Dedup: a job whose key is already submitted re-uses the existing future
+    - Resume: completed keys are appended to a JSONL state file and skipped
+      (returning the recorded result) when the same state file is used again
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS,
+                 state_file: Optional[Path] = None):
+        """
+        Args:
+            max_workers: Maximum number of concurrent jobs
+            state_file: Optional JSONL file used to resume interrupted runs
+        """
+        self.max_workers = max(1, max_workers)
+        self.state_file = Path(state_file) if state_file else None
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix="job")
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._completed = read_state(self.state_file)
+        if self._completed:
+            logger.info(f"🔁 Resuming: {len(self._completed)} completed job(s) in {self.state_file.name}")
+        self.stats = {"submitted": 0, "deduplicated": 0, "resumed": 0,
+                      "succeeded": 0, "failed": 0}
+
+    def _record(self, key: str, result: Any):
+        """Append a completed job to the state file"""
+        if not self.state_file:
+            return
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        entry = json.dumps({"key": key, "result": result, "time": time.time()}, default=str)
+        with self._lock, open(self.state_file, "a", encoding="utf-8") as f:
+            f.write(entry + "\n")
+
+    def _run(self, key: str, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.stats["failed"] += 1
+            raise
+
+        with self._lock:
+            self.stats["succeeded"] += 1
+            self._completed[key] = result
+        self._record(key, result)
+        return result
+
+    def completed_result(self, key: str) -> Any:
+        """Result recorded for a completed key, or None"""
+        with self._lock:
+            return self._completed.get(key)
+
+    def invalidate(self, key: str):
+        """Forget a completed key so the next submit runs it again"""
+        with self._lock:
+            self._completed.pop(key, None)
+            future = self._futures.get(key)
+            if future is not None and future.done():
+                del self._futures[key]
+
+    def submit(self, key: str, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Submit a job, unless it is a duplicate or already completed
+
+        Args:
+            key: Job key, see job_key()
+            fn: Callable doing the work; its return value must be JSON-serialisable
+                when a state file is used
+
+        Returns:
+            Future resolving to the job result
+        """
+        with self._lock:
+            if key in self._futures:
+                self.stats["deduplicated"] += 1
+                return self._futures[key]
+
+            if key in self._completed:
+                self.stats["resumed"] += 1
+                future = Future()
+                future.set_result(self._completed[key])
+                self._futures[key] = future
+                return future
+
+            self.stats["submitted"] += 1
+            future = self._executor.submit(self._run, key, fn, args, kwargs)
+            self._futures[key] = future
+            return future
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting jobs; without wait, queued jobs are cancelled"""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # On Ctrl+C don't wait for queued jobs; the state file lets us resume
+        self.shutdown(wait=exc_type is None)
+        return False
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Load Test
+Drives the generator code path against a fake ComfyUI and measures the client.
+
+Jobs are built from real prompt sets (resolve_request, prompt compiler,
+create_basic_workflow) and run through the JobScheduler and run_workflow,
+i.e. schema validation, idempotent submission, the shared history poller
+and image downloads. Images are downloaded but not saved, so the output
+store is untouched. By default an in-process fake server (fake_comfyui) is
+started; --url points the test at one running elsewhere.
+
+With --replay, a session recorded with COMFYUI_RECORD is re-served with
+its original timing (session_replay) and its recorded workflows are the
+jobs, so client and scheduler changes can be compared on a real workload.
+
+The report covers client throughput (jobs, images and MB per second),
+latency percentiles, client overhead (client completion minus the server's
+finish time, mostly poll interval), HTTP connections and requests seen by
+the server, and the peak RSS of the process.
+"""
+
+import sys
+import time
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from config import configure_logging, get_output_path, override_config, OUTPUT_DIR
+from comfyui_api import _urlopen, create_basic_workflow, get_poller, run_workflow
+from job_scheduler import JobScheduler, job_key
+from shot_runner import PROMPT_SETS, Shot, get_prompt_set, resolve_request
+
+logger = logging.getLogger(__name__)
+
+LOAD_TESTS_DIR = "load_tests"
+DEFAULT_JOBS = 40
+DEFAULT_CONCURRENCY = 4
+DEFAULT_PROMPT_SETS = ["character", "noir"]
+DEFAULT_STEPS = 8
+SEED_BASE = 5000
+
+
+def build_jobs(prompt_sets: List[str], count: int, steps: int, variations: int = 1,
+               seed_base: int = SEED_BASE) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Jobs cycling through every key of the prompt sets, one seed each
+
+    Each prompt key is resolved once through the generator's
+    build_request() and the prompt compiler; jobs differ by seed.
+
+    Returns:
+        (label, workflow) per job
+    """
+    resolved = []
+    for name in prompt_sets:
+        for key in get_prompt_set(name):
+            shot = Shot(id=f"load:{name}:{key}", prompt_set=name, key=key,
+                        overrides={"steps": steps, "variations": variations})
+            resolved.append((shot, resolve_request(shot)))
+    if not resolved:
+        raise ValueError("No prompts in the selected prompt sets")
+    jobs = []
+    for i in range(count):
+        shot, request = resolved[i % len(resolved)]
+        jobs.append((f"{shot.id}:{seed_base + i}", create_basic_workflow(**dict(request, seed=seed_base + i))))
+    return jobs
+
+
+def trace_jobs(trace) -> List[Tuple[str, Dict[str, Any]]]:
+    """The workflows a recorded session submitted, in order (see session_replay)"""
+    return [(prompt_id, prompt["workflow"]) for prompt_id, prompt in trace.prompts.items()]
+
+
+def run_job(workflow: Dict[str, Any], timeout: int) -> Dict[str, Any]:
+    """One generation as the shot runner does it, minus saving; returns timings and sizes"""
+    start = time.time()
+    outputs = run_workflow(workflow, timeout=timeout)
+    images = [image for node_images in outputs.values() for image in node_images]
+    if not images:
+        raise RuntimeError("No images returned")
+    return {"prompt_id": images[0].prompt_id, "start": start, "end": time.time(),
+            "images": len(images), "bytes": sum(len(image.data) for image in images)}
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p90/p99/max by nearest rank"""
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+    return {"p50": rank(50), "p90": rank(90), "p99": rank(99), "max": ordered[-1]}
+
+
+def fake_server_stats() -> Optional[Dict[str, Any]]:
+    """Counters of a fake_comfyui server, None for a real ComfyUI"""
+    import json
+    import urllib.error
+
+    try:
+        with _urlopen("/fake/stats", timeout=10) as response:
+            return json.loads(response.read().decode("utf-8"))
+    except (urllib.error.HTTPError, OSError, ValueError):
+        return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process (includes an in-process fake server)"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def load_test(jobs: List[Tuple[str, Dict[str, Any]]], concurrency: int = DEFAULT_CONCURRENCY,
+              timeout: int = 300) -> Dict[str, Any]:
+    """
+    Run the jobs through the scheduler and measure them
+
+    Returns:
+        Report with throughput, latency percentiles, client overhead,
+        server-side connection/request counts and peak RSS
+    """
+    results: List[Dict[str, Any]] = []
+    errors: Dict[str, int] = {}
+    start = time.time()
+    with JobScheduler(max_workers=concurrency) as scheduler:
+        futures = [scheduler.submit(job_key({"label": label, "workflow": workflow}), run_job, workflow, timeout)
+                   for label, workflow in jobs]
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                name = type(e).__name__
+                errors[name] = errors.get(name, 0) + 1
+                logger.debug(f"Job failed: {e}")
+    wall = time.time() - start
+
+    images = sum(r["images"] for r in results)
+    megabytes = sum(r["bytes"] for r in results) / 1e6
+    report: Dict[str, Any] = {
+        "jobs": len(jobs),
+        "succeeded": len(results),
+        "failed": len(jobs) - len(results),
+        "errors": errors,
+        "concurrency": concurrency,
+        "seconds": wall,
+        "jobs_per_second": len(results) / wall if wall else None,
+        "images_per_second": images / wall if wall else None,
+        "megabytes_per_second": megabytes / wall if wall else None,
+        "latency": percentiles([r["end"] - r["start"] for r in results]),
+        "poller": dict(get_poller().stats),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    server = fake_server_stats()
+    if server is not None:
+        timings = server.pop("timings", {})
+        finished = [(r, timings.get(r["prompt_id"], {})) for r in results]
+        report["queue_wait"] = percentiles([t["started"] - t["queued"] for _, t in finished
+                                            if "started" in t])
+        report["client_overhead"] = percentiles([r["end"] - t["finished"] for r, t in finished
+                                                 if "finished" in t])
+        report["server"] = server
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Human-readable summary of a load test report"""
+    def line(name: str, stats: Dict[str, Optional[float]]) -> str:
+        if stats["p50"] is None:
+            return f"{name:<16} n/a"
+        return (f"{name:<16} p50 {stats['p50']:.3f}s  p90 {stats['p90']:.3f}s  "
+                f"p99 {stats['p99']:.3f}s  max {stats['max']:.3f}s")
+
+    lines = [
+        f"Jobs             {report['succeeded']}/{report['jobs']} succeeded in {report['seconds']:.1f}s "
+        f"({report['concurrency']} concurrent)",
+        f"Throughput       {report['jobs_per_second']:.2f} jobs/s, {report['images_per_second']:.2f} images/s, "
+        f"{report['megabytes_per_second']:.2f} MB/s",
+        line("Latency", report["latency"]),
+    ]
+    if "server" in report:
+        server = report["server"]
+        lines += [
+            line("Queue wait", report["queue_wait"]),
+            line("Client overhead", report["client_overhead"]),
+            f"Connections      {server['connections']} opened, peak {server['peak_connections']} open",
+            "Requests         " + ", ".join(f"{name} {count}" for name, count
+                                            in sorted(server["requests"].items())),
+        ]
+        if "matched_exact" in server:
+            lines.append(f"Replay           {server['matched_exact']} exact, {server['matched_shape']} by shape, "
+                         f"{server['unmatched']} unmatched")
+    if report["errors"]:
+        lines.append("Errors           " + ", ".join(f"{name} {count}" for name, count
+                                                   in sorted(report["errors"].items())))
+    if report["peak_rss_mb"] is not None:
+        lines.append(f"Peak RSS         {report['peak_rss_mb']:.0f} MB")
+    return "\n".join(lines)
+
+
+def save_report(report: Dict[str, Any]) -> str:
+    """Write a report as JSON; returns its path relative to outputs/"""
+    import json
+    from datetime import datetime
+
+    path = f"{LOAD_TESTS_DIR}/load_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"
+    target = get_output_path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return path
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load-test the ComfyUI client against a fake server")
+    parser.add_argument("--url", help="Use a fake_comfyui server already running here "
+                                      "(default: start one in-process)")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="Number of generations")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Jobs in flight at once")
+    parser.add_argument("--prompt-sets", nargs="+", default=DEFAULT_PROMPT_SETS, choices=sorted(PROMPT_SETS))
+    parser.add_argument("--steps", type=int, default=DEFAULT_STEPS, help="Sampling steps per job")
+    parser.add_argument("--variations", type=int, default=1, help="Images per job")
+    parser.add_argument("--poll-interval", type=float, help="History poller interval in seconds "
+                                                            "(default: the client's own)")
+    parser.add_argument("--timeout", type=int, default=300, help="Per-job timeout in seconds")
+    parser.add_argument("--step-seconds", type=float, help="In-process server: time per sampling step")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="In-process server: failing prompts")
+    parser.add_argument("--http-error-rate", type=float, default=0.0,
+                        help="In-process server: POST /prompt answered 503")
+    parser.add_argument("--lost-response-rate", type=float, default=0.0,
+                        help="In-process server: POST /prompt queued but answered 502")
+    parser.add_argument("--replay", type=Path, metavar="TRACE",
+                        help="Replay a recorded session and submit its workflows (ignores --jobs etc.)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay this many times faster")
+    parser.add_argument("--save", action="store_true", help=f"Write the report to outputs/{LOAD_TESTS_DIR}/")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    server = None
+    trace = None
+    if args.replay:
+        from session_replay import ReplayComfyUI, SessionTrace
+
+        try:
+            trace = SessionTrace(args.replay)
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ Could not read {args.replay}: {e}")
+            sys.exit(1)
+        server = ReplayComfyUI(trace, speed=args.speed).start()
+        url = server.url
+    elif args.url:
+        url = args.url
+    else:
+        from fake_comfyui import FakeComfyUI, FakeSettings
+
+        settings = FakeSettings(fail_rate=args.fail_rate, http_error_rate=args.http_error_rate,
+                                lost_response_rate=args.lost_response_rate)
+        if args.step_seconds is not None:
+            settings = settings._replace(step_seconds=args.step_seconds)
+        server = FakeComfyUI(settings).start()
+        url = server.url
+    override_config("COMFYUI_URL", url)
+    if args.poll_interval:
+        get_poller().interval = args.poll_interval
+
+    try:
+        jobs = trace_jobs(trace) if trace else build_jobs(args.prompt_sets, args.jobs, args.steps,
+                                                           args.variations)
+    except (KeyError, ValueError) as e:
+        logger.error(f"❌ {e}")
+        sys.exit(1)
+
+    logger.info(f"🚦 {len(jobs)} job(s), {args.concurrency} concurrent, against {url}")
+    try:
+        report = load_test(jobs, concurrency=args.concurrency, timeout=args.timeout)
+    finally:
+        get_poller().stop()
+        if server is not None:
+            server.stop()
+    report["url"] = url
+    report["settings"] = {name: str(value) if isinstance(value, Path) else value
+                          for name, value in vars(args).items() if name != "url"}
+
+    print(format_report(report))
+    if args.save:
+        logger.info(f"📁 {OUTPUT_DIR / save_report(report)}")
+    if report["failed"] and not (args.fail_rate or args.http_error_rate):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Node Profiler
+Per-node-class execution profile from ComfyUI websocket events.
+
+Aggregates how long each node class ran across many prompts, how often
+ComfyUI served it from cache and, for samplers (any node reporting
+progress), the sampling rate in steps/s. Time is also broken down by latent
+resolution, since the costs that move with image size (VAE decode, image
+saving) are the ones that change which workflow optimisations pay off.
+Hotspots are flagged: non-sampler classes taking a large share of node
+time, overall or at one resolution, and checkpoints loaded more often than
+once.
+
+Profiles come from recordings of real runs, the sampler benchmark
+(benchmark_samplers adds one to its report) or live code:
+
+    profile = NodeProfile()
+    profile.add_workflow(workflow, trace.node_timings(workflow))
+    print(to_markdown(profile.report()))
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+from config import configure_logging, get_output_path, OUTPUT_DIR
+from comfyui_api import workflow_checkpoint
+
+logger = logging.getLogger(__name__)
+
+PROFILES_DIR = "profiles"
+# Expected to dominate; never flagged as hotspots
+SAMPLER_CLASSES = ("KSampler", "KSamplerAdvanced", "SamplerCustom", "SamplerCustomAdvanced")
+CHECKPOINT_LOADERS = ("CheckpointLoaderSimple", "CheckpointLoader", "unCLIPCheckpointLoader")
+# Share of executed node time above which a non-sampler class is a hotspot
+HOT_SHARE = 0.2
+# ... and flagged per resolution when its share there is this much above its overall share
+RESOLUTION_FACTOR = 1.25
+
+
+def latent_label(workflow: Dict[str, Any]) -> Optional[str]:
+    """'WxH' of a workflow's empty latent ('WxH xN' for batches), None without one"""
+    for node in workflow.values():
+        if node.get("class_type") == "EmptyLatentImage":
+            inputs = node.get("inputs", {})
+            width, height, batch = inputs.get("width"), inputs.get("height"), inputs.get("batch_size", 1)
+            if isinstance(width, int) and isinstance(height, int):
+                return f"{width}x{height}" + (f" x{batch}" if isinstance(batch, int) and batch > 1 else "")
+    return None
+
+
+def _new_stats() -> Dict[str, Any]:
+    return {"runs": 0, "cached": 0, "seconds": 0.0, "max": 0.0, "steps": 0, "step_time": 0.0}
+
+
+class NodeProfile:
+    """Node timings of many prompts, aggregated per node class"""
+
+    def __init__(self):
+        self.prompts = 0
+        self.classes: Dict[str, Dict[str, Any]] = {}
+        # latent label -> class_type -> {"runs", "seconds"}
+        self.resolutions: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.checkpoint_loads: Dict[str, int] = {}
+
+    def add(self, timings: Iterable[Dict[str, Any]], latent: Optional[str] = None,
+            checkpoint: Optional[str] = None):
+        """
+        Add one prompt
+
+        Args:
+            timings: PromptTrace.node_timings() entries
+            latent: Latent size label (see latent_label)
+            checkpoint: Checkpoint the prompt used
+        """
+        self.prompts += 1
+        for timing in timings:
+            class_type = timing.get("class_type") or "unknown"
+            stats = self.classes.setdefault(class_type, _new_stats())
+            if timing.get("cached"):
+                stats["cached"] += 1
+                continue
+            seconds = timing.get("seconds")
+            if seconds is None:
+                continue
+            stats["runs"] += 1
+            stats["seconds"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            if timing.get("steps") and timing.get("step_seconds"):
+                stats["steps"] += timing["steps"]
+                stats["step_time"] += timing["steps"] * timing["step_seconds"]
+            if latent:
+                by_class = self.resolutions.setdefault(latent, {})
+                entry = by_class.setdefault(class_type, {"runs": 0, "seconds": 0.0})
+                entry["runs"] += 1
+                entry["seconds"] += seconds
+            if class_type in CHECKPOINT_LOADERS:
+                name = checkpoint or "unknown"
+                self.checkpoint_loads[name] = self.checkpoint_loads.get(name, 0) + 1
+
+    def add_workflow(self, workflow: Dict[str, Any], timings: Iterable[Dict[str, Any]]):
+        """Add one prompt, taking its resolution and checkpoint from the workflow"""
+        self.add(timings, latent_label(workflow), workflow_checkpoint(workflow))
+
+    def hotspots(self) -> List[str]:
+        """Human-readable findings, most expensive first"""
+        findings = []
+        total = sum(stats["seconds"] for stats in self.classes.values())
+        for class_type, stats in sorted(self.classes.items(), key=lambda item: -item[1]["seconds"]):
+            if class_type not in SAMPLER_CLASSES and total and stats["seconds"] / total >= HOT_SHARE:
+                findings.append(f"{class_type} takes {stats['seconds'] / total:.0%} of node time "
+                                f"({stats['seconds'] / stats['runs']:.2f}s per run)")
+
+        for latent, by_class in self.resolutions.items() if len(self.resolutions) > 1 else ():
+            latent_total = sum(entry["seconds"] for entry in by_class.values())
+            for class_type, entry in by_class.items():
+                share = entry["seconds"] / latent_total if latent_total else 0
+                overall = self.classes[class_type]["seconds"] / total if total else 0
+                # Only worth a line of its own when the resolution makes it hotter
+                if (class_type not in SAMPLER_CLASSES and share >= HOT_SHARE
+                        and share >= overall * RESOLUTION_FACTOR):
+                    findings.append(f"{class_type} takes {share:.0%} of node time at {latent} "
+                                    f"({entry['seconds'] / entry['runs']:.2f}s per run)")
+
+        for checkpoint, loads in sorted(self.checkpoint_loads.items()):
+            if loads > 1:
+                findings.append(f"{checkpoint} was loaded {loads} times; group shots by checkpoint "
+                                f"or give ComfyUI more memory to keep it cached")
+        return findings
+
+    def report(self) -> Dict[str, Any]:
+        """Per-class table (most time first), per-resolution shares and hotspots"""
+        total = sum(stats["seconds"] for stats in self.classes.values())
+        classes = []
+        for class_type, stats in sorted(self.classes.items(), key=lambda item: -item[1]["seconds"]):
+            seen = stats["runs"] + stats["cached"]
+            classes.append({
+                "class_type": class_type,
+                "runs": stats["runs"],
+                "cached": stats["cached"],
+                "cache_hit_rate": stats["cached"] / seen if seen else None,
+                "seconds": stats["seconds"],
+                "share": stats["seconds"] / total if total else None,
+                "mean_seconds": stats["seconds"] / stats["runs"] if stats["runs"] else None,
+                "max_seconds": stats["max"],
+                "steps_per_second": stats["steps"] / stats["step_time"] if stats["step_time"] else None,
+            })
+        resolutions = {}
+        for latent, by_class in sorted(self.resolutions.items()):
+            latent_total = sum(entry["seconds"] for entry in by_class.values())
+            resolutions[latent] = {class_type: {"share": entry["seconds"] / latent_total if latent_total else None,
+                                                "mean_seconds": entry["seconds"] / entry["runs"]}
+                                   for class_type, entry in sorted(by_class.items(),
+                                                                   key=lambda item: -item[1]["seconds"])}
+        return {"prompts": self.prompts, "seconds": total, "classes": classes,
+                "resolutions": resolutions, "hotspots": self.hotspots()}
+
+
+def profile_session(path: Path, profile: Optional[NodeProfile] = None) -> NodeProfile:
+    """Profile a session trace recorded with COMFYUI_RECORD (needs its websocket events)"""
+    from comfyui_events import PromptTrace
+    from session_replay import SessionTrace
+
+    profile = profile or NodeProfile()
+    for prompt_id, prompt in SessionTrace(path).prompts.items():
+        if not prompt["events"]:
+            continue
+        trace = PromptTrace(prompt_id)
+        for t, event, data in sorted(prompt["events"], key=lambda e: e[0]):
+            trace.record(t, event, data)
+        profile.add_workflow(prompt["workflow"], trace.node_timings(prompt["workflow"]))
+    return profile
+
+
+def profile_run_trace(path: Path, profile: Optional[NodeProfile] = None) -> NodeProfile:
+    """Profile a run trace written with TRACE_DIR (run_trace)"""
+    with open(path, encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+
+    prompts: Dict[str, Dict[str, Any]] = {}
+    for event in events:
+        args = event.get("args", {})
+        prompt_id = args.get("prompt_id")
+        if not prompt_id or event.get("cat") not in ("prompt", "node"):
+            continue
+        prompt = prompts.setdefault(prompt_id, {"latent": None, "checkpoint": None, "timings": []})
+        if event["cat"] == "prompt":
+            prompt.update(latent=args.get("latent"), checkpoint=args.get("checkpoint"))
+        elif event["ph"] == "i":
+            prompt["timings"].append({"class_type": event["name"].removesuffix(" (cached)"),
+                                      "cached": True, "seconds": 0.0})
+        else:
+            prompt["timings"].append({"class_type": event["name"], "cached": False,
+                                      "seconds": event["dur"] / 1e6, "steps": args.get("steps", 0),
+                                      "step_seconds": args.get("step_seconds")})
+
+    profile = profile or NodeProfile()
+    for prompt in prompts.values():
+        profile.add(prompt["timings"], prompt["latent"], prompt["checkpoint"])
+    return profile
+
+
+def _fmt(value: Optional[float], spec: str) -> str:
+    return "n/a" if value is None else format(value, spec)
+
+
+def to_markdown(report: Dict[str, Any], title: str = "Node profile") -> str:
+    """Markdown tables of a report"""
+    lines = [
+        f"## {title}",
+        "",
+        f"{report['prompts']} prompt(s), {report['seconds']:.1f}s of node execution",
+        "",
+        "| Node class | Runs | Cached | Cache hit | Total s | Share | Mean s | Max s | Steps/s |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    for row in report["classes"]:
+        lines.append(f"| {row['class_type']} | {row['runs']} | {row['cached']} "
+                     f"| {_fmt(row['cache_hit_rate'], '.0%')} | {row['seconds']:.2f} "
+                     f"| {_fmt(row['share'], '.1%')} | {_fmt(row['mean_seconds'], '.3f')} "
+                     f"| {row['max_seconds']:.3f} | {_fmt(row['steps_per_second'], '.2f')} |")
+    if len(report["resolutions"]) > 1:
+        lines += ["", "| Resolution | Top classes by share of node time |", "|---|---|"]
+        for latent, by_class in report["resolutions"].items():
+            top = ", ".join(f"{class_type} {_fmt(entry['share'], '.0%')}"
+                            for class_type, entry in list(by_class.items())[:4])
+            lines.append(f"| {latent} | {top} |")
+    lines += ["", "### Hotspots", ""]
+    lines += [f"- {finding}" for finding in report["hotspots"]] or ["- None"]
+    return "\n".join(lines) + "\n"
+
+
+def save_report(report: Dict[str, Any], name: str) -> List[str]:
+    """Write a report as JSON and Markdown; returns both paths relative to outputs/"""
+    saved = []
+    for suffix, text in ((".json", json.dumps(report, indent=2)), (".md", to_markdown(report))):
+        target = get_output_path(f"{PROFILES_DIR}/{name}{suffix}")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(text, encoding="utf-8")
+        saved.append(f"{PROFILES_DIR}/{name}{suffix}")
+    return saved
+
+
+def main():
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Profile ComfyUI node execution from recorded runs")
+    parser.add_argument("traces", nargs="+", type=Path,
+                        help="Run traces (*.trace.json, TRACE_DIR) or session traces (COMFYUI_RECORD)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--save", action="store_true", help=f"Save the report under outputs/{PROFILES_DIR}/")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    profile = NodeProfile()
+    for path in args.traces:
+        prompts = profile.prompts
+        try:
+            if path.name.endswith(".trace.json"):
+                profile_run_trace(path, profile)
+            else:
+                profile_session(path, profile)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"❌ Could not read {path}: {e}")
+            sys.exit(1)
+        if profile.prompts == prompts:
+            logger.warning(f"⚠️  {path} has no node timings (was the websocket connected?)")
+
+    report = profile.report()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(to_markdown(report))
+    if args.save:
+        for path in save_report(report, args.traces[0].name.split(".")[0]):
+            logger.info(f"📁 {OUTPUT_DIR / path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,17 +7,17 @@ Advanced script for generating noir-style images using ComfyUI API with optimize
 import os
 import argparse
 import logging
-from datetime import datetime
-from config import get_config
-from comfyui_api import generate_image, check_server_status
+from config import configure_logging, get_output_path, OUTPUT_DIR
+from comfyui_api import create_batch_workflow, random_seed, run_workflow
+from job_scheduler import job_key
+from output_retention import record_retrieved
+from output_store import new_output_id
+from output_writer import get_writer
+import run_metrics
+from utils import validate_seed
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
-# API Configuration
-COMFYUI_URL = get_config('COMFYUI_URL')
-
 # Noir presets based on the guide
 NOIR_SCENES = {
     "detective": {
@@ -66,8 +66,40 @@ def get_dimensions(aspect_ratio):
     else:
         return 512, 512
 
-def generate_noir_image(scene_type, custom_prompt=None, seed=-1, output_dir="outputs"):
-    """Generate a noir-style image using ComfyUI API"""
+def build_request(scene_type, seed=-1):
+    """Build generate_image() arguments for a predefined noir scene"""
+    if scene_type not in NOIR_SCENES:
+        raise KeyError(f"Unknown scene type: {scene_type}. Available: {list(NOIR_SCENES.keys())}")
+    
+    width, height = get_dimensions(NOIR_SCENES[scene_type]["aspect"])
+    
+    return {
+        "prompt": NOIR_SCENES[scene_type]["prompt"],
+        "negative_prompt": NOIR_NEGATIVE,
+        "width": width,
+        "height": height,
+        "steps": NOIR_SETTINGS["steps"],
+        "cfg_scale": NOIR_SETTINGS["cfg_scale"],
+        "sampler_name": NOIR_SETTINGS["sampler_name"],
+        "scheduler": NOIR_SETTINGS["scheduler"].lower(),
+        "seed": validate_seed(seed),
+        "batch_size": 1,
+    }
+
+def generate_noir_images(scene_type, custom_prompt=None, seed=-1, output_dir=None, count=1):
+    """
+    Generate noir-style images using ComfyUI API
+
+    The images are rendered as one workflow with a sampler per seed, so the
+    checkpoint is loaded and the prompts are encoded once for all of them.
+    Seeds are seed, seed + 1, ... (random when seed is -1).
+
+    Images go to the output store and its manifest unless output_dir is given,
+    in which case they are written there under a unique name.
+
+    Returns:
+        One result dict per image, in seed order
+    """
     
     if scene_type not in NOIR_SCENES and not custom_prompt:
         raise ValueError(f"Unknown scene type: {scene_type}. Available: {list(NOIR_SCENES.keys())}")
@@ -83,107 +115,135 @@ def generate_noir_image(scene_type, custom_prompt=None, seed=-1, output_dir="out
         width, height = get_dimensions(scene["aspect"])
         scene_name = scene_type
     
+    seeds = [random_seed() if seed == -1 else seed + i for i in range(count)]
+    
     logger.info(f"🎬 Generating noir scene: {scene_name}")
     logger.info(f"📐 Dimensions: {width}x{height}")
-    logger.info(f"🎯 Seed: {seed if seed != -1 else 'random'}")
+    logger.info(f"🎯 Seed(s): {', '.join(map(str, seeds))}")
+    
+    requests = [{
+        "prompt": prompt,
+        "negative_prompt": NOIR_NEGATIVE,
+        "width": width,
+        "height": height,
+        "seed": image_seed,
+        "steps": NOIR_SETTINGS["steps"],
+        "cfg_scale": NOIR_SETTINGS["cfg_scale"],
+        "sampler_name": NOIR_SETTINGS["sampler_name"],
+        "scheduler": NOIR_SETTINGS["scheduler"].lower(),
+        "batch_size": 1,
+    } for image_seed in seeds]
     
     try:
         # Generate using ComfyUI
-        images = generate_image(
-            prompt=prompt,
-            negative_prompt=NOIR_NEGATIVE,
-            width=width,
-            height=height,
-            seed=seed,
-            steps=NOIR_SETTINGS["steps"],
-            cfg_scale=NOIR_SETTINGS["cfg_scale"],
-            sampler_name=NOIR_SETTINGS["sampler_name"],
-            scheduler=NOIR_SETTINGS["scheduler"].lower(),
-            batch_size=1,
-            timeout=180
-        )
-        
-        if images:
-            # Save the generated image
-            image_data = images[0]
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"noir_{scene_name}_{timestamp}.png"
-            filepath = os.path.join(output_dir, filename)
-            
-            os.makedirs(output_dir, exist_ok=True)
-            with open(filepath, 'wb') as f:
-                f.write(image_data)
-            
-            file_size = len(image_data) / 1024
-            logger.info(f"✅ Generation successful!")
-            logger.info(f"💾 Saved: {filename} ({file_size:.1f}KB)")
-            logger.info(f"⚙️  Steps: {NOIR_SETTINGS['steps']}")
-            
-            return {
-                'success': True,
-                'filename': filename,
-                'filepath': filepath,
-                'seed': seed,
-            }
-        else:
-            logger.error("❌ No images generated")
-            return {'success': False, 'error': 'No images in response'}
-            
+        workflow, save_ids = create_batch_workflow(requests)
+        with run_metrics.labelled(family="noir"):
+            outputs = run_workflow(workflow, timeout=180 * count)
     except TimeoutError:
-        logger.error(f"❌ Generation timeout after 180s")
-        return {'success': False, 'error': 'Timeout'}
+        logger.error(f"❌ Generation timeout after {180 * count}s")
+        return [{'success': False, 'error': 'Timeout'}] * count
     except Exception as e:
         logger.error(f"❌ Generation error: {e}")
-        return {'success': False, 'error': str(e)}
-        print(f"❌ Generation error: {e}")
-        return {'success': False, 'error': str(e)}
+        return [{'success': False, 'error': str(e)}] * count
+    
+    results = []
+    for request, node_id in zip(requests, save_ids):
+        images = outputs.get(node_id, [])
+        if not images:
+            logger.error(f"❌ No image generated for seed {request['seed']}")
+            results.append({'success': False, 'error': 'No images in response'})
+            continue
+        
+        # Save the generated image
+        image = images[0]
+        name = f"noir_{scene_name}"
+        try:
+            if output_dir:
+                filepath = os.path.join(output_dir, f"{name}_{new_output_id()[:12]}.png")
+                os.makedirs(output_dir, exist_ok=True)
+                with open(filepath, 'wb') as f:
+                    f.write(image.data)
+                record_retrieved([image])
+            else:
+                # Saved in the background by the output writer
+                path = get_writer().submit(image.data, name, {
+                    "scene": scene_name,
+                    "prompt_set": "noir",
+                    "seed": request["seed"],
+                    "params": request,
+                    "workflow_hash": job_key(workflow),
+                }, retrieved=[image])
+                filepath = str(get_output_path(path))
+        except Exception as e:
+            logger.error(f"❌ Could not save seed {request['seed']}: {e}")
+            results.append({'success': False, 'error': str(e)})
+            continue
+        
+        file_size = len(image.data) / 1024
+        logger.info(f"✅ Generation successful!")
+        logger.info(f"💾 {filepath} ({file_size:.1f}KB)")
+        logger.info(f"⚙️  Steps: {NOIR_SETTINGS['steps']}")
+        
+        results.append({
+            'success': True,
+            'filename': os.path.basename(filepath),
+            'filepath': filepath,
+            'seed': request["seed"],
+        })
+    return results
 
 def main():
+    from shot_runner import make_shots, run_shots
+
     parser = argparse.ArgumentParser(description="Generate noir-style images")
     parser.add_argument("--scene", choices=list(NOIR_SCENES.keys()), 
                        help="Predefined scene type")
     parser.add_argument("--prompt", type=str, 
                        help="Custom prompt (overrides scene)")
     parser.add_argument("--seed", type=int, default=-1,
-                       help="Seed for reproducible generation")
-    parser.add_argument("--output", type=str, default="outputs",
-                       help="Output directory")
+                       help="Seed for reproducible generation (a batch uses seed, seed+1, ...)")
+    parser.add_argument("--output", type=str,
+                       help="Output directory instead of the output store (custom prompts only)")
     parser.add_argument("--batch", type=int, default=1,
                        help="Number of images to generate")
     parser.add_argument("--all-scenes", action="store_true",
                        help="Generate all predefined scenes")
     
     args = parser.parse_args()
+    if args.output and not args.prompt:
+        parser.error("--output only applies to --prompt; scenes are saved to the output store")
     
+    configure_logging()
     print("🎬 DriftingMe Noir Generator")
     print("=" * 50)
     
-    results = []
+    if args.prompt:
+        # One workflow for the whole batch: the prompts are encoded once
+        results = generate_noir_images(args.scene, custom_prompt=args.prompt, seed=args.seed,
+                                       output_dir=args.output, count=args.batch)
+        get_writer().flush()
+        successful = sum(1 for r in results if r['success'])
+        total = len(results)
+        output_dir = args.output or OUTPUT_DIR
     
-    if args.all_scenes:
-        print("🎯 Generating all noir scenes...")
-        for scene_type in NOIR_SCENES.keys():
-            for i in range(args.batch):
-                print(f"\n📷 Scene {scene_type} ({i+1}/{args.batch})")
-                result = generate_noir_image(scene_type, seed=args.seed, 
-                                           output_dir=args.output)
-                results.append(result)
-    
-    elif args.scene or args.prompt:
-        for i in range(args.batch):
-            print(f"\n📷 Generation {i+1}/{args.batch}")
-            result = generate_noir_image(args.scene, custom_prompt=args.prompt,
-                                       seed=args.seed, output_dir=args.output)
-            results.append(result)
+    elif args.all_scenes or args.scene:
+        scenes = list(NOIR_SCENES) if args.all_scenes else [args.scene]
+        if args.all_scenes:
+            print("🎯 Generating all noir scenes...")
+        
+        # Batches render as variations of one shot instead of separate requests
+        summary = run_shots(make_shots("noir", scenes, seed=args.seed, variations=args.batch))
+        successful = len(summary["files"])
+        total = len(scenes) * args.batch
+        output_dir = OUTPUT_DIR
     else:
         print("❌ Please specify --scene, --prompt, or --all-scenes")
         return
     
     # Summary
-    successful = sum(1 for r in results if r['success'])
     print(f"\n🎯 Generation Summary:")
-    print(f"✅ Successful: {successful}/{len(results)}")
-    print(f"📁 Output directory: {args.output}")
+    print(f"✅ Successful: {successful}/{total}")
+    print(f"📁 Output directory: {output_dir}")
     
     if successful > 0:
         print("\n🎉 Noir images generated successfully!")
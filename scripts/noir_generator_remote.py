@@ -4,15 +4,17 @@ DriftingMe Remote Noir Generator
 Advanced script for generating noir-style images using ComfyUI API on remote host.
 """
 
-import os
 import logging
 import argparse
-from datetime import datetime
-from config import get_config
-from comfyui_api import generate_image, check_server_status
+from config import configure_logging, get_output_path, override_config
+from comfyui_api import (check_server_status, create_basic_workflow, get_server_url,
+                         random_seed, run_workflow)
+from job_scheduler import job_key
+from output_retention import record_retrieved
+from output_store import get_store
+import run_metrics
 
-# Remote API Configuration 
-COMFYUI_URL = get_config('COMFYUI_URL')
+logger = logging.getLogger(__name__)
 
 # Noir presets based on the guide
 NOIR_SCENES = {
@@ -69,28 +71,24 @@ def get_aspect_dimensions(aspect, base_size=1024):
         return base_size, base_size
 
 def wait_for_api_ready(max_attempts=30, delay=10):
-    """Wait for the A1111 API to be ready"""
+    """Wait for the ComfyUI API to be ready"""
     import time
     
-    logger.info(f"🔄 Waiting for A1111 API at {COMFYUI_URL}...")
+    logger.info(f"🔄 Waiting for ComfyUI API at {get_server_url()}...")
     
     for attempt in range(max_attempts):
-        try:
-            response = requests.get(f"{COMFYUI_URL}/sdapi/v1/options", timeout=5)
-            if response.status_code == 200:
-                logger.info("✅ A1111 API is ready!")
-                return True
-        except Exception:
-            pass
+        if check_server_status():
+            logger.info("✅ ComfyUI API is ready!")
+            return True
         
         logger.info(f"⏳ Attempt {attempt + 1}/{max_attempts} - waiting {delay}s...")
         time.sleep(delay)
     
-    logger.info(f"❌ A1111 API not ready after {max_attempts * delay} seconds")
+    logger.info(f"❌ ComfyUI API not ready after {max_attempts * delay} seconds")
     return False
 
 def generate_noir_image(scene_type="detective", seed=-1, custom_prompt=None):
-    """Generate a noir-style image"""
+    """Generate a noir-style image and record it in the output manifest"""
     
     if not wait_for_api_ready():
         return None
@@ -105,71 +103,52 @@ def generate_noir_image(scene_type="detective", seed=-1, custom_prompt=None):
         # Custom scene
         prompt = custom_prompt or scene_type
         width, height = get_aspect_dimensions("portrait")  # Default to portrait
-        scene_name = scene_type
+        scene_name = "custom"
     
-    # Create payload
-    payload = {
+    if seed == -1:
+        seed = random_seed()
+    
+    # Only the sampling settings apply to ComfyUI; the hires-fix and face
+    # restoration keys are A1111 options
+    request = {
         "prompt": prompt,
         "negative_prompt": NOIR_NEGATIVE,
         "width": width,
         "height": height,
         "seed": seed,
-        **NOIR_SETTINGS
+        "steps": NOIR_SETTINGS["steps"],
+        "cfg_scale": NOIR_SETTINGS["cfg_scale"],
+        "sampler_name": NOIR_SETTINGS["sampler_name"],
+        "scheduler": NOIR_SETTINGS["scheduler"],
     }
     
     logger.info(f"🎬 Generating noir scene: {scene_name}")
     logger.info(f"📐 Dimensions: {width}x{height}")
-    logger.info(f"🎯 Seed: {seed if seed != -1 else 'random'}")
+    logger.info(f"🎯 Seed: {seed}")
     
     try:
-        response = requests.post(f"{COMFYUI_URL}/sdapi/v1/txt2img", json=payload, timeout=120)
+        workflow = create_basic_workflow(**request)
+        with run_metrics.labelled(family="noir_remote"):
+            outputs = run_workflow(workflow, timeout=120)
+        images = [image for node_images in outputs.values() for image in node_images]
         
-        if images:
-            
-            # Save the image
-            if result['images']:
-                # Decode base64 image
-                image_data = base64.b64decode(result['images'][0])
-                
-                # Create filename with timestamp
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"noir_{scene_name}_{timestamp}.png"
-                filepath = os.path.join("outputs", filename)
-                
-                # Ensure outputs directory exists
-                os.makedirs("outputs", exist_ok=True)
-                
-                # Save image
-                with open(filepath, "wb") as f:
-                    f.write(image_data)
-                
-                logger.info(f"✅ Image saved: {filepath}")
-                
-                # Save generation info
-                info_file = filepath.replace('.png', '_info.json')
-                generation_info = {
-                    "scene_type": scene_name,
-                    "prompt": prompt,
-                    "negative_prompt": NOIR_NEGATIVE,
-                    "settings": NOIR_SETTINGS,
-                    "dimensions": {"width": width, "height": height},
-                    "seed": result.get('parameters', {}).get('seed', seed),
-                    "timestamp": timestamp,
-                    "api_url": COMFYUI_URL
-                }
-                
-                with open(info_file, 'w') as f:
-                    json.dump(generation_info, f, indent=2)
-                
-                logger.info(f"📄 Generation info saved: {info_file}")
-                return filepath
-            else:
-                logger.info("❌ No images returned from API")
-                return None
-        else:
-            logger.info(f"❌ API request failed with status {response.status_code}")
-            logger.info(f"Response: {response.text}")
+        if not images:
+            logger.info("❌ No images returned from API")
             return None
+        
+        # Generation info goes to the manifest instead of an _info.json sidecar
+        stored = get_store().save(images[0].data, f"noir_{scene_name}", {
+            "scene": scene_name,
+            "prompt_set": "noir_remote",
+            "seed": seed,
+            "params": {**request, "server": get_server_url()},
+            "workflow_hash": job_key(workflow),
+        })
+        record_retrieved(images[:1])
+        
+        filepath = str(get_output_path(stored["path"]))
+        logger.info(f"✅ Image saved: {filepath}")
+        return filepath
             
     except TimeoutError:
         logger.info("❌ Request timed out. The image generation might be taking longer than expected.")
@@ -190,17 +169,21 @@ def main():
                        type=int, default=-1,
                        help="Seed for reproducible generation (-1 for random)")
     parser.add_argument("--api-url", "-u",
-                       default="http://localhost:7860",
-                       help="A1111 API URL")
+                       help="ComfyUI API URL (default: COMFYUI_URL)")
     parser.add_argument("--list-scenes", "-l",
                        action="store_true",
                        help="List available scene types")
     
     args = parser.parse_args()
     
-    # Update API URL from argument or environment
-    global COMFYUI_URL
-    COMFYUI_URL = os.environ.get('COMFYUI_URL', args.api_url)
+    configure_logging()
+    
+    # Wins over COMFYUI_URL in .env and the environment
+    if args.api_url:
+        try:
+            override_config('COMFYUI_URL', args.api_url)
+        except ValueError as e:
+            parser.error(str(e))
     
     if args.list_scenes:
         logger.info("Available noir scenes:")
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Noir Grading
+CPU post-process that turns one render into several noir looks.
+
+The style guide asks for pure black and white, hard shadows and venetian-blind
+stripes; instead of chasing that with prompt tweaks and 25-30 step re-renders,
+the looks are applied to finished images. Every operation is vectorized with
+NumPy over a whole batch (N, H, W), so a batch is converted to luminance once
+and each look costs a few array passes:
+
+    desaturate -> levels -> contrast curve -> blinds / threshold / posterize / halftone
+
+Looks are lists of (operation, parameters) in LOOKS; sizes and periods are
+fractions of the image height so a look behaves the same at any resolution.
+"""
+
+import os
+import sys
+import time
+import logging
+from pathlib import Path
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+from config import configure_logging, get_output_path, OUTPUT_DIR
+from output_store import derivative_row, get_store
+
+logger = logging.getLogger(__name__)
+
+GRADED_DIR = "graded"
+
+# Rec. 709 luma weights
+LUMA_WEIGHTS = (0.2126, 0.7152, 0.0722)
+
+LOOKS: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {
+    "noir_contrast": [
+        ("levels", {"black": 0.05, "white": 0.9, "gamma": 0.9}),
+        ("contrast", {"strength": 6.0}),
+    ],
+    "hard_ink": [
+        ("levels", {"black": 0.08, "white": 0.85}),
+        ("contrast", {"strength": 8.0}),
+        ("threshold", {"level": 0.5}),
+    ],
+    "blinds": [
+        ("levels", {"black": 0.05, "white": 0.9}),
+        ("contrast", {"strength": 6.0}),
+        ("blinds", {"angle": -12.0, "period": 0.06, "duty": 0.45, "strength": 0.85}),
+    ],
+    "blinds_ink": [
+        ("levels", {"black": 0.05, "white": 0.9}),
+        ("contrast", {"strength": 6.0}),
+        ("blinds", {"angle": -12.0, "period": 0.06, "duty": 0.45, "strength": 0.9}),
+        ("threshold", {"level": 0.45}),
+    ],
+    "posterize": [
+        ("levels", {"black": 0.05, "white": 0.9}),
+        ("posterize", {"levels": 4}),
+    ],
+    "halftone": [
+        ("levels", {"black": 0.05, "white": 0.9}),
+        ("contrast", {"strength": 4.0}),
+        ("halftone", {"cell": 0.008, "angle": 45.0}),
+    ],
+}
+
+
+def desaturate(batch):
+    """(N, H, W, C) uint8 or float -> (N, H, W) float32 luminance in [0, 1]"""
+    import numpy as np
+
+    batch = np.asarray(batch)
+    scale = 1 / 255 if batch.dtype == np.uint8 else 1.0
+    if batch.ndim == 3:  # already single-channel
+        return batch.astype(np.float32) * scale
+    weights = np.asarray(LUMA_WEIGHTS, dtype=np.float32) * scale
+    return batch[..., :3].astype(np.float32) @ weights
+
+
+def levels(lum, black: float = 0.0, white: float = 1.0, gamma: float = 1.0):
+    """Map [black, white] to [0, 1], then apply a gamma curve"""
+    import numpy as np
+
+    out = np.clip((lum - black) / max(white - black, 1e-6), 0.0, 1.0)
+    if gamma != 1.0:
+        out = out ** (1.0 / gamma)
+    return out
+
+
+def contrast(lum, strength: float = 6.0, pivot: float = 0.5):
+    """Sigmoid S-curve through `pivot`, rescaled so 0 and 1 stay fixed"""
+    import numpy as np
+
+    low = 1 / (1 + np.exp(strength * pivot))
+    high = 1 / (1 + np.exp(-strength * (1 - pivot)))
+    curve = 1 / (1 + np.exp(-strength * (lum - pivot)))
+    return ((curve - low) / (high - low)).astype(np.float32)
+
+
+def threshold(lum, level: float = 0.5):
+    """Pure black and white"""
+    import numpy as np
+
+    return (lum >= level).astype(np.float32)
+
+
+def posterize(lum, levels: int = 4):
+    """Quantize to `levels` flat grey bands"""
+    import numpy as np
+
+    steps = max(levels - 1, 1)
+    return np.round(lum * steps) / steps
+
+
+@lru_cache(maxsize=16)
+def _rotated_coords(height: int, width: int, angle: float):
+    """
+    Pixel coordinates rotated by angle degrees, as two read-only (H, W) arrays
+
+    Cached: batches of one size reuse the grid instead of rebuilding it per look.
+    """
+    import numpy as np
+
+    theta = np.deg2rad(angle)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    u = x * np.float32(np.cos(theta)) + y * np.float32(np.sin(theta))
+    v = -x * np.float32(np.sin(theta)) + y * np.float32(np.cos(theta))
+    u.flags.writeable = v.flags.writeable = False
+    return u, v
+
+
+@lru_cache(maxsize=16)
+def _screen_distance(height: int, width: int, size: float, angle: float):
+    """Distance of each pixel from its halftone dot centre, in cell units"""
+    import numpy as np
+
+    u, v = _rotated_coords(height, width, angle)
+    fu = (u / size) % 1.0 - 0.5
+    fv = (v / size) % 1.0 - 0.5
+    distance = np.sqrt(fu * fu + fv * fv)
+    distance.flags.writeable = False
+    return distance
+
+
+def blinds(lum, angle: float = -12.0, period: float = 0.06, duty: float = 0.45,
+           strength: float = 0.85, softness: float = 0.08, offset: float = 0.0):
+    """
+    Overlay venetian-blind shadow stripes
+
+    Args:
+        angle: Stripe tilt in degrees (0: horizontal)
+        period: Stripe spacing as a fraction of the image height
+        duty: Fraction of each period in shadow
+        strength: How dark the shadow bands are (1: black)
+        softness: Edge ramp as a fraction of the period (0: hard edges)
+        offset: Phase shift in periods
+    """
+    height, width = lum.shape[-2:]
+    return lum * _blind_mask(height, width, angle, period * height, duty, strength, softness, offset)
+
+
+@lru_cache(maxsize=16)
+def _blind_mask(height: int, width: int, angle: float, period: float, duty: float,
+                strength: float, softness: float, offset: float):
+    """Multiplier of the blinds overlay (1: lit, 1 - strength: shadow)"""
+    import numpy as np
+
+    _, v = _rotated_coords(height, width, angle)
+    phase = (v / period + offset) % 1.0
+    if softness > 0:
+        shadow = np.clip((duty - phase) / softness + 0.5, 0.0, 1.0)
+    else:
+        shadow = (phase < duty).astype(np.float32)
+    mask = (1.0 - strength * shadow).astype(np.float32)
+    mask.flags.writeable = False
+    return mask
+
+
+def halftone(lum, cell: float = 0.008, angle: float = 45.0):
+    """
+    Black dot screen; dot area follows darkness
+
+    Args:
+        cell: Dot spacing as a fraction of the image height
+        angle: Screen angle in degrees
+    """
+    import numpy as np
+
+    height, width = lum.shape[-2:]
+    distance = _screen_distance(height, width, max(cell * height, 2.0), angle)
+    # A dot of radius r covers pi r^2 of its cell
+    radius = np.sqrt(np.clip(1.0 - lum, 0.0, 1.0) / np.pi)
+    return (distance >= radius).astype(np.float32)
+
+
+OPERATIONS = {
+    "levels": levels,
+    "contrast": contrast,
+    "threshold": threshold,
+    "posterize": posterize,
+    "blinds": blinds,
+    "halftone": halftone,
+}
+
+
+def apply_look(lum, look: str):
+    """Run one look over a luminance batch; returns float32 in [0, 1]"""
+    for operation, params in LOOKS[look]:
+        lum = OPERATIONS[operation](lum, **params)
+    return lum
+
+
+def grade_batch(batch, looks: List[str]) -> Dict[str, Any]:
+    """
+    Grade a batch of same-sized images with several looks
+
+    Args:
+        batch: (N, H, W, C) or (N, H, W) array
+        looks: Names from LOOKS
+
+    Returns:
+        Dict of look name -> (N, H, W) uint8 array
+    """
+    import numpy as np
+
+    lum = desaturate(batch)
+    return {look: (np.clip(apply_look(lum, look), 0.0, 1.0) * 255 + 0.5).astype(np.uint8)
+            for look in looks}
+
+
+def grade_files(paths: List[str], looks: List[str]) -> List[Dict[str, Any]]:
+    """
+    Grade images and save every look to outputs/graded/<look>/ (runs in a worker process)
+
+    Images of the same size are stacked and graded as one batch.
+
+    Args:
+        paths: Sources relative to outputs/
+
+    Returns:
+        Manifest derivative rows of the saved files
+    """
+    import io
+    import numpy as np
+    from PIL import Image
+
+    by_size: Dict[Tuple[int, int], List[Tuple[str, Any]]] = {}
+    for path in paths:
+        with Image.open(get_output_path(path)) as image:
+            array = np.asarray(image.convert("RGB"))
+        by_size.setdefault(array.shape[:2], []).append((path, array))
+
+    rows = []
+    for group in by_size.values():
+        graded = grade_batch(np.stack([array for _, array in group]), looks)
+        for look, images in graded.items():
+            for (path, _), pixels in zip(group, images):
+                rel_path = f"{GRADED_DIR}/{look}/{Path(path).stem}.png"
+                buffer = io.BytesIO()
+                Image.fromarray(pixels, mode="L").save(buffer, format="PNG")
+                data = buffer.getvalue()
+                target = get_output_path(rel_path)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = target.with_name(target.name + ".tmp")
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, target)
+                rows.append(derivative_row(path, f"graded:{look}", f"look:{look}", rel_path, data))
+    return rows
+
+
+def grade(paths: List[str], looks: List[str], workers: int = 0, chunk: int = 8) -> List[str]:
+    """
+    Grade images, optionally across a process pool
+
+    The graded files are recorded in the manifest as derivatives of their
+    source (named graded:<look>).
+
+    Args:
+        paths: Sources relative to outputs/
+        looks: Names from LOOKS
+        workers: Worker processes (0: grade in this process)
+        chunk: Images per batch
+
+    Returns:
+        Saved paths, relative to outputs/
+    """
+    chunks = [paths[i:i + chunk] for i in range(0, len(paths), chunk)]
+    if workers <= 0:
+        rows = [row for part in chunks for row in grade_files(part, looks)]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(grade_files, chunks, [looks] * len(chunks))
+            rows = [row for part in results for row in part]
+
+    get_store().record_derivatives(rows)
+    return [row["path"] for row in rows]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Apply noir looks to rendered images")
+    parser.add_argument("files", nargs="*", type=Path, help="Images below outputs/")
+    parser.add_argument("--scene", help="Grade outputs of this prompt key from the manifest")
+    parser.add_argument("--set", dest="prompt_set", help="Grade outputs of this prompt set")
+    parser.add_argument("--looks", default=",".join(LOOKS),
+                        help=f"Comma-separated looks ({', '.join(LOOKS)})")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Worker processes (default: grade in this process)")
+    parser.add_argument("--chunk", type=int, default=8, help="Images per batch")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    looks = [look.strip() for look in args.looks.split(",") if look.strip()]
+    unknown = [look for look in looks if look not in LOOKS]
+    if unknown:
+        logger.error(f"❌ Unknown look(s): {', '.join(unknown)}. Available: {', '.join(LOOKS)}")
+        sys.exit(1)
+
+    root = OUTPUT_DIR.resolve()
+    paths: List[str] = []
+    for path in args.files:
+        path = path.resolve()
+        if not path.is_relative_to(root):
+            logger.error(f"❌ {path} is not below {OUTPUT_DIR}")
+            sys.exit(1)
+        paths.append(path.relative_to(root).as_posix())
+    if args.scene or args.prompt_set:
+        filters = {name: value for name, value in
+                   (("scene", args.scene), ("prompt_set", args.prompt_set)) if value}
+        paths.extend(row["path"] for row in get_store().query(**filters))
+
+    if not paths:
+        logger.error("❌ No images selected")
+        sys.exit(1)
+
+    start = time.time()
+    saved = grade(paths, looks, workers=args.workers, chunk=args.chunk)
+    elapsed = time.time() - start
+    logger.info(f"🎞️  {len(paths)} image(s) x {len(looks)} look(s) -> {len(saved)} file(s) "
+                f"in {elapsed:.2f}s ({elapsed / len(saved) * 1000:.1f}ms per output)")
+    logger.info(f"📁 {OUTPUT_DIR / GRADED_DIR}")
+
+
+if __name__ == "__main__":
+    main()
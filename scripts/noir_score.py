@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Noir Score
+Flags outputs that drift off the black-and-white noir style.
+
+Measurements, vectorized with NumPy over a batch of downscaled images:
+
+  - colourfulness: Hasler & Suesstrunk's metric (0 for pure greyscale)
+  - extremes: share of pixels in the deep blacks and bright whites; low
+    values mean soft, muddy mid-tone gradients
+  - contrast: standard deviation of luminance
+  - edge_density: share of pixels on a hard edge
+  - stripes: strongest periodic component (venetian blinds)
+
+An image passes when it stays within THRESHOLDS (colour, tonal extremes and
+contrast; edge density and stripes are reported for sorting and review). Shots with `noir_check`
+enabled are re-rendered with a new seed when images fail (see shot_runner),
+and the CLI scores an existing outputs/ tree with a process pool.
+"""
+
+import os
+import sys
+import time
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from config import configure_logging, get_output_path, OUTPUT_DIR
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_SIZE = 256
+DARK_LEVEL = 0.2
+LIGHT_LEVEL = 0.8
+EDGE_LEVEL = 0.25
+# Stripe periods searched, as fractions of the image height
+STRIPE_PERIODS = (0.02, 0.2)
+
+THRESHOLDS = {
+    "colourfulness": ("max", 12.0),
+    "extremes": ("min", 0.45),
+    "contrast": ("min", 0.25),
+}
+
+METRICS = ("colourfulness", "extremes", "contrast", "edge_density", "stripes")
+
+
+def load_analysis_image(data_or_path, size: int = ANALYSIS_SIZE):
+    """Decode PNG bytes or a file to a (size, size, 3) uint8 array"""
+    import io
+    import numpy as np
+    from PIL import Image
+
+    source = io.BytesIO(data_or_path) if isinstance(data_or_path, bytes) else data_or_path
+    with Image.open(source) as image:
+        image.draft("RGB", (size, size))
+        image = image.convert("RGB").resize((size, size), Image.BILINEAR, reducing_gap=2.0)
+        return np.asarray(image)
+
+
+def score_batch(batch) -> Dict[str, Any]:
+    """
+    Measure a batch of same-sized images
+
+    Args:
+        batch: (N, H, W, 3) uint8 array
+
+    Returns:
+        Dict of metric name -> (N,) float array
+    """
+    import numpy as np
+
+    rgb = batch.astype(np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+
+    rg = r - g
+    yb = 0.5 * (r + g) - b
+    colourfulness = np.sqrt(rg.std(axis=(1, 2)) ** 2 + yb.std(axis=(1, 2)) ** 2) \
+        + 0.3 * np.sqrt(rg.mean(axis=(1, 2)) ** 2 + yb.mean(axis=(1, 2)) ** 2)
+
+    lum = (0.2126 * r + 0.7152 * g + 0.0722 * b) / 255
+    extremes = ((lum < DARK_LEVEL) | (lum > LIGHT_LEVEL)).mean(axis=(1, 2))
+    contrast = lum.std(axis=(1, 2))
+
+    dx = np.abs(np.diff(lum, axis=2))[:, :-1, :]
+    dy = np.abs(np.diff(lum, axis=1))[:, :, :-1]
+    edge_density = (np.maximum(dx, dy) > EDGE_LEVEL).mean(axis=(1, 2))
+
+    return {
+        "colourfulness": colourfulness,
+        "extremes": extremes,
+        "contrast": contrast,
+        "edge_density": edge_density,
+        "stripes": _stripe_strength(lum),
+    }
+
+
+def _stripe_strength(lum):
+    """Share of spectral energy in the strongest stripe frequency (any angle)"""
+    import numpy as np
+
+    n, height, width = lum.shape
+    spectrum = np.abs(np.fft.rfft2(lum - lum.mean(axis=(1, 2), keepdims=True))) ** 2
+
+    fy = np.fft.fftfreq(height)[:, None]
+    fx = np.fft.rfftfreq(width)[None, :]
+    radius = np.sqrt(fy * fy + fx * fx)
+    low, high = 1 / (STRIPE_PERIODS[1] * height), 1 / (STRIPE_PERIODS[0] * height)
+    band = (radius >= low) & (radius <= high)
+
+    total = spectrum.reshape(n, -1).sum(axis=1) + 1e-9
+    peak = spectrum[:, band].max(axis=1)
+    return peak / total
+
+
+def judge(metrics: Dict[str, float], thresholds: Dict[str, Tuple[str, float]] = THRESHOLDS) -> List[str]:
+    """Reasons an image fails the noir style; empty if it passes"""
+    reasons = []
+    for name, (kind, limit) in thresholds.items():
+        value = metrics[name]
+        if kind == "max" and value > limit:
+            reasons.append(f"{name} {value:.2f} > {limit}")
+        elif kind == "min" and value < limit:
+            reasons.append(f"{name} {value:.2f} < {limit}")
+    return reasons
+
+
+def score_images(images: Iterable[Any]) -> List[Dict[str, Any]]:
+    """
+    Score encoded images or files
+
+    Args:
+        images: PNG bytes or paths
+
+    Returns:
+        Per image: the metrics plus 'reasons' (empty list if it passes)
+    """
+    import numpy as np
+
+    images = list(images)
+    if not images:
+        return []
+    scores = score_batch(np.stack([load_analysis_image(image) for image in images]))
+    return [_metrics(scores, i) for i in range(len(images))]
+
+
+def _metrics(scores: Dict[str, Any], index: int) -> Dict[str, Any]:
+    metrics = {name: float(scores[name][index]) for name in METRICS}
+    metrics["reasons"] = judge(metrics)
+    return metrics
+
+
+def _score_files(paths: List[str]) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    """Score a chunk of files relative to outputs/ (runs in a worker process)"""
+    loadable = []
+    for path in paths:
+        try:
+            loadable.append((path, load_analysis_image(get_output_path(path))))
+        except Exception as e:
+            logger.warning(f"⚠️  Could not read {path}: {e}")
+
+    if not loadable:
+        return [(path, None) for path in paths]
+
+    import numpy as np
+
+    scores = score_batch(np.stack([array for _, array in loadable]))
+    return [(path, _metrics(scores, i)) for i, (path, _) in enumerate(loadable)]
+
+
+def score_tree(directory: Path, workers: Optional[int] = None,
+               chunk: int = 32) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Score every PNG below a directory with a process pool
+
+    Returns:
+        (path relative to outputs/, metrics) pairs, sorted by path
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    root = OUTPUT_DIR.resolve()
+    paths = []
+    for current, dirs, files in os.walk(Path(directory).resolve()):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        rel_root = Path(current).relative_to(root).as_posix()
+        paths.extend(f"{rel_root}/{name}" for name in files if name.lower().endswith(".png"))
+    paths.sort()
+
+    chunks = [paths[i:i + chunk] for i in range(0, len(paths), chunk)]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        return [(path, metrics) for part in pool.map(_score_files, chunks)
+                for path, metrics in part if metrics is not None]
+
+
+def main():
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Score outputs for noir style compliance")
+    parser.add_argument("directory", nargs="?", type=Path, default=OUTPUT_DIR,
+                        help="Directory below outputs/ to score (default: all outputs)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--failed", action="store_true", help="Only list failing images")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per image")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    if not args.directory.resolve().is_relative_to(OUTPUT_DIR.resolve()):
+        logger.error(f"❌ {args.directory} is not below {OUTPUT_DIR}")
+        sys.exit(1)
+
+    start = time.time()
+    results = score_tree(args.directory, workers=args.workers)
+    elapsed = time.time() - start
+
+    failed = 0
+    for path, metrics in results:
+        failed += bool(metrics["reasons"])
+        if args.failed and not metrics["reasons"]:
+            continue
+        if args.json:
+            print(json.dumps({"path": path, **metrics}))
+        else:
+            verdict = "❌ " + "; ".join(metrics["reasons"]) if metrics["reasons"] else "✅"
+            print(f"{path}  {verdict}")
+
+    rate = len(results) / elapsed if elapsed > 0 else 0.0
+    logger.info(f"📊 {len(results)} image(s) scored in {elapsed:.1f}s ({rate:.0f}/s), "
+                f"{failed} off-style")
+
+
+if __name__ == "__main__":
+    main()
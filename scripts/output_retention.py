@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Output Retention
+Garbage-collects ComfyUI's own copies of rendered images.
+
+Every image is downloaded via /view and saved by the scripts, so the server's
+output directory keeps a duplicate of everything ever rendered. Clients record
+each server file in a ledger once their local copy is on disk; the collector
+then deletes (or compacts) those retrieved files by age and total size:
+
+  - retrieved files older than --retrieved-ttl are deleted
+  - retrieved PNGs older than --compact-after are losslessly recompressed
+  - while the managed files exceed --max-gb, the oldest retrieved files are
+    deleted first
+
+Only files under SERVER_SUBFOLDER (driftingme/) are ever touched. With
+docker-compose the server's output directory is also where images made in
+the ComfyUI web UI live, often as their only copy, so nothing outside our
+subfolder is listed, compacted or deleted. Files under driftingme/ that were
+never retrieved (failed or abandoned runs) are kept unless --orphan-ttl is
+given; then they are deleted after that many hours, and count towards
+--max-gb after the retrieved ones.
+
+Each run stats at most --scan-limit files, resuming the walk where the
+previous run stopped and listing one directory at a time, so the cost per
+run stays bounded however large the directory gets.
+
+The collector must run where ComfyUI's output directory is, and it needs the
+ledger next to that directory (<server dir>/.retention/retrieved.jsonl).
+With docker-compose both are ./outputs, the directory the scripts save to.
+When the scripts run elsewhere (remote server over an SSH tunnel), copy the
+client's outputs/.retention/retrieved.jsonl to the GPU host, e.g. with rsync
+before each run, and pass it with --ledger. Without a ledger the collector
+refuses to run, since nothing would be known to be retrieved.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Tuple
+from config import configure_logging, OUTPUT_DIR
+from comfyui_api import SERVER_SUBFOLDER
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DIR_NAME = ".retention"
+RETENTION_DIR = OUTPUT_DIR / RETENTION_DIR_NAME
+LEDGER_FILE = RETENTION_DIR / "retrieved.jsonl"
+STATE_FILE = RETENTION_DIR / "gc_state.json"
+
+IMAGE_SUFFIXES = (".png", ".webp", ".jpg", ".jpeg")
+
+DEFAULT_SCAN_LIMIT = 2000
+DEFAULT_RETRIEVED_TTL_H = 24
+# Never-retrieved files younger than this may still be downloading
+IN_FLIGHT_GRACE_H = 1
+
+_ledger_lock = threading.Lock()
+
+
+def record_retrieved(images: Iterable[Any], ledger_file: Path = LEDGER_FILE):
+    """
+    Record server files whose local copy has been written
+
+    Args:
+        images: Objects with filename/subfolder/type (comfyui_api.GeneratedImage)
+        ledger_file: Ledger to append to
+    """
+    lines = [json.dumps({"path": _server_path(image.subfolder, image.filename),
+                         "time": time.time()})
+             for image in images if image.type == "output"]
+    if not lines:
+        return
+
+    with _ledger_lock:
+        ledger_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(ledger_file, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _server_path(subfolder: str, filename: str) -> str:
+    return f"{subfolder}/{filename}" if subfolder else filename
+
+
+def read_ledger(ledger_file: Path = LEDGER_FILE) -> Set[str]:
+    """Server paths (relative to the output directory) recorded as retrieved"""
+    retrieved = set()
+    if not ledger_file.exists():
+        return retrieved
+
+    with open(ledger_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                retrieved.add(json.loads(line)["path"])
+            except (json.JSONDecodeError, KeyError):
+                continue  # truncated last line after a crash
+    return retrieved
+
+
+def _walk_key(rel_path: str) -> Tuple[str, ...]:
+    """Order of the walk: path components compared one by one, like sorted directory listings"""
+    return tuple(rel_path.split("/")) if rel_path else ()
+
+
+def iter_managed(server_dir: Path, after: str = "") -> Iterator[str]:
+    """
+    Server files the collector may touch, in walk order, starting after a cursor
+
+    Only the SERVER_SUBFOLDER tree is managed; nothing else in the
+    directory is listed or deleted.
+    Directories are listed lazily, one at a time, and subtrees wholly before
+    the cursor are skipped without being listed.
+    """
+    cursor = _walk_key(after)
+
+    def walk(parts: Tuple[str, ...]) -> Iterator[str]:
+        try:
+            with os.scandir(server_dir.joinpath(*parts)) as entries:
+                listing = sorted((entry.name, entry.is_dir(follow_symlinks=False)) for entry in entries)
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        for name, is_dir in listing:
+            path = parts + (name,)
+            if not parts and not (is_dir and name == SERVER_SUBFOLDER):
+                continue
+            if is_dir:
+                if path >= cursor[:len(path)]:
+                    yield from walk(path)
+            elif name.lower().endswith(IMAGE_SUFFIXES) and path > cursor:
+                yield "/".join(path)
+
+    return walk(())
+
+
+def _load_state(state_file: Path) -> Dict[str, Any]:
+    if state_file.exists():
+        try:
+            with open(state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            logger.warning(f"Ignoring corrupt retention state {state_file}, rescanning")
+    # index: path -> [size, mtime, compacted]
+    return {"cursor": "", "index": {}}
+
+
+def _save_state(state: Dict[str, Any], state_file: Path):
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = state_file.with_suffix(".tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    tmp_file.replace(state_file)
+
+
+def _compact(path: Path) -> int:
+    """Recompress a PNG losslessly in place, keeping its mtime; returns bytes saved"""
+    from PIL import Image
+
+    stat = path.stat()
+    before = stat.st_size
+    tmp_path = path.with_name(path.name + ".tmp")
+    with Image.open(path) as image:
+        image.save(tmp_path, format="PNG", optimize=True, pnginfo=_png_info(image))
+    if tmp_path.stat().st_size < before:
+        tmp_path.replace(path)
+        # Age policies keep counting from when the image was rendered
+        os.utime(path, (stat.st_atime, stat.st_mtime))
+        return before - path.stat().st_size
+    tmp_path.unlink()
+    return 0
+
+
+def _png_info(image):
+    """Keep the workflow/prompt text chunks ComfyUI embeds"""
+    from PIL.PngImagePlugin import PngInfo
+
+    info = PngInfo()
+    for key, value in image.text.items():
+        info.add_text(key, value)
+    return info
+
+
+def collect(server_dir: Path = OUTPUT_DIR, scan_limit: int = DEFAULT_SCAN_LIMIT,
+            retrieved_ttl_h: float = DEFAULT_RETRIEVED_TTL_H,
+            orphan_ttl_h: Optional[float] = None,
+            compact_after_h: Optional[float] = None,
+            max_bytes: Optional[int] = None, dry_run: bool = False,
+            ledger_file: Optional[Path] = None, state_file: Optional[Path] = None) -> Dict[str, Any]:
+    """
+    Run one incremental collection pass
+
+    Args:
+        server_dir: ComfyUI output directory
+        scan_limit: Maximum number of files to stat in this pass
+        retrieved_ttl_h: Age in hours after which retrieved files are deleted
+        orphan_ttl_h: Age in hours after which never-retrieved files are deleted
+            (None: never-retrieved files are kept and never deleted)
+        compact_after_h: Recompress retrieved PNGs older than this (None: off)
+        max_bytes: Size budget for all managed files (None: unlimited); only
+            retrieved files, and orphans if orphan_ttl_h is set, are deleted for it
+        dry_run: Report what would be done without touching any file
+        ledger_file: Retrieval ledger (default: <server_dir>/.retention/retrieved.jsonl)
+        state_file: Collector state (default: next to the default ledger)
+
+    Returns:
+        Summary with scanned/deleted/compacted counts and byte totals
+
+    Raises:
+        FileNotFoundError: If there is no ledger, i.e. not running where the
+            clients record what they retrieved
+    """
+    server_dir = Path(server_dir)
+    ledger_file = Path(ledger_file or server_dir / RETENTION_DIR_NAME / LEDGER_FILE.name)
+    state_file = Path(state_file or server_dir / RETENTION_DIR_NAME / STATE_FILE.name)
+    if not ledger_file.exists():
+        raise FileNotFoundError(f"No retrieval ledger at {ledger_file}; run where the clients save "
+                                f"their outputs, or copy their ledger here and pass it with --ledger")
+    state = _load_state(state_file)
+    index: Dict[str, list] = state["index"]
+    retrieved = read_ledger(ledger_file)
+    now = time.time()
+    summary = {"scanned": 0, "deleted": 0, "deleted_bytes": 0,
+               "compacted": 0, "compacted_bytes": 0}
+    deleted = set()
+
+    def delete(rel_path: str):
+        size = index.get(rel_path, [0])[0]
+        if not dry_run:
+            try:
+                (server_dir / rel_path).unlink()
+            except FileNotFoundError:
+                pass
+        index.pop(rel_path, None)
+        deleted.add(rel_path)
+        summary["deleted"] += 1
+        summary["deleted_bytes"] += size
+
+    # Incremental scan: continue after the cursor, wrapping around at the end
+    cursor = _walk_key(state["cursor"])
+    batch = list(islice(iter_managed(server_dir, state["cursor"]), scan_limit))
+    wrapped = len(batch) < scan_limit
+    if wrapped and cursor:
+        for rel_path in iter_managed(server_dir):
+            if len(batch) >= scan_limit or _walk_key(rel_path) > cursor:
+                break
+            batch.append(rel_path)
+    last = _walk_key(batch[-1]) if batch else cursor
+
+    def scanned(rel_path: str) -> bool:
+        """Whether the walk covered rel_path in this pass"""
+        key = _walk_key(rel_path)
+        if not wrapped:
+            return cursor < key <= last
+        if len(batch) < scan_limit:
+            return True  # the whole tree
+        return key > cursor or key <= last
+
+    # Indexed files the walk passed over no longer exist
+    seen = set(batch)
+    for rel_path in [p for p in index if p not in seen and scanned(p)]:
+        del index[rel_path]
+
+    for rel_path in batch:
+        summary["scanned"] += 1
+        try:
+            stat = (server_dir / rel_path).stat()
+        except FileNotFoundError:
+            index.pop(rel_path, None)
+            continue
+
+        compacted = index.get(rel_path, [0, 0, False])[2]
+        index[rel_path] = [stat.st_size, stat.st_mtime, compacted]
+        age_h = (now - stat.st_mtime) / 3600
+
+        if rel_path not in retrieved:
+            if orphan_ttl_h is not None and age_h >= orphan_ttl_h:
+                delete(rel_path)
+        elif age_h >= retrieved_ttl_h:
+            delete(rel_path)
+        elif compact_after_h is not None and age_h >= compact_after_h and not compacted \
+                and rel_path.lower().endswith(".png"):
+            saved = 0 if dry_run else _compact(server_dir / rel_path)
+            index[rel_path] = [stat.st_size - saved, stat.st_mtime, True]
+            summary["compacted"] += 1
+            summary["compacted_bytes"] += saved
+
+    if batch:
+        state["cursor"] = batch[-1]
+
+    # Size budget over everything indexed so far, oldest retrieved files first;
+    # orphans only when their deletion was asked for
+    total = sum(entry[0] for entry in index.values())
+    if max_bytes is not None and total > max_bytes:
+        grace_cutoff = now - IN_FLIGHT_GRACE_H * 3600
+        deletable = [p for p in index if p in retrieved
+                     or (orphan_ttl_h is not None and index[p][1] < grace_cutoff)]
+        by_priority = sorted(deletable, key=lambda p: (p not in retrieved, index[p][1]))
+        for rel_path in by_priority:
+            if total <= max_bytes:
+                break
+            total -= index[rel_path][0]
+            delete(rel_path)
+
+    summary["managed_files"] = len(index)
+    summary["managed_bytes"] = sum(entry[0] for entry in index.values())
+
+    if not dry_run:
+        _save_state(state, state_file)
+        # Ledger entries are live unless the walk found their file gone; files
+        # outside this pass's range may simply not be indexed yet
+        existing = {p for p in retrieved if p in index or not scanned(p)} - deleted
+        _compact_ledger(ledger_file, retrieved, existing)
+
+    return summary
+
+
+def _compact_ledger(ledger_file: Path, retrieved: Set[str], existing: Set[str]):
+    """Rewrite the ledger without entries for deleted files once they dominate it"""
+    live = retrieved & existing
+    if not retrieved or len(live) > len(retrieved) // 2:
+        return
+
+    with _ledger_lock:
+        tmp_file = ledger_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            for path in sorted(live):
+                f.write(json.dumps({"path": path, "time": time.time()}) + "\n")
+        tmp_file.replace(ledger_file)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Delete or compact ComfyUI's copies of retrieved images")
+    parser.add_argument("--server-output-dir", type=Path, default=OUTPUT_DIR,
+                        help="ComfyUI output directory (default: the docker-compose mount)")
+    parser.add_argument("--scan-limit", type=int, default=DEFAULT_SCAN_LIMIT,
+                        help="Files to stat per run")
+    parser.add_argument("--retrieved-ttl", type=float, default=DEFAULT_RETRIEVED_TTL_H,
+                        help="Hours to keep files after they were retrieved")
+    parser.add_argument("--orphan-ttl", type=float,
+                        help="Also delete never-retrieved files under driftingme/ older than this "
+                             "many hours (off by default)")
+    parser.add_argument("--compact-after", type=float,
+                        help="Losslessly recompress retrieved PNGs older than this many hours")
+    parser.add_argument("--max-gb", type=float, help="Size budget for managed files")
+    parser.add_argument("--ledger", type=Path,
+                        help="Retrieval ledger copied from the clients "
+                             "(default: <server output dir>/.retention/retrieved.jsonl)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be done")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    if not args.server_output_dir.is_dir():
+        logger.error(f"❌ Not a directory: {args.server_output_dir}")
+        sys.exit(1)
+
+    try:
+        summary = collect(
+            args.server_output_dir, scan_limit=args.scan_limit,
+            retrieved_ttl_h=args.retrieved_ttl, orphan_ttl_h=args.orphan_ttl,
+            compact_after_h=args.compact_after,
+            max_bytes=int(args.max_gb * 1024**3) if args.max_gb else None,
+            dry_run=args.dry_run, ledger_file=args.ledger
+        )
+    except FileNotFoundError as e:
+        logger.error(f"❌ {e}")
+        sys.exit(1)
+
+    action = "Would delete" if args.dry_run else "Deleted"
+    logger.info(f"🧹 Scanned {summary['scanned']} file(s)")
+    logger.info(f"🗑️  {action} {summary['deleted']} file(s), {summary['deleted_bytes'] / 1024**2:.1f}MB")
+    if summary["compacted"]:
+        logger.info(f"🗜️  Compacted {summary['compacted']} file(s), "
+                    f"saved {summary['compacted_bytes'] / 1024**2:.1f}MB")
+    logger.info(f"📁 Managed: {summary['managed_files']} file(s), "
+                f"{summary['managed_bytes'] / 1024**2:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Output Store
+Collision-free, hash-sharded storage for rendered images with a manifest index.
+
+Every saved image gets a random id and lands in outputs/store/<id[:2]>/<id[2:4]>/,
+so concurrent shots never overwrite each other and no directory grows past a
+few hundred files. Each save appends one row to an SQLite manifest
+(outputs/manifest.sqlite) with the scene, seed, generation parameters,
+workflow hash, file hash and perceptual hash, so lookups like "all outputs of scene X with
+seed Y" are an index query instead of a directory walk.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from config import configure_logging, get_output_path, OUTPUT_DIR
+import run_metrics
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR = "store"
+MANIFEST_FILE = OUTPUT_DIR / "manifest.sqlite"
+
+MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    scene TEXT,
+    prompt_set TEXT,
+    shot TEXT,
+    seed INTEGER,
+    params TEXT,
+    workflow_hash TEXT,
+    file_hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    phash TEXT
+);
+CREATE INDEX IF NOT EXISTS outputs_scene_seed ON outputs (scene, seed);
+CREATE INDEX IF NOT EXISTS outputs_prompt_set ON outputs (prompt_set);
+CREATE INDEX IF NOT EXISTS outputs_workflow_hash ON outputs (workflow_hash);
+CREATE INDEX IF NOT EXISTS outputs_file_hash ON outputs (file_hash);
+CREATE TABLE IF NOT EXISTS derivatives (
+    source TEXT NOT NULL,
+    name TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    file_hash TEXT NOT NULL,
+    source_size INTEGER NOT NULL,
+    source_mtime REAL NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (source, name)
+);
+CREATE INDEX IF NOT EXISTS derivatives_file_hash ON derivatives (file_hash);
+"""
+
+# Columns query() can filter on
+QUERY_FIELDS = ("scene", "prompt_set", "shot", "seed", "workflow_hash", "file_hash")
+
+
+def new_output_id() -> str:
+    """Random 128-bit id; also decides the shard directory"""
+    import uuid
+
+    return uuid.uuid4().hex
+
+
+def derivative_row(source: str, name: str, spec: str, path: str, data: bytes) -> Dict[str, Any]:
+    """
+    Manifest row for a file derived from an output (see record_derivatives)
+
+    Args:
+        source: Source path relative to outputs/
+        name: Derivative name, unique per source (e.g. "graded:hard_ink")
+        spec: Settings the file was built with
+        path: Where the derived file was written, relative to outputs/
+        data: Its encoded content
+    """
+    import hashlib
+
+    stat = get_output_path(source).stat()
+    return {"source": source, "name": name, "spec": spec, "path": path, "size": len(data),
+            "file_hash": hashlib.sha256(data).hexdigest(), "source_size": stat.st_size,
+            "source_mtime": stat.st_mtime, "created": time.time()}
+
+
+def shard_path(output_id: str, filename: str) -> str:
+    """Store path of a file, relative to outputs/"""
+    return f"{STORE_DIR}/{output_id[:2]}/{output_id[2:4]}/{filename}"
+
+
+class OutputStore:
+    """
+    Sharded image store with an append-only manifest
+
+    Safe to share between threads; output rows are only ever inserted (and
+    perceptual hashes back-filled, see similarity_index).
+    """
+
+    def __init__(self, manifest_file=MANIFEST_FILE):
+        """
+        Args:
+            manifest_file: SQLite manifest database
+        """
+        import sqlite3
+
+        manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(manifest_file), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(MANIFEST_SCHEMA)
+            # Manifests created before perceptual hashes were recorded
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(outputs)")}
+            if "phash" not in columns:
+                self._db.execute("ALTER TABLE outputs ADD COLUMN phash TEXT")
+
+    def allocate(self, name: str, subdir: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Choose a new id and path for a file without writing anything
+
+        Args:
+            name: Readable filename stem, e.g. "scene1_close_up_eyes"
+            subdir: Directory below outputs/ to use instead of a store shard
+
+        Returns:
+            Dict with 'id' and 'path' (relative to outputs/)
+        """
+        output_id = new_output_id()
+        filename = f"{name}_{output_id[:12]}.png"
+        rel_path = f"{subdir}/{filename}" if subdir else shard_path(output_id, filename)
+        return {"id": output_id, "path": rel_path}
+
+    def write_at(self, allocated: Dict[str, Any], data: bytes) -> Dict[str, Any]:
+        """
+        Write image data to an allocated path
+
+        The file is written to a temporary name and renamed, so readers never
+        see a partial image.
+
+        Args:
+            allocated: Result of allocate()
+            data: Encoded image
+
+        Returns:
+            allocated plus 'file_hash' and 'size'
+        """
+        import hashlib
+
+        filepath = get_output_path(allocated["path"])
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = filepath.with_name(filepath.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+
+        return {**allocated, "file_hash": hashlib.sha256(data).hexdigest(), "size": len(data)}
+
+    def write_file(self, data: bytes, name: str, subdir: Optional[str] = None) -> Dict[str, Any]:
+        """Write image data under a new id without recording it; see write_at()"""
+        return self.write_at(self.allocate(name, subdir), data)
+
+    def record(self, stored: Dict[str, Any], metadata: Dict[str, Any]):
+        """
+        Append a manifest row for a written file
+
+        Args:
+            stored: Result of write_file()
+            metadata: scene, prompt_set, shot, seed, params, workflow_hash and
+                phash (perceptual hash as 16 hex digits)
+        """
+        self.record_many([(stored, metadata)])
+
+    def record_many(self, entries: List[Tuple[Dict[str, Any], Dict[str, Any]]]):
+        """Append manifest rows for (stored, metadata) pairs in one transaction"""
+        now = time.time()
+        rows = [{
+            **stored,
+            "scene": metadata.get("scene"),
+            "prompt_set": metadata.get("prompt_set"),
+            "shot": metadata.get("shot"),
+            "seed": metadata.get("seed"),
+            "params": json.dumps(metadata.get("params", {}), sort_keys=True, default=str),
+            "workflow_hash": metadata.get("workflow_hash"),
+            "phash": metadata.get("phash"),
+            "created": now,
+        } for stored, metadata in entries]
+        if not rows:
+            return
+
+        columns = ", ".join(rows[0])
+        placeholders = ", ".join(f":{name}" for name in rows[0])
+        with self._lock, self._db:
+            self._db.executemany(f"INSERT INTO outputs ({columns}) VALUES ({placeholders})", rows)
+
+    def save(self, data: bytes, name: str, metadata: Dict[str, Any],
+             subdir: Optional[str] = None) -> Dict[str, Any]:
+        """Write a file and record it; returns the write_file() result"""
+        start = time.time()
+        stored = self.write_file(data, name, subdir)
+        labels = run_metrics.metadata_labels(metadata)
+        run_metrics.observe("save_seconds", time.time() - start, **labels)
+        run_metrics.inc("saved_bytes_total", stored["size"], **labels)
+        self.record(stored, metadata)
+        return stored
+
+    def query(self, limit: Optional[int] = None, **filters) -> List[Dict[str, Any]]:
+        """
+        Find outputs by indexed fields, newest first
+
+        Example: query(scene="scene1_closeup_integrated", seed=12345678)
+        """
+        unknown = set(filters) - set(QUERY_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot query by {', '.join(sorted(unknown))}. Fields: {QUERY_FIELDS}")
+
+        where = " AND ".join(f"{name} = :{name}" for name in filters) or "1"
+        sql = f"SELECT * FROM outputs WHERE {where} ORDER BY created DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+
+        with self._lock:
+            rows = self._db.execute(sql, filters).fetchall()
+
+        results = []
+        for row in rows:
+            result = dict(row)
+            result["params"] = json.loads(result["params"] or "{}")
+            results.append(result)
+        return results
+
+    def get_outputs(self, ids: List[str]) -> List[Dict[str, Any]]:
+        """Rows for output ids, in the given order (unknown ids are skipped)"""
+        found = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                for row in self._db.execute(f"SELECT * FROM outputs WHERE id IN ({placeholders})", chunk):
+                    found[row["id"]] = row
+
+        results = []
+        for output_id in ids:
+            if output_id in found:
+                result = dict(found[output_id])
+                result["params"] = json.loads(result["params"] or "{}")
+                results.append(result)
+        return results
+
+    def phashes_since(self, rowid: int = 0) -> List[Tuple[int, str, str]]:
+        """(rowid, id, phash) of hashed outputs recorded after a manifest rowid"""
+        with self._lock:
+            return [tuple(row) for row in self._db.execute(
+                "SELECT rowid, id, phash FROM outputs WHERE rowid > ? AND phash IS NOT NULL "
+                "AND phash != '' ORDER BY rowid", (rowid,))]
+
+    def missing_phashes(self) -> List[Tuple[int, str, str]]:
+        """(rowid, id, path) of outputs recorded without a perceptual hash"""
+        with self._lock:
+            return [tuple(row) for row in self._db.execute(
+                "SELECT rowid, id, path FROM outputs WHERE phash IS NULL ORDER BY rowid")]
+
+    def set_phashes(self, pairs: List[Tuple[str, str]]):
+        """Back-fill perceptual hashes from (id, phash) pairs; '' marks an unreadable file"""
+        with self._lock, self._db:
+            self._db.executemany("UPDATE outputs SET phash = ? WHERE id = ?",
+                                 [(value, output_id) for output_id, value in pairs])
+
+    def last_rowid(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(MAX(rowid), 0) FROM outputs").fetchone()[0]
+
+    def get_derivatives(self, source: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Derivative rows (see derivatives.py), for one source path or all"""
+        sql = "SELECT * FROM derivatives"
+        params = {}
+        if source is not None:
+            sql += " WHERE source = :source"
+            params["source"] = source
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params).fetchall()]
+
+    def record_derivatives(self, rows: List[Dict[str, Any]]):
+        """Insert or replace derivative rows, keyed by source path and derivative name"""
+        if not rows:
+            return
+        columns = ", ".join(rows[0])
+        placeholders = ", ".join(f":{name}" for name in rows[0])
+        with self._lock, self._db:
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO derivatives ({columns}) VALUES ({placeholders})", rows)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_store: Optional[OutputStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> OutputStore:
+    """The process-wide OutputStore, opened on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = OutputStore()
+        return _store
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query the output manifest")
+    parser.add_argument("--scene", help="Prompt key, e.g. scene1_closeup_integrated")
+    parser.add_argument("--set", dest="prompt_set", help="Prompt set, e.g. integrated")
+    parser.add_argument("--seed", type=int, help="Seed used for generation")
+    parser.add_argument("--workflow-hash", help="Hash of the submitted workflow")
+    parser.add_argument("--file-hash", help="SHA-256 of the image file")
+    parser.add_argument("--limit", type=int, default=50, help="Maximum rows to show")
+    parser.add_argument("--json", action="store_true", help="Print full rows as JSON lines")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    if not MANIFEST_FILE.exists():
+        logger.error(f"❌ No manifest at {MANIFEST_FILE}")
+        sys.exit(1)
+
+    filters = {name: getattr(args, name) for name in QUERY_FIELDS
+               if getattr(args, name, None) is not None}
+    rows = get_store().query(limit=args.limit, **filters)
+
+    for row in rows:
+        if args.json:
+            print(json.dumps(row))
+        else:
+            print(f"{row['path']}  seed={row['seed']}  {row['scene']}")
+    logger.info(f"📋 {len(rows)} output(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Output Writer
+Write-behind stage that saves images off the generation threads.
+
+Generation threads hand finished images to submit(), which only picks a path
+in the output store and queues the data; a small worker pool writes the files,
+then records them in the manifest and the retention ledger. Manifest rows are
+committed in batches (whenever the queue drains or a batch fills), and with
+sync_batch > 0 (OUTPUT_SYNC_BATCH for the process-wide writer) the files of
+every batch and their directories are fsynced before its rows are committed,
+so the manifest never points at a file that could be lost.
+
+The queue is bounded: when disks fall behind, submit() blocks instead of
+buffering images without limit. Shutdown flushes everything still queued.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+from config import get_config, get_output_path
+from output_retention import record_retrieved
+from output_store import OutputStore, get_store
+import run_metrics
+import run_trace
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WRITE_WORKERS = 2
+DEFAULT_MAX_PENDING = 64
+# Manifest rows committed per transaction while the queue stays busy
+DEFAULT_COMMIT_BATCH = 16
+
+
+class _WriteJob(NamedTuple):
+    allocated: Dict[str, Any]
+    data: bytes
+    metadata: Dict[str, Any]
+    retrieved: List[Any]
+    future: Future
+
+
+class OutputWriter:
+    """
+    Bounded write-behind queue in front of an OutputStore
+
+    Example:
+        writer = OutputWriter()
+        path = writer.submit(png_bytes, "integrated_scene1", metadata)
+        writer.wait([path])   # only where the file is read back
+        writer.close()
+    """
+
+    def __init__(self, store: Optional[OutputStore] = None, workers: int = DEFAULT_WRITE_WORKERS,
+                 max_pending: int = DEFAULT_MAX_PENDING, sync_batch: int = 0):
+        """
+        Args:
+            store: Output store to write to (default: the process-wide store)
+            workers: Number of writer threads
+            max_pending: Images queued before submit() blocks
+            sync_batch: Sync files to disk every this many images before
+                recording them (0: leave flushing to the OS)
+        """
+        self._store = store or get_store()
+        self._queue: "queue.Queue[Optional[_WriteJob]]" = queue.Queue(maxsize=max_pending)
+        self._sync_batch = sync_batch
+        self._commit_batch = sync_batch or DEFAULT_COMMIT_BATCH
+        self._batch: List[tuple] = []
+        self._commit_lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._closed = False
+        self.stats = {"submitted": 0, "written": 0, "failed": 0, "bytes": 0,
+                      "write_seconds": 0.0, "blocked_seconds": 0.0,
+                      "commits": 0, "syncs": 0, "high_water": 0}
+        self._first_submit = None
+        self._last_commit = None
+
+        self._threads = [threading.Thread(target=self._run, name=f"output-writer-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, data: bytes, name: str, metadata: Optional[Dict[str, Any]] = None,
+               subdir: Optional[str] = None, retrieved: Iterable[Any] = ()) -> str:
+        """
+        Queue an image for saving
+
+        Args:
+            data: Encoded image
+            name: Readable filename stem, see OutputStore.allocate()
+            metadata: Manifest fields, see OutputStore.record()
+            subdir: Directory below outputs/ to use instead of a store shard
+            retrieved: Server images (comfyui_api.GeneratedImage) to record in
+                the retention ledger once the file is saved
+
+        Returns:
+            Path the image will be saved to, relative to outputs/
+        """
+        if self._closed:
+            raise RuntimeError("OutputWriter is closed")
+
+        allocated = self._store.allocate(name, subdir)
+        future = Future()
+        with self._pending_lock:
+            self._pending[allocated["path"]] = future
+        # Failed writes stay pending until wait() has raised their error
+        future.add_done_callback(lambda f: f.exception() or self._forget(allocated["path"]))
+
+        job = _WriteJob(allocated, data, dict(metadata or {}), list(retrieved), future)
+        start = time.time()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._queue.put(job)
+
+        now = time.time()
+        with self._pending_lock:
+            self.stats["blocked_seconds"] += now - start
+            self.stats["submitted"] += 1
+            self.stats["high_water"] = max(self.stats["high_water"], self._queue.qsize())
+            if self._first_submit is None:
+                self._first_submit = now
+        return allocated["path"]
+
+    def _forget(self, path: str):
+        with self._pending_lock:
+            self._pending.pop(path, None)
+
+    def wait(self, paths: Optional[Iterable[str]] = None, timeout: Optional[float] = None):
+        """
+        Block until images are saved and recorded
+
+        Args:
+            paths: Paths returned by submit() (default: everything queued so far)
+            timeout: Seconds to wait per image
+
+        Raises:
+            The write error of the first image that failed
+        """
+        with self._pending_lock:
+            if paths is None:
+                futures = list(self._pending.items())
+            else:
+                futures = [(p, self._pending[p]) for p in paths if p in self._pending]
+        for path, future in futures:
+            try:
+                future.result(timeout)
+            finally:
+                if future.done():
+                    self._forget(path)
+
+    def flush(self):
+        """Wait until everything queued so far is saved; failures are only logged"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                # Shutdown: the queue ahead of the sentinels has been written
+                with self._commit_lock:
+                    if self._batch:
+                        self._commit()
+                self._queue.task_done()
+                return
+            try:
+                start = time.time()
+                with run_trace.span("write", path=job.allocated["path"], shot=job.metadata.get("shot")):
+                    if "phash" not in job.metadata:
+                        job.metadata["phash"] = _phash(job.data)
+                    stored = self._store.write_at(job.allocated, job.data)
+                logger.info(f"💾 Saved: {stored['path']} ({stored['size'] / 1024:.1f}KB)")
+                elapsed = time.time() - start
+                labels = run_metrics.metadata_labels(job.metadata)
+                run_metrics.observe("save_seconds", elapsed, **labels)
+                run_metrics.inc("saved_bytes_total", stored["size"], **labels)
+
+                with self._commit_lock:
+                    self.stats["write_seconds"] += elapsed
+                    self.stats["bytes"] += stored["size"]
+                    self._batch.append((job, stored))
+                    # The last job of a burst always finds the queue empty
+                    if len(self._batch) >= self._commit_batch or self._queue.empty():
+                        self._commit()
+            except Exception as e:
+                with self._commit_lock:
+                    self.stats["failed"] += 1
+                    # Written jobs ahead of this one must not wait for the next submit
+                    if self._batch and self._queue.empty():
+                        self._commit()
+                logger.error(f"❌ Could not save {job.allocated['path']}: {e}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def _commit(self):
+        """Record the current batch; called with _commit_lock held"""
+        batch, self._batch = self._batch, []
+        try:
+            if self._sync_batch:
+                # Only this batch's files, then the directories holding their entries
+                paths = [get_output_path(stored["path"]) for _, stored in batch]
+                for path in paths:
+                    _fsync(path)
+                for directory in {path.parent for path in paths}:
+                    _fsync(directory, directory=True)
+                self.stats["syncs"] += 1
+
+            self._store.record_many([(stored, job.metadata) for job, stored in batch])
+            # Local copies exist; the server's copies may now be garbage-collected
+            record_retrieved([image for job, _ in batch for image in job.retrieved])
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            logger.error(f"❌ Could not record {len(batch)} saved image(s): {e}")
+            for job, _ in batch:
+                job.future.set_exception(e)
+            return
+
+        self.stats["commits"] += 1
+        self.stats["written"] += len(batch)
+        self._last_commit = time.time()
+        for job, stored in batch:
+            job.future.set_result(stored)
+
+    def report(self) -> Dict[str, Any]:
+        """Stats plus write throughput (MB/s while the stage was busy)"""
+        report = dict(self.stats)
+        elapsed = (self._last_commit or 0) - (self._first_submit or 0)
+        report["throughput_mb_s"] = report["bytes"] / 1024**2 / elapsed if elapsed > 0 else 0.0
+        report["images_per_s"] = report["written"] / elapsed if elapsed > 0 else 0.0
+        return report
+
+    def close(self):
+        """Flush the queue and stop the workers"""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+        report = self.report()
+        if report["submitted"]:
+            logger.info(f"💾 Output writer: {report['written']} image(s), "
+                        f"{report['throughput_mb_s']:.1f}MB/s, queue high-water "
+                        f"{report['high_water']}, blocked {report['blocked_seconds']:.2f}s")
+
+
+def _phash(data: bytes) -> Optional[str]:
+    """Perceptual hash for the manifest, or None if it cannot be computed"""
+    try:
+        from perceptual_hash import format_hash, phash
+
+        return format_hash(phash(data))
+    except Exception as e:  # NumPy missing or an image PIL cannot read
+        logger.debug(f"No perceptual hash: {e}")
+        return None
+
+
+def _fsync(path, directory: bool = False):
+    """Flush a file, or a directory's entries, to disk"""
+    if directory and os.name == "nt":
+        return  # Directories cannot be opened (or fsynced) on Windows
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+_writer: Optional[OutputWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> OutputWriter:
+    """
+    The process-wide OutputWriter; it is flushed and closed at exit
+
+    OUTPUT_SYNC_BATCH (in .env or the environment) sets its sync_batch.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            import atexit
+
+            _writer = OutputWriter(sync_batch=int(get_config("OUTPUT_SYNC_BATCH") or 0))
+            atexit.register(_writer.close)
+        return _writer
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Parameter Sweep
+Searches cfg x steps x sampler x scheduler for the best settings per prompt family.
+
+Every configuration in the grid is rendered on a few prompt keys of the
+family and scored by a pluggable metric (higher is better). Instead of
+rendering the full grid on every seed, the sweep runs successive halving:
+
+    round 1: every configuration on 1 seed
+    round 2: the best 1/eta on eta seeds
+    round 3: the best 1/eta of those on eta^2 seeds ...
+
+so losing regions of the grid are dropped after a single cheap render.
+Renders go through the shared job scheduler: seeds already rendered in an
+earlier round are reused, jobs are queued prompt by prompt so ComfyUI keeps
+the text conditioning cached, and an interrupted sweep resumes from its
+state file. The current hand-tuned settings (CHARACTER_PARAMS,
+CLEAR_CHARACTER_PARAMS, NOIR_SETTINGS) always take part as a baseline.
+"""
+
+import sys
+import math
+import time
+import importlib
+import logging
+from itertools import product
+from typing import Any, Callable, Dict, List, Optional
+from config import configure_logging, get_output_path, OUTPUT_DIR
+from comfyui_api import SAMPLER_ALIASES, create_basic_workflow, run_workflow
+from job_scheduler import JobScheduler, job_key, DEFAULT_MAX_WORKERS
+from output_writer import get_writer
+import run_metrics
+from shot_runner import PROMPT_SETS, Shot, get_prompt_set, resolve_request
+
+logger = logging.getLogger(__name__)
+
+SWEEPS_DIR = "sweeps"
+
+# Prompt family -> the hand-tuned settings it is compared against
+FAMILY_PARAMS = {
+    "character": "CHARACTER_PARAMS",
+    "clear_character": "CLEAR_CHARACTER_PARAMS",
+    "noir": "NOIR_SETTINGS",
+}
+
+DEFAULT_GRID = {
+    "cfg_scale": [5.5, 6.0, 6.5, 7.0, 8.0],
+    "steps": [20, 25, 30],
+    "sampler": ["euler_ancestral", "dpmpp_2m"],
+    "scheduler": ["normal", "karras"],
+}
+DEFAULT_SEEDS = 9
+DEFAULT_SEED_BASE = 12345678
+DEFAULT_ETA = 3
+DEFAULT_KEYS = 2
+
+
+def noir_metric(data: bytes) -> float:
+    """
+    Mean margin to the noir THRESHOLDS, each clipped to [-1, 1]
+
+    Positive when the image passes every threshold, higher for deeper
+    blacks, brighter whites and less colour.
+    """
+    from noir_score import THRESHOLDS, score_images
+
+    metrics = score_images([data])[0]
+    margins = []
+    for name, (kind, limit) in THRESHOLDS.items():
+        margin = (limit - metrics[name]) / limit if kind == "max" else (metrics[name] - limit) / limit
+        margins.append(max(-1.0, min(1.0, margin)))
+    return sum(margins) / len(margins)
+
+
+def edge_metric(data: bytes) -> float:
+    """Share of pixels on a hard edge, a rough proxy for crisp line work"""
+    from noir_score import score_images
+
+    return score_images([data])[0]["edge_density"]
+
+
+METRICS: Dict[str, Callable[[bytes], float]] = {
+    "noir": noir_metric,
+    "edges": edge_metric,
+}
+
+
+def get_metric(name: str) -> Callable[[bytes], float]:
+    """A metric from METRICS, or any 'module:function' taking PNG bytes and returning a float"""
+    if name in METRICS:
+        return METRICS[name]
+    if ":" not in name:
+        raise KeyError(f"Unknown metric: {name}. Available: {list(METRICS)} or module:function")
+    module, function = name.split(":", 1)
+    return getattr(importlib.import_module(module), function)
+
+
+def build_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Every combination of the grid values, as shot overrides"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in product(*(grid[name] for name in names))]
+
+
+def baseline_config(prompt_set: str, key: str) -> Dict[str, Any]:
+    """The generator's current settings for a prompt key, as shot overrides"""
+    request = resolve_request(Shot(id=key, prompt_set=prompt_set, key=key))
+    sampler = request["sampler_name"]
+    return {
+        "cfg_scale": request["cfg_scale"],
+        "steps": request["steps"],
+        "sampler": SAMPLER_ALIASES.get(sampler.lower(), sampler),
+        "scheduler": request["scheduler"],
+    }
+
+
+def config_label(config: Dict[str, Any]) -> str:
+    return (f"cfg {config['cfg_scale']:g}, {config['steps']} steps, "
+            f"{config['sampler']}/{config['scheduler']}")
+
+
+def render_and_score(shot: Shot, request: Dict[str, Any], metric: str, sweep: str) -> Dict[str, Any]:
+    """
+    Render one image, score it and save it to the output store (runs in a scheduler thread)
+
+    Returns:
+        Dict with the 'score' and the saved 'path'; the image is on disk when this returns
+    """
+    workflow = create_basic_workflow(**request)
+    with run_metrics.labelled(family=shot.prompt_set):
+        outputs = run_workflow(workflow)
+    images = [image for node_images in outputs.values() for image in node_images]
+    if not images:
+        raise RuntimeError(f"No images returned for {shot.id}")
+
+    score = float(get_metric(metric)(images[0].data))
+    metadata = {
+        "scene": shot.key,
+        "prompt_set": shot.prompt_set,
+        "shot": shot.id,
+        "seed": request["seed"],
+        "params": {**request, "sweep": sweep, "metric": metric, "score": round(score, 4)},
+        "workflow_hash": job_key(workflow),
+    }
+    writer = get_writer()
+    path = writer.submit(images[0].data, f"sweep_{shot.key}", metadata, retrieved=images)
+    # Wait so the scheduler's resume state only records saved images
+    writer.wait([path])
+    return {"score": score, "path": path}
+
+
+def successive_halving(family: str, keys: List[str], configs: List[Dict[str, Any]],
+                       seeds: List[int], metric: str, scheduler: JobScheduler,
+                       sweep: str, eta: int = DEFAULT_ETA) -> List[Dict[str, Any]]:
+    """
+    Rank configurations, giving more seeds only to the ones still winning
+
+    Args:
+        family: Prompt set name
+        keys: Prompt keys every configuration is rendered on
+        configs: Shot overrides to compare
+        seeds: Seed pool; the last round uses all of them
+        metric: Name for get_metric()
+        scheduler: Shared scheduler (dedups repeated renders, resumes)
+        sweep: Sweep name recorded with every render
+        eta: Keep the best 1/eta of the configurations each round
+
+    Returns:
+        One entry per configuration, best first: 'config', 'scores',
+        'mean', 'rounds' survived and 'paths' of its renders
+    """
+    results = [{"config": config, "scores": [], "mean": float("-inf"), "rounds": 0, "paths": []}
+               for config in configs]
+    survivors = list(range(len(configs)))
+    budget = 1
+    round_number = 0
+
+    while True:
+        round_number += 1
+        round_seeds = seeds[:budget]
+        logger.info(f"🔬 {family} round {round_number}: {len(survivors)} configuration(s) "
+                    f"x {len(keys)} prompt(s) x {len(round_seeds)} seed(s)")
+
+        # Prompt-major order: consecutive jobs share their text conditioning
+        jobs = []
+        for key, index, seed in product(keys, survivors, round_seeds):
+            overrides = {**configs[index], "seed": seed, "variations": 1}
+            shot = Shot(id=f"sweep:{family}:{key}:{index}:{seed}", prompt_set=family,
+                        key=key, overrides=overrides)
+            request = resolve_request(shot)
+            future = scheduler.submit(job_key({**request, "metric": metric}),
+                                      render_and_score, shot, request, metric, sweep)
+            jobs.append((index, future))
+
+        per_config: Dict[int, List[Dict[str, Any]]] = {index: [] for index in survivors}
+        for index, future in jobs:
+            try:
+                per_config[index].append(future.result())
+            except Exception as e:
+                logger.error(f"❌ {config_label(configs[index])}: {e}")
+
+        for index in survivors:
+            entry = results[index]
+            entry["scores"] = [result["score"] for result in per_config[index]]
+            entry["paths"] = [result["path"] for result in per_config[index]]
+            entry["mean"] = sum(entry["scores"]) / len(entry["scores"]) if entry["scores"] else float("-inf")
+            entry["rounds"] = round_number
+
+        if len(survivors) <= 1 or budget >= len(seeds):
+            break
+        survivors.sort(key=lambda index: results[index]["mean"], reverse=True)
+        survivors = survivors[:max(1, math.ceil(len(survivors) / eta))]
+        budget = min(len(seeds), budget * eta)
+
+    # Later rounds rank first: their means rest on more seeds
+    return sorted(results, key=lambda entry: (entry["rounds"], entry["mean"]), reverse=True)
+
+
+def recommend(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Generator settings for a ranked configuration"""
+    config = entry["config"]
+    return {"steps": config["steps"], "cfg_scale": config["cfg_scale"],
+            "sampler_name": config["sampler"], "scheduler": config["scheduler"]}
+
+
+def sweep_family(family: str, grid: Dict[str, List[Any]], keys: Optional[List[str]] = None,
+                 seeds: int = DEFAULT_SEEDS, seed_base: int = DEFAULT_SEED_BASE,
+                 eta: int = DEFAULT_ETA, metric: str = "noir",
+                 max_workers: int = DEFAULT_MAX_WORKERS, name: Optional[str] = None,
+                 resume: bool = True) -> Dict[str, Any]:
+    """
+    Sweep one prompt family and recommend its settings
+
+    Args:
+        family: Prompt set name (see PROMPT_SETS)
+        grid: Values per parameter: cfg_scale, steps, sampler, scheduler
+        keys: Prompt keys to render (default: the first DEFAULT_KEYS of the set)
+        seeds: Seeds per configuration in the final round
+        seed_base: First seed; seeds are consecutive
+        eta: Halving rate
+        metric: Name for get_metric()
+        max_workers: Renders in flight at once
+        name: Sweep name for the state file and report (default: sweep_<family>)
+        resume: Reuse renders recorded by an interrupted sweep of the same name
+
+    Returns:
+        Report dict with the ranked 'table', the 'recommended' settings, the
+        'baseline' and render counts
+    """
+    if family not in PROMPT_SETS:
+        raise KeyError(f"Unknown prompt family: {family}. Available: {list(PROMPT_SETS)}")
+    get_metric(metric)
+    keys = keys or list(get_prompt_set(family))[:DEFAULT_KEYS]
+    name = name or f"sweep_{family}"
+
+    baseline = baseline_config(family, keys[0])
+    configs = build_grid(grid)
+    if baseline not in configs:
+        configs.append(baseline)
+    seed_pool = [seed_base + i for i in range(seeds)]
+
+    state_file = OUTPUT_DIR / ".sweep_state" / f"{name}.jsonl"
+    if not resume and state_file.exists():
+        state_file.unlink()
+
+    start = time.time()
+    with JobScheduler(max_workers=max_workers, state_file=state_file) as scheduler:
+        ranked = successive_halving(family, keys, configs, seed_pool, metric, scheduler, name, eta)
+    get_writer().flush()
+    if not ranked[0]["scores"]:
+        raise RuntimeError(f"Every {family} render failed")
+
+    stats = scheduler.stats
+    renders = stats["submitted"] + stats["resumed"]
+    full_grid = len(configs) * len(keys) * len(seed_pool)
+    table = [{"rank": rank, "label": config_label(entry["config"]), **entry,
+              "baseline": entry["config"] == baseline}
+             for rank, entry in enumerate(ranked, 1)]
+    return {
+        "name": name,
+        "family": family,
+        "params_name": FAMILY_PARAMS.get(family),
+        "metric": metric,
+        "keys": keys,
+        "seeds": seed_pool,
+        "eta": eta,
+        "table": table,
+        "recommended": recommend(ranked[0]),
+        "baseline": recommend({"config": baseline}),
+        "renders": renders,
+        "full_grid_renders": full_grid,
+        "elapsed": time.time() - start,
+    }
+
+
+def save_report(report: Dict[str, Any]) -> str:
+    """Write a sweep report to outputs/sweeps/<name>.json; returns its path relative to outputs/"""
+    import json
+
+    rel_path = f"{SWEEPS_DIR}/{report['name']}.json"
+    target = get_output_path(rel_path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with open(target, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    return rel_path
+
+
+def _values(text: str, cast: Callable) -> List[Any]:
+    return [cast(value.strip()) for value in text.split(",") if value.strip()]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Find the best sampling settings per prompt family")
+    parser.add_argument("--family", default=",".join(FAMILY_PARAMS),
+                        help=f"Comma-separated prompt families (default: {','.join(FAMILY_PARAMS)})")
+    parser.add_argument("--keys", nargs="+", help="Prompt keys to render (default: first two of each family)")
+    parser.add_argument("--cfg", default=",".join(map(str, DEFAULT_GRID["cfg_scale"])), help="cfg values")
+    parser.add_argument("--steps", default=",".join(map(str, DEFAULT_GRID["steps"])), help="Step counts")
+    parser.add_argument("--samplers", default=",".join(DEFAULT_GRID["sampler"]), help="ComfyUI sampler names")
+    parser.add_argument("--schedulers", default=",".join(DEFAULT_GRID["scheduler"]), help="ComfyUI schedulers")
+    parser.add_argument("--seeds", type=int, default=DEFAULT_SEEDS,
+                        help="Seeds per configuration in the final round")
+    parser.add_argument("--seed-base", type=int, default=DEFAULT_SEED_BASE, help="First seed")
+    parser.add_argument("--eta", type=int, default=DEFAULT_ETA,
+                        help="Keep the best 1/eta configurations each round")
+    parser.add_argument("--metric", default="noir",
+                        help=f"Score to maximise: {', '.join(METRICS)} or module:function")
+    parser.add_argument("--parallel", type=int, default=DEFAULT_MAX_WORKERS, help="Renders in flight at once")
+    parser.add_argument("--top", type=int, default=10, help="Rows of the ranked table to show")
+    parser.add_argument("--no-resume", action="store_true", help="Start the sweep over")
+    parser.add_argument("--dry-run", action="store_true", help="Print the plan without rendering")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    try:
+        grid = {
+            "cfg_scale": _values(args.cfg, float),
+            "steps": _values(args.steps, int),
+            "sampler": _values(args.samplers, str),
+            "scheduler": _values(args.schedulers, str),
+        }
+        families = _values(args.family, str)
+        for family in families:
+            if family not in PROMPT_SETS:
+                raise KeyError(f"Unknown prompt family: {family}. Available: {list(PROMPT_SETS)}")
+        get_metric(args.metric)
+        if args.eta < 2 or args.seeds < 1:
+            raise ValueError("--eta must be at least 2 and --seeds at least 1")
+    except (ValueError, KeyError, ImportError, AttributeError) as e:
+        logger.error(f"❌ {e}")
+        sys.exit(1)
+
+    configs = len(build_grid(grid))
+    if args.dry_run:
+        # Survivors only render the seeds they have not rendered yet
+        budget, rendered, survivors, renders = 1, 0, configs + 1, 0
+        while True:
+            renders += survivors * (budget - rendered)
+            if survivors <= 1 or budget >= args.seeds:
+                break
+            survivors = max(1, math.ceil(survivors / args.eta))
+            budget, rendered = min(args.seeds, budget * args.eta), budget
+        logger.info(f"📋 {configs} configuration(s) + baseline per family; at most {renders} render(s) "
+                    f"per prompt key instead of {(configs + 1) * args.seeds} for the full grid")
+        return
+
+    failed = False
+    for family in families:
+        logger.info(f"🎛️  Sweeping {family} ({configs} configurations, metric {args.metric})")
+        logger.info("=" * 60)
+        try:
+            report = sweep_family(family, grid, keys=args.keys, seeds=args.seeds,
+                                  seed_base=args.seed_base, eta=args.eta, metric=args.metric,
+                                  max_workers=args.parallel, resume=not args.no_resume)
+        except (ValueError, KeyError, RuntimeError) as e:
+            logger.error(f"❌ {family}: {e}")
+            failed = True
+            continue
+
+        logger.info(f"\n📊 {family}: top {min(args.top, len(report['table']))} of {len(report['table'])}")
+        for row in report["table"][:args.top]:
+            marker = "  (current)" if row["baseline"] else ""
+            logger.info(f"  {row['rank']:3d}. {row['mean']:+.3f}  n={len(row['scores']):<2d} "
+                        f"round {row['rounds']}  {row['label']}{marker}")
+        baseline_rank = next(row["rank"] for row in report["table"] if row["baseline"])
+        logger.info(f"🏆 Recommended {report['params_name'] or family}: {report['recommended']}")
+        logger.info(f"   current settings rank {baseline_rank}: {report['baseline']}")
+        logger.info(f"⚡ {report['renders']} render(s) instead of {report['full_grid_renders']} "
+                    f"({report['renders'] / report['full_grid_renders']:.0%} of the full grid) "
+                    f"in {report['elapsed']:.0f}s")
+        logger.info(f"📁 {OUTPUT_DIR / save_report(report)}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
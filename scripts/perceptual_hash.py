@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Perceptual Hash
+64-bit DCT perceptual hashes for spotting near-identical outputs.
+
+Images are reduced to 32x32 greyscale, transformed with a 2D DCT (one matrix
+product per side, batched with NumPy), and the 8x8 lowest frequencies are
+compared against their median. Visually similar images differ in few bits,
+so similarity is 1 - hamming distance / 64.
+"""
+
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SAMPLE_SIZE = 32
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+
+@lru_cache(maxsize=None)
+def _dct_matrix(n: int = SAMPLE_SIZE):
+    """Orthonormal DCT-II matrix, so dct(x) = D @ x @ D.T"""
+    import numpy as np
+
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+def load_sample(data_or_path):
+    """Decode PNG bytes or a file to a (32, 32) float32 greyscale sample"""
+    import io
+    import numpy as np
+    from PIL import Image
+
+    source = io.BytesIO(data_or_path) if isinstance(data_or_path, bytes) else data_or_path
+    with Image.open(source) as image:
+        image.draft("L", (SAMPLE_SIZE * 4, SAMPLE_SIZE * 4))
+        image = image.convert("L").resize((SAMPLE_SIZE, SAMPLE_SIZE), Image.BILINEAR, reducing_gap=2.0)
+        return np.asarray(image, dtype=np.float32)
+
+
+def phash_batch(samples) -> List[int]:
+    """
+    Hash a batch of samples
+
+    Args:
+        samples: (N, 32, 32) greyscale array
+
+    Returns:
+        One 64-bit integer per sample
+    """
+    import numpy as np
+
+    dct = _dct_matrix()
+    coefficients = dct @ samples @ dct.T
+    low = coefficients[:, :HASH_SIZE, :HASH_SIZE].reshape(len(samples), -1)
+    # The DC term only encodes average brightness; leave it out of the median
+    bits = low > np.median(low[:, 1:], axis=1, keepdims=True)
+    weights = np.left_shift(np.uint64(1), np.arange(HASH_BITS - 1, -1, -1, dtype=np.uint64))
+    return [int(value) for value in (bits.astype(np.uint64) * weights).sum(axis=1)]
+
+
+def phash(data_or_path) -> int:
+    """Perceptual hash of one image (PNG bytes or path)"""
+    import numpy as np
+
+    return phash_batch(np.stack([load_sample(data_or_path)]))[0]
+
+
+def phash_images(images: Iterable[Any]) -> List[int]:
+    """Perceptual hashes of several images (PNG bytes or paths) in one batch"""
+    import numpy as np
+
+    samples = [load_sample(image) for image in images]
+    return phash_batch(np.stack(samples)) if samples else []
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def similarity(a: int, b: int) -> float:
+    """1.0 for identical hashes, around 0.5 for unrelated images"""
+    return 1 - hamming(a, b) / HASH_BITS
+
+
+def format_hash(value: int) -> str:
+    return f"{value:016x}"
+
+
+class NearDuplicateFilter:
+    """
+    Remembers the images kept so far and flags near-identical newcomers
+
+    shot_runner uses one filter per shot, so the first image checked is always
+    kept. Thread-safe.
+    """
+
+    def __init__(self, threshold: float = 0.9):
+        """
+        Args:
+            threshold: Similarity at or above which an image counts as a duplicate
+        """
+        self.max_distance = int((1 - threshold) * HASH_BITS)
+        self._kept: List[Tuple[int, str]] = []
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"checked": 0, "kept": 0, "culled": 0}
+
+    def check(self, value: int, label: str) -> Optional[str]:
+        """
+        Keep an image unless it is a near-duplicate of one kept earlier
+
+        Returns:
+            Label of the matching kept image, or None if this one was kept
+        """
+        with self._lock:
+            self.stats["checked"] += 1
+            for kept, kept_label in self._kept:
+                if hamming(value, kept) <= self.max_distance:
+                    self.stats["culled"] += 1
+                    return kept_label
+            self._kept.append((value, label))
+            self.stats["kept"] += 1
+            return None
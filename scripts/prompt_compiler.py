@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Prompt Compiler
+Normalises prompt text, removes duplicate terms and budgets CLIP tokens.
+
+CLIP encodes text in chunks of 77 tokens (75 usable plus start/end). ComfyUI
+moves a word that does not fit into the next chunk, so a prompt that spills a
+few tokens past a boundary pays for a whole extra encode. The compiler counts
+chunks the same way, warns about small spills and can drop trailing terms to
+fit a chunk budget. Compiled results are cached on disk by content hash, so the
+tokenizer only runs once per prompt version.
+"""
+
+import re
+import json
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from config import configure_logging, get_config, OUTPUT_DIR
+from job_scheduler import job_key, read_state
+
+logger = logging.getLogger(__name__)
+
+CHUNK_TOKENS = 75      # 77 minus the start and end tokens
+MAX_WORD_TOKENS = 8    # longer words are split across chunks instead of moved
+SPILL_WARN_TOKENS = 15  # warn when the last chunk holds no more than this
+
+CACHE_FILE = OUTPUT_DIR / ".cache" / "prompts.jsonl"
+
+# Request fields compiled by compile_request(); shared blocks come first so
+# that per-panel text can drop the terms they already contain
+SHARED_FIELDS = ("prompt_prefix", "prompt_suffix", "negative_suffix")
+PANEL_FIELDS = {"prompt": ("prompt_prefix", "prompt_suffix"),
+                "negative_prompt": ("negative_suffix",)}
+
+# ComfyUI strips "(term:1.2)" emphasis syntax before tokenizing
+_WEIGHT_SYNTAX = re.compile(r"[()]|:\s*-?\d+(?:\.\d+)?(?=\s*\))")
+# CLIP's pre-tokenizer: contractions, letter runs, single digits, symbol runs
+_CLIP_PIECES = re.compile(r"'s|'t|'re|'ve|'m|'ll|'d|[^\W\d_]+|\d|[^\s\w]+|_", re.IGNORECASE)
+
+
+class CompiledPrompt(NamedTuple):
+    """Result of compiling one prompt block"""
+    text: str
+    tokens: int
+    chunks: int
+    last_chunk_tokens: int
+    removed: List[str]   # duplicate terms
+    dropped: List[str]   # trailing terms cut to fit max_chunks
+    estimated: bool      # True if counted without the CLIP tokenizer
+
+
+@lru_cache(maxsize=None)
+def _tokenizer_installed() -> bool:
+    """Whether transformers is importable, without importing it"""
+    from importlib.util import find_spec
+    return find_spec("transformers") is not None
+
+
+@lru_cache(maxsize=None)
+def _load_tokenizer():
+    """Load the CLIP tokenizer once, or None if transformers is unavailable"""
+    try:
+        from transformers import CLIPTokenizer
+    except ImportError:
+        logger.warning("⚠️  transformers not installed, estimating CLIP token counts "
+                       "(pip install transformers for exact counts)")
+        return None
+
+    name = get_config('CLIP_TOKENIZER')
+    try:
+        return CLIPTokenizer.from_pretrained(name)
+    except OSError as e:
+        logger.warning(f"⚠️  Could not load CLIP tokenizer '{name}', estimating token counts: {e}")
+        return None
+
+
+def _estimate_tokens(word: str) -> int:
+    """Approximate CLIP BPE count: common words are one token, long ones split"""
+    return sum((len(piece) + 7) // 8 if piece.isalpha() else 1
+               for piece in _CLIP_PIECES.findall(word))
+
+
+def split_terms(text: str) -> List[str]:
+    """Split a prompt into comma-separated terms with normalised whitespace"""
+    return [term for term in (" ".join(part.split()) for part in text.split(",")) if term]
+
+
+def count_chunks(word_tokens: Iterable[int]) -> Tuple[int, int]:
+    """
+    Pack per-word token counts into CLIP chunks the way ComfyUI does
+
+    Returns:
+        (number of chunks, tokens used in the last chunk)
+    """
+    chunks, used = 1, 0
+    for n in word_tokens:
+        while n:
+            if used + n <= CHUNK_TOKENS:
+                used += n
+                break
+            if n >= MAX_WORD_TOKENS:
+                n -= CHUNK_TOKENS - used
+            chunks += 1
+            used = 0
+    return chunks, used
+
+
+def _measure(text: str) -> Tuple[int, int, int, bool]:
+    """Count tokens and chunks of text; returns (tokens, chunks, last chunk, estimated)"""
+    tokenizer = _load_tokenizer()
+    words = _WEIGHT_SYNTAX.sub("", text).split()
+    if tokenizer is not None:
+        counts = [len(tokenizer.tokenize(word)) for word in words]
+    else:
+        counts = [_estimate_tokens(word) for word in words]
+    chunks, last = count_chunks(counts)
+    return sum(counts), chunks, last, tokenizer is None
+
+
+def _compile(text: str, exclude: Iterable[str], max_chunks: Optional[int]) -> CompiledPrompt:
+    seen = {term.lower() for term in exclude}
+    terms, removed = [], []
+    for term in split_terms(text):
+        if term.lower() in seen:
+            removed.append(term)
+        else:
+            seen.add(term.lower())
+            terms.append(term)
+
+    dropped = []
+    tokens, chunks, last, estimated = _measure(", ".join(terms))
+    while max_chunks and chunks > max_chunks and terms:
+        dropped.insert(0, terms.pop())
+        tokens, chunks, last, estimated = _measure(", ".join(terms))
+
+    return CompiledPrompt(", ".join(terms), tokens, chunks, last, removed, dropped, estimated)
+
+
+_cache: Optional[Dict[str, Any]] = None
+_cache_lock = threading.Lock()
+
+
+def compile_prompt(text: str, exclude: Iterable[str] = (),
+                   max_chunks: Optional[int] = None) -> CompiledPrompt:
+    """
+    Compile one prompt block
+
+    Args:
+        text: Raw prompt text, e.g. a triple-quoted block
+        exclude: Terms already present elsewhere (e.g. in a shared block)
+        max_chunks: Drop trailing terms until the text fits this many chunks
+
+    Returns:
+        CompiledPrompt; results are cached by hash across runs
+    """
+    global _cache
+    exclude = sorted({term.lower() for term in exclude})
+    # Estimated results must not be served once transformers is installed
+    key = job_key({"text": text, "exclude": exclude, "max_chunks": max_chunks,
+                   "tokenizer": get_config('CLIP_TOKENIZER'),
+                   "transformers": _tokenizer_installed()})
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = read_state(CACHE_FILE)
+        if key in _cache:
+            return CompiledPrompt(**_cache[key])
+
+    compiled = _compile(text, exclude, max_chunks)
+    if compiled.estimated and _tokenizer_installed():
+        # The tokenizer failed to load (e.g. offline); retry on the next run
+        return compiled
+
+    with _cache_lock:
+        _cache[key] = compiled._asdict()
+        CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(CACHE_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "result": _cache[key]}) + "\n")
+
+    return compiled
+
+
+def compile_request(request: Dict[str, Any], max_chunks: Optional[int] = None,
+                    results: Optional[Dict[str, CompiledPrompt]] = None) -> Dict[str, Any]:
+    """
+    Compile the prompt fields of a generate_image() request
+
+    Shared style blocks are compiled first; per-panel prompts then drop any
+    term a shared block already contains, so the shared encodes stay cacheable.
+
+    Args:
+        request: generate_image() keyword arguments
+        max_chunks: Chunk budget for the per-panel prompts (shared blocks are never cut)
+        results: Optional dict that receives each field's CompiledPrompt
+
+    Returns:
+        New request dict with compiled prompt texts
+    """
+    compiled = dict(request)
+    shared: Dict[str, List[str]] = {}
+
+    for field in SHARED_FIELDS:
+        if request.get(field):
+            # The suffix only needs to drop terms already in the prefix
+            exclude = shared.get("prompt_prefix", []) if field == "prompt_suffix" else ()
+            result = compile_prompt(request[field], exclude=exclude)
+            compiled[field] = result.text
+            if results is not None:
+                results[field] = result
+            shared[field] = split_terms(result.text)
+            _report(field, result)
+
+    for field, shared_fields in PANEL_FIELDS.items():
+        if request.get(field):
+            exclude = [term for name in shared_fields for term in shared.get(name, [])]
+            result = compile_prompt(request[field], exclude=exclude, max_chunks=max_chunks)
+            compiled[field] = result.text
+            if results is not None:
+                results[field] = result
+            _report(field, result)
+
+    return compiled
+
+
+_reported = set()
+
+
+def _report(field: str, result: CompiledPrompt):
+    """Log duplicate removal and chunk-boundary spills, once per block"""
+    if (field, result.text) in _reported:
+        return
+    _reported.add((field, result.text))
+    if result.removed:
+        logger.debug(f"{field}: removed {len(result.removed)} duplicate term(s): "
+                     f"{', '.join(result.removed)}")
+    if result.dropped:
+        logger.warning(f"✂️  {field}: dropped {len(result.dropped)} term(s) to fit the chunk "
+                       f"budget: {', '.join(result.dropped)}")
+    if result.chunks > 1 and result.last_chunk_tokens <= SPILL_WARN_TOKENS:
+        logger.warning(f"⚠️  {field}: {result.tokens} tokens spill {result.last_chunk_tokens} "
+                       f"token(s) into CLIP chunk {result.chunks}; trimming them saves an encode")
+
+
+def main():
+    import argparse
+    import importlib
+    from shot_runner import PROMPT_SETS
+
+    parser = argparse.ArgumentParser(description="Compile prompt sets and report CLIP token budgets")
+    parser.add_argument("--set", action="append", choices=list(PROMPT_SETS),
+                        help="Prompt set to compile (repeatable, default: all)")
+    parser.add_argument("--max-chunks", type=int, metavar="N",
+                        help="Drop trailing per-panel terms to fit N CLIP chunks")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help="Delete the compiled prompt cache first")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.clear_cache and CACHE_FILE.exists():
+        CACHE_FILE.unlink()
+
+    for set_name in args.set or list(PROMPT_SETS):
+        prompt_set = PROMPT_SETS[set_name]
+        module = importlib.import_module(prompt_set.module)
+        logger.info(f"\n📝 {set_name}")
+
+        for key in getattr(module, prompt_set.prompts):
+            request = module.build_request(key)
+            results: Dict[str, CompiledPrompt] = {}
+            compile_request(request, max_chunks=args.max_chunks, results=results)
+            for field in SHARED_FIELDS + tuple(PANEL_FIELDS):
+                if field not in results:
+                    continue
+                result = results[field]
+                approx = "~" if result.estimated else ""
+                logger.info(f"   {key:<32} {field:<16} {approx}{result.tokens:4d} tokens, "
+                            f"{result.chunks} chunk(s), {len(result.removed)} duplicate(s) removed, "
+                            f"{len(result.dropped)} dropped to fit")
+
+
+if __name__ == "__main__":
+    main()
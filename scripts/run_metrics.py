@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Run Metrics
+Per-phase counters and histograms, exported as a Prometheus textfile and a JSON summary.
+
+comfyui_api, the output writer and the generators record submit latency,
+queue wait, execution time, download and save time, bytes, retries,
+re-attaches, ComfyUI cache hits and timeouts, labelled by backend (the
+ComfyUI host), checkpoint and scene family (prompt set). Metrics are off
+unless METRICS_DIR is set; then each process writes, at exit:
+
+  - METRICS_DIR/driftingme_<script>.prom for node_exporter's textfile collector
+  - METRICS_DIR/<script>_<time>.json, a summary with estimated percentiles
+
+When metrics are off every call returns after one check, so the hooks cost
+nothing measurable. Labels that depend on where a call is made from (the
+scene family of a shot) are set around a block of work:
+
+    with labelled(family=shot.prompt_set):
+        outputs = run_workflow(workflow)
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from config import get_config
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "driftingme_"
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# name -> (type, help)
+METRICS = {
+    "submit_seconds": ("histogram", "POST /prompt round trip of submissions the server accepted"),
+    "queue_wait_seconds": ("histogram", "Submission to completion seen by the client, minus execution time"),
+    "execution_seconds": ("histogram", "Server-side execution time from the prompt's history timestamps"),
+    "download_seconds": ("histogram", "Image download time"),
+    "save_seconds": ("histogram", "Time to hash and write an image to the output store"),
+    "downloaded_bytes_total": ("counter", "Image bytes downloaded from ComfyUI"),
+    "saved_bytes_total": ("counter", "Image bytes written to the output store"),
+    "submit_retries_total": ("counter", "POST /prompt attempts after a failed one"),
+    "reattached_total": ("counter", "Prompts found on the server after a failed POST"),
+    "timeouts_total": ("counter", "Prompts that did not complete within their timeout"),
+    "prompts_total": ("counter", "Finished prompts by status"),
+    "nodes_total": ("counter", "Nodes of finished prompts"),
+    "cached_nodes_total": ("counter", "Nodes ComfyUI served from its cache"),
+}
+
+
+class _Histogram:
+    __slots__ = ("buckets", "count", "sum", "min", "max")
+
+    def __init__(self):
+        self.buckets = [0] * (len(SECONDS_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float):
+        import bisect
+
+        self.buckets[bisect.bisect_left(SECONDS_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate by linear interpolation within the bucket, like histogram_quantile()"""
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                lower = SECONDS_BUCKETS[index - 1] if index else 0.0
+                upper = SECONDS_BUCKETS[index] if index < len(SECONDS_BUCKETS) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Metric values of one process, keyed by metric name and label set"""
+
+    def __init__(self, backend: str, script: str):
+        """
+        Args:
+            backend: Default 'backend' label (the ComfyUI host)
+            script: Entry point; labels every series so processes don't collide
+        """
+        self.defaults = {"backend": backend, "checkpoint": "none", "family": "none"}
+        self.script = script
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Any] = {}
+
+    def _key(self, name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        if name not in METRICS:
+            raise KeyError(f"Unknown metric: {name}")
+        merged = dict(self.defaults)
+        merged.update(_context.labels)
+        merged.update((key, str(value)) for key, value in labels.items() if value is not None)
+        return name, tuple(sorted(merged.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = _Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def to_prometheus(self) -> str:
+        """Text exposition format, one block per metric"""
+        with self._lock:
+            values = sorted(self._values.items(), key=lambda item: item[0])
+
+        def series(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+            pairs = [f'{key}="{_escape(value)}"' for key, value in (("script", self.script),) + labels]
+            return "{" + ",".join(pairs + ([extra] if extra else [])) + "}"
+
+        lines = []
+        written = set()
+        for (name, labels), value in values:
+            kind, help_text = METRICS[name]
+            if name not in written:
+                written.add(name)
+                lines += [f"# HELP {PREFIX}{name} {help_text}", f"# TYPE {PREFIX}{name} {kind}"]
+            if kind == "counter":
+                lines.append(f"{PREFIX}{name}{series(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(SECONDS_BUCKETS + (float("inf"),), value.buckets):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{PREFIX}{name}_bucket{series(labels, le)} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{series(labels)} {value.sum:.6f}")
+            lines.append(f"{PREFIX}{name}_count{series(labels)} {value.count}")
+
+        labels = series(())
+        lines += [f"# HELP {PREFIX}run_start_timestamp_seconds When the run started",
+                  f"# TYPE {PREFIX}run_start_timestamp_seconds gauge",
+                  f"{PREFIX}run_start_timestamp_seconds{labels} {self.started:.3f}",
+                  f"# HELP {PREFIX}run_duration_seconds How long the run took",
+                  f"# TYPE {PREFIX}run_duration_seconds gauge",
+                  f"{PREFIX}run_duration_seconds{labels} {time.time() - self.started:.3f}"]
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        """JSON-serialisable values; histograms with count, sum, mean, min, max and p50/p90/p99"""
+        with self._lock:
+            values = sorted(self._values.items(), key=lambda item: item[0])
+        metrics: Dict[str, list] = {}
+        for (name, labels), value in values:
+            entry: Dict[str, Any] = {"labels": dict(labels)}
+            if METRICS[name][0] == "counter":
+                entry["value"] = value
+            else:
+                entry.update(count=value.count, sum=round(value.sum, 6), mean=value.sum / value.count,
+                             min=value.min, max=value.max, p50=value.quantile(0.5),
+                             p90=value.quantile(0.9), p99=value.quantile(0.99))
+            metrics.setdefault(name, []).append(entry)
+        return {"script": self.script, "started": self.started, "duration": time.time() - self.started,
+                "metrics": metrics}
+
+    def export(self, directory: Path) -> Tuple[Path, Path]:
+        """Write the textfile (replacing the previous run's) and this run's JSON summary"""
+        import json
+
+        directory.mkdir(parents=True, exist_ok=True)
+        prom_file = directory / f"driftingme_{self.script}.prom"
+        # The textfile collector may read at any time; never show it a partial file
+        tmp_file = prom_file.with_name(prom_file.name + f".{os.getpid()}.tmp")
+        tmp_file.write_text(self.to_prometheus(), encoding="utf-8")
+        os.replace(tmp_file, prom_file)
+
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(self.started))
+        json_file = directory / f"{self.script}_{stamp}.json"
+        json_file.write_text(json.dumps(self.summary(), indent=2), encoding="utf-8")
+        return prom_file, json_file
+
+
+class _Context(threading.local):
+    labels: Dict[str, str] = {}
+
+
+_context = _Context()
+_registry: Optional[MetricsRegistry] = None
+_checked = False
+_lock = threading.Lock()
+
+
+def get_registry() -> Optional[MetricsRegistry]:
+    """The process-wide registry if METRICS_DIR is set, else None"""
+    global _registry, _checked
+    if _checked:
+        return _registry
+    with _lock:
+        if not _checked:
+            directory = get_config("METRICS_DIR")
+            if directory:
+                import atexit
+                from urllib.parse import urlsplit
+
+                backend = urlsplit(get_config("COMFYUI_URL")).netloc or "unknown"
+                script = Path(sys.argv[0]).stem if sys.argv and sys.argv[0] else "python"
+                _registry = MetricsRegistry(backend, script or "python")
+                atexit.register(_export_at_exit, Path(directory).expanduser())
+            _checked = True
+    return _registry
+
+
+def _export_at_exit(directory: Path):
+    try:
+        prom_file, json_file = _registry.export(directory)
+        logger.info(f"📈 Metrics written to {prom_file} and {json_file.name}")
+    except OSError as e:
+        logger.warning(f"⚠️  Could not write metrics to {directory}: {e}")
+
+
+def observe(name: str, value: float, **labels):
+    """Add an observation to a histogram (no-op when metrics are off)"""
+    registry = _registry if _checked else get_registry()
+    if registry is not None:
+        registry.observe(name, value, **labels)
+
+
+def inc(name: str, amount: float = 1, **labels):
+    """Increase a counter (no-op when metrics are off)"""
+    registry = _registry if _checked else get_registry()
+    if registry is not None:
+        registry.inc(name, amount, **labels)
+
+
+class _Labelled:
+    def __init__(self, labels: Dict[str, str]):
+        self._labels = labels
+
+    def __enter__(self):
+        self._previous = _context.labels
+        _context.labels = {**self._previous, **self._labels}
+
+    def __exit__(self, exc_type, exc, tb):
+        _context.labels = self._previous
+        return False
+
+
+_NO_LABELS = nullcontext()
+
+
+def labelled(**labels):
+    """Context manager adding labels to everything recorded in this thread inside it"""
+    if (_registry if _checked else get_registry()) is None:
+        return _NO_LABELS
+    return _Labelled({key: str(value) for key, value in labels.items() if value is not None})
+
+
+def metadata_labels(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Checkpoint and family labels of an output from its manifest metadata"""
+    return {"family": metadata.get("prompt_set"),
+            "checkpoint": (metadata.get("params") or {}).get("ckpt_name")}
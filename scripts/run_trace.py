@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Run Trace
+Per-job timelines of a run, exported in Chrome trace format (chrome://tracing, ui.perfetto.dev).
+
+run_metrics says where time goes on average; a trace shows why one run was
+slow. Every job gets spans on its worker thread's row: compile, submit, wait,
+download and post-process, and the output writer's threads add the writes.
+The ComfyUI server gets its own rows: each prompt's time in the queue (an
+async slice from submission to execution start) and its execution, with a
+slice per node from the websocket 'executing' events. Overlaps, idle gaps
+and slow nodes then sit on one timeline.
+
+Tracing is off unless TRACE_DIR is set; then each process writes
+TRACE_DIR/<script>_<time>.trace.json at exit. Node slices need the
+websocket; without it the server row shows the prompt's execution from its
+history timestamps (server clock, so possibly skewed).
+
+    with span("post-process", shot=shot.id):
+        accepted = filter_images(images)
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from config import get_config
+
+logger = logging.getLogger(__name__)
+
+CLIENT_PID = 1
+SERVER_PID = 2
+EXECUTION_TID = 1
+# Events kept per run; a week-long batch should not exhaust memory
+MAX_EVENTS = 1_000_000
+
+
+class RunTrace:
+    """Trace events of one process, in Chrome trace event format"""
+
+    def __init__(self, script: str, backend: str):
+        """
+        Args:
+            script: Entry point, used in the process name and file name
+            backend: ComfyUI host, used in the server's process name
+        """
+        self.script = script
+        self.started = time.time()
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._tids: Dict[int, int] = {}
+        self._local = threading.local()
+        self._events: List[Dict[str, Any]] = [
+            {"name": "process_name", "ph": "M", "pid": CLIENT_PID, "args": {"name": f"DriftingMe {script}"}},
+            {"name": "process_name", "ph": "M", "pid": SERVER_PID, "args": {"name": f"ComfyUI {backend}"}},
+            {"name": "thread_name", "ph": "M", "pid": SERVER_PID, "tid": EXECUTION_TID,
+             "args": {"name": "execution"}},
+        ]
+
+    def _us(self, timestamp: float) -> int:
+        return round((timestamp - self.started) * 1e6)
+
+    def _add(self, event: Dict[str, Any]):
+        with self._lock:
+            if len(self._events) >= MAX_EVENTS:
+                self.dropped += 1
+                return
+            self._events.append(event)
+
+    def _tid(self) -> int:
+        """Small stable id for the calling thread; names its row on first use"""
+        ident = threading.get_ident()
+        tid = self._tids.get(ident)
+        if tid is None:
+            with self._lock:
+                tid = self._tids[ident] = len(self._tids) + 1
+            self._add({"name": "thread_name", "ph": "M", "pid": CLIENT_PID, "tid": tid,
+                       "args": {"name": threading.current_thread().name}})
+        return tid
+
+    @property
+    def _stack(self) -> List[str]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def complete(self, name: str, start: float, end: float, cat: str = "client",
+                 args: Optional[Dict[str, Any]] = None, pid: int = CLIENT_PID,
+                 tid: Optional[int] = None):
+        """Add a slice from start to end (time.time() values)"""
+        self._add({"name": name, "cat": cat, "ph": "X", "pid": pid,
+                   "tid": self._tid() if tid is None else tid,
+                   "ts": self._us(start), "dur": max(0, self._us(end) - self._us(start)),
+                   "args": args or {}})
+
+    def record_prompt(self, prompt_id: str, workflow: Dict[str, Any], history: Dict[str, Any],
+                      queued: float):
+        """
+        Add a finished prompt's server-side slices
+
+        Args:
+            prompt_id: The prompt
+            workflow: Its workflow, to name node slices by class_type
+            history: Its history entry
+            queued: When the POST /prompt returned
+        """
+        from comfyui_api import workflow_checkpoint
+        from comfyui_events import release, shared_stream
+        from node_profiler import latent_label
+
+        label = self._stack[0] if self._stack else prompt_id[:8]
+        status = history.get("status", {}).get("status_str", "unknown")
+        started = finished = None
+        timings = []
+        clock = "client"
+
+        stream = shared_stream()
+        if stream is not None:
+            trace = stream.trace(prompt_id)
+            release(stream, prompt_id)
+            if trace.started is not None:
+                started, finished = trace.started, trace.finished
+                timings = trace.node_timings(workflow)
+
+        if started is None:
+            clock = "server"
+            for event, data in history.get("status", {}).get("messages", []):
+                if event == "execution_start":
+                    started = data.get("timestamp", 0) / 1000
+                elif event in ("execution_success", "execution_error", "execution_interrupted"):
+                    finished = data.get("timestamp", 0) / 1000
+            if started is None:
+                return
+
+        self._add({"name": f"queued {label}", "cat": "queue", "ph": "b", "id": prompt_id,
+                   "pid": SERVER_PID, "ts": self._us(queued), "args": {"prompt_id": prompt_id}})
+        self._add({"name": f"queued {label}", "cat": "queue", "ph": "e", "id": prompt_id,
+                   "pid": SERVER_PID, "ts": self._us(max(queued, started))})
+        self.complete(label, started, finished or started, cat="prompt", pid=SERVER_PID,
+                      tid=EXECUTION_TID, args={"prompt_id": prompt_id, "status": status,
+                                               "clock": clock, "nodes": len(workflow),
+                                               "latent": latent_label(workflow),
+                                               "checkpoint": workflow_checkpoint(workflow)})
+
+        for timing in timings:
+            name = timing["class_type"] or f"node {timing['node']}"
+            if timing["cached"]:
+                self._add({"name": f"{name} (cached)", "cat": "node", "ph": "i", "s": "t",
+                           "pid": SERVER_PID, "tid": EXECUTION_TID, "ts": self._us(started),
+                           "args": {"node": timing["node"], "prompt_id": prompt_id}})
+            elif timing["seconds"] is not None:
+                args = {"node": timing["node"], "job": label, "prompt_id": prompt_id}
+                if timing["steps"]:
+                    args.update(steps=timing["steps"], step_seconds=timing["step_seconds"])
+                self.complete(name, timing["start"], timing["start"] + timing["seconds"], cat="node",
+                              pid=SERVER_PID, tid=EXECUTION_TID, args=args)
+
+    def to_chrome(self) -> Dict[str, Any]:
+        """The JSON object format of the Chrome trace event spec"""
+        with self._lock:
+            events = list(self._events)
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"script": self.script, "started": self.started,
+                              "duration": time.time() - self.started, "dropped_events": self.dropped}}
+
+    def export(self, directory: Path) -> Path:
+        """Write this run's trace"""
+        import json
+
+        directory.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(self.started))
+        path = directory / f"{self.script}_{stamp}.trace.json"
+        tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(self.to_chrome(), separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp_path, path)
+        return path
+
+
+_tracer: Optional[RunTrace] = None
+_checked = False
+_lock = threading.Lock()
+
+
+def get_tracer() -> Optional[RunTrace]:
+    """The process-wide trace if TRACE_DIR is set, else None"""
+    global _tracer, _checked
+    if _checked:
+        return _tracer
+    with _lock:
+        if not _checked:
+            directory = get_config("TRACE_DIR")
+            if directory:
+                import atexit
+                from urllib.parse import urlsplit
+
+                backend = urlsplit(get_config("COMFYUI_URL")).netloc or "unknown"
+                script = Path(sys.argv[0]).stem if sys.argv and sys.argv[0] else ""
+                _tracer = RunTrace(script or "python", backend)
+                atexit.register(_export_at_exit, Path(directory).expanduser())
+            _checked = True
+    return _tracer
+
+
+def _export_at_exit(directory: Path):
+    try:
+        path = _tracer.export(directory)
+        logger.info(f"🧭 Trace written to {path} (open in ui.perfetto.dev)")
+    except OSError as e:
+        logger.warning(f"⚠️  Could not write trace to {directory}: {e}")
+
+
+class _Span:
+    def __init__(self, tracer: RunTrace, name: str, cat: str, args: Dict[str, Any]):
+        self._tracer = tracer
+        self._name = name
+        self._cat = cat
+        self._args = args
+
+    def __enter__(self):
+        self._tracer._stack.append(self._name)
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.time()
+        self._tracer._stack.pop()
+        if exc_type is not None:
+            self._args["error"] = exc_type.__name__
+        self._tracer.complete(self._name, self._start, end, self._cat, self._args)
+        return False
+
+
+_NO_SPAN = nullcontext()
+
+
+def span(name: str, cat: str = "client", **args):
+    """Context manager timing a block as a slice on the calling thread's row (no-op when tracing is off)"""
+    tracer = _tracer if _checked else get_tracer()
+    if tracer is None:
+        return _NO_SPAN
+    return _Span(tracer, name, cat, args)
+
+
+def traced(fn: Callable, name: str, **args) -> Callable:
+    """fn wrapped in a 'job' span, for handing to a scheduler; fn itself when tracing is off"""
+    if (_tracer if _checked else get_tracer()) is None:
+        return fn
+
+    def run(*fn_args, **fn_kwargs):
+        with span(name, cat="job", **args):
+            return fn(*fn_args, **fn_kwargs)
+    return run
+
+
+def record_prompt(prompt_id: str, workflow: Dict[str, Any], history: Dict[str, Any], queued: float):
+    """Add a finished prompt's server-side slices (no-op when tracing is off)"""
+    tracer = _tracer if _checked else get_tracer()
+    if tracer is not None:
+        tracer.record_prompt(prompt_id, workflow, history, queued)
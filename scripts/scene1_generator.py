@@ -5,18 +5,11 @@ Specialized script for generating noir comic book panels based on the opening sc
 """
 
 import logging
-from datetime import datetime
-from config import get_config, get_output_path
-from comfyui_api import generate_image, check_server_status
+from config import configure_logging
+from utils import validate_seed
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
-# API Configuration
-COMFYUI_URL = get_config('COMFYUI_URL')
-
-
 # Shared style components for consistent visual language
 STYLE_PREFIX = """black and white comic book art, clean ink drawing, simple style,"""
 
@@ -71,17 +64,40 @@ GENERATION_PARAMS = {
     "n_iter": 2,  # Generate 2 variations per prompt
 }
 
+def build_request(prompt_key, seed=-1):
+    """Build generate_image() arguments for a Scene 1 panel"""
+    if prompt_key not in SCENE_1_PROMPTS:
+        raise KeyError(f"Unknown prompt key: {prompt_key}")
+    
+    scene_data = SCENE_1_PROMPTS[prompt_key]
+    
+    return {
+        # Complete prompt is prefix + panel spec + suffix; the shared style
+        # blocks and SHARED_NEGATIVE are encoded once per batch
+        "prompt_prefix": STYLE_PREFIX,
+        "prompt": scene_data['panel_spec'],
+        "prompt_suffix": STYLE_SUFFIX,
+        "negative_prompt": SHARED_NEGATIVE,
+        "width": GENERATION_PARAMS["width"],
+        "height": GENERATION_PARAMS["height"],
+        "steps": GENERATION_PARAMS["steps"],
+        "cfg_scale": GENERATION_PARAMS["cfg_scale"],
+        "sampler_name": GENERATION_PARAMS["sampler_name"],
+        "scheduler": GENERATION_PARAMS["scheduler"],
+        "seed": validate_seed(seed),
+        "batch_size": GENERATION_PARAMS["n_iter"],
+    }
+
 def generate_scene_1_panel(prompt_key, custom_seed=None):
     """Generate a specific panel for Scene 1"""
+    from shot_runner import make_shots, run_shots
+
     if prompt_key not in SCENE_1_PROMPTS:
         logger.error(f"Unknown prompt key: {prompt_key}")
         return False
     
     scene_data = SCENE_1_PROMPTS[prompt_key]
     
-    # Build complete prompt with prefix + panel spec + suffix
-    full_prompt = f"{STYLE_PREFIX} {scene_data['panel_spec']} {STYLE_SUFFIX}"
-    
     # Use custom seed if provided, otherwise use default from params
     seed = custom_seed if custom_seed is not None else GENERATION_PARAMS["seed"]
     
@@ -90,55 +106,24 @@ def generate_scene_1_panel(prompt_key, custom_seed=None):
     logger.info(f"🎯 Panel Spec: {scene_data['panel_spec'][:100]}...")
     
     try:
-        images = generate_image(
-            prompt=full_prompt,
-            negative_prompt=SHARED_NEGATIVE,
-            width=GENERATION_PARAMS["width"],
-            height=GENERATION_PARAMS["height"],
-            steps=GENERATION_PARAMS["steps"],
-            cfg_scale=GENERATION_PARAMS["cfg_scale"],
-            sampler_name=GENERATION_PARAMS["sampler_name"],
-            scheduler=GENERATION_PARAMS["scheduler"],
-            seed=seed,
-            batch_size=GENERATION_PARAMS["n_iter"],
-            timeout=300
-        )
-        
-        if images:
-            # Save generated images
-            for i, image_data in enumerate(images):
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"scene1_{prompt_key}_{timestamp}_v{i+1}.png"
-                filepath = get_output_path(filename)
-                
-                with open(filepath, 'wb') as f:
-                    f.write(image_data)
-                
-                file_size = len(image_data) / 1024
-                logger.info(f"✅ Saved: {filename} ({file_size:.1f}KB)")
-            
-            return True
-            
-        else:
-            logger.error("❌ No images returned from API")
-            return False
-            
-    except Exception as e:
+        summary = run_shots(make_shots("scene1", [prompt_key], seed=seed))
+    except (ValueError, KeyError) as e:
         logger.error(f"❌ Generation error: {e}")
         return False
+    
+    return summary["failed"] == 0
 
 def generate_complete_scene_1():
     """Generate all panels for Scene 1 - The Awakening"""
+    from shot_runner import make_shots, run_shots
+
     logger.info("🎭 DRIFTINGME - Scene 1: The Awakening")
     logger.info("=" * 50)
     
-    success_count = 0
     total_panels = len(SCENE_1_PROMPTS)
-    
-    for prompt_key in SCENE_1_PROMPTS.keys():
-        if generate_scene_1_panel(prompt_key):
-            success_count += 1
-        logger.info("-" * 30)
+    summary = run_shots(make_shots("scene1", list(SCENE_1_PROMPTS)))
+    success_count = summary["succeeded"]
+    logger.info("-" * 30)
     
     logger.info(f"\n📊 Scene 1 Generation Complete:")
     logger.info(f"✅ Successfully generated: {success_count}/{total_panels} panels")
@@ -151,6 +136,7 @@ def generate_complete_scene_1():
 def main():
     import sys
     
+    configure_logging()
     if len(sys.argv) > 1:
         panel_name = sys.argv[1]
         if panel_name == "all":
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Session Recorder
+Records the client's ComfyUI traffic to a compact trace file.
+
+With COMFYUI_RECORD set (in .env or the environment), every ComfyUI request
+made through comfyui_api is written to a gzipped JSONL trace with its start
+time, duration and status, plus every websocket event an EventStream
+receives (run_workflow opens the shared stream while recording, so prompts
+are queued with its client_id and their node events arrive):
+
+    COMFYUI_RECORD=outputs/traces/ep01.jsonl.gz python scripts/shot_runner.py ...
+
+The trace stays compact: submitted workflows and the history entries of
+our own prompts are kept, images only as their size and dimensions, and
+/object_info and /system_stats only when they change. session_replay
+re-serves a trace from a local server.
+"""
+
+import io
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from config import get_config
+
+logger = logging.getLogger(__name__)
+
+TRACE_VERSION = 1
+
+# Seconds between flushes of the trace file, so a killed run keeps its trace
+FLUSH_INTERVAL = 5
+
+
+def endpoint_of(method: str, path: str) -> str:
+    """'GET /history/abc?x=1' -> 'GET /history' (the grouping fake_comfyui counts by)"""
+    return f"{method} /{path.split('?', 1)[0].strip('/').split('/')[0]}"
+
+
+def png_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from a PNG header, None for other data"""
+    import struct
+
+    if data[:8] != b"\x89PNG\r\n\x1a\n" or len(data) < 24:
+        return None
+    return struct.unpack(">II", data[16:24])
+
+
+class _RecordedResponse(io.BytesIO):
+    """An HTTP response whose body was already read for the recording"""
+
+    def __init__(self, body: bytes, status: int, headers):
+        super().__init__(body)
+        self.status = status
+        self.headers = headers
+
+
+class TraceRecorder:
+    """Appends HTTP exchanges and websocket events to a trace file"""
+
+    def __init__(self, path: Path, server: str):
+        """
+        Args:
+            path: Trace file (gzipped if it ends in .gz)
+            server: ComfyUI URL being recorded
+        """
+        import gzip
+        from datetime import datetime, timezone
+
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = (gzip.open(self.path, "wt", encoding="utf-8") if self.path.suffix == ".gz"
+                      else open(self.path, "w", encoding="utf-8"))
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._last_flush = self._start
+        self._prompts: set = set()
+        self._last_bodies: Dict[str, str] = {}
+        self.stats = {"requests": 0, "events": 0}
+        self._write({"version": TRACE_VERSION, "server": server, "start": self._start,
+                     "created": datetime.now(timezone.utc).isoformat(timespec="seconds")})
+
+    def _write(self, entry: Dict[str, Any]):
+        line = json.dumps(entry, separators=(",", ":"), default=str)
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + "\n")
+            now = time.time()
+            if now - self._last_flush > FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = now
+
+    def urlopen(self, request, timeout: float) -> _RecordedResponse:
+        """urllib.request.urlopen() that records the exchange"""
+        import urllib.error
+        import urllib.request
+        from urllib.parse import urlsplit
+
+        url = urlsplit(request.full_url)
+        path = url.path + (f"?{url.query}" if url.query else "")
+        method = request.get_method()
+        entry = {"t": 0.0, "ms": 0.0, "method": method, "path": path}
+        start = time.time()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                body = response.read()
+                status, headers = response.status, response.headers
+        except urllib.error.HTTPError as e:
+            entry["status"] = e.code
+            raise
+        except OSError as e:
+            entry["error"] = str(e)
+            raise
+        finally:
+            entry["t"] = round(start - self._start, 4)
+            entry["ms"] = round((time.time() - start) * 1000, 2)
+            if "status" not in entry and "error" not in entry:
+                entry["status"] = status
+                entry.update(self._summarise(method, path, request.data, body))
+            elif request.data and endpoint_of(method, path) == "POST /prompt":
+                entry.update(self._summarise(method, path, request.data, b""))
+            self.stats["requests"] += 1
+            self._write(entry)
+        return _RecordedResponse(body, status, headers)
+
+    def _summarise(self, method: str, path: str, data: Optional[bytes], body: bytes) -> Dict[str, Any]:
+        """The parts of a request/response worth keeping for replay"""
+        endpoint = endpoint_of(method, path)
+        try:
+            if endpoint == "POST /prompt":
+                payload = json.loads(data)
+                with self._lock:
+                    self._prompts.add(payload.get("prompt_id"))
+                response = json.loads(body) if body else {}
+                with self._lock:
+                    self._prompts.add(response.get("prompt_id"))
+                return {"request": {"prompt_id": payload.get("prompt_id"), "workflow": payload.get("prompt")},
+                        "response": response}
+            if endpoint == "GET /history":
+                history = json.loads(body)
+                with self._lock:
+                    ours = {prompt_id: {"outputs": entry.get("outputs", {}), "status": entry.get("status", {})}
+                            for prompt_id, entry in history.items()
+                            if prompt_id in self._prompts and "outputs" in entry}
+                    self._prompts.difference_update(ours)
+                return {"entries": ours, "count": len(history)}
+            if endpoint == "GET /view":
+                return {"bytes": len(body), "size": png_dimensions(body)}
+            if endpoint == "GET /queue":
+                queue = json.loads(body)
+                return {"running": len(queue.get("queue_running", [])),
+                        "pending": len(queue.get("queue_pending", []))}
+            if endpoint in ("GET /object_info", "GET /system_stats"):
+                text = body.decode("utf-8")
+                with self._lock:
+                    changed = self._last_bodies.get(endpoint) != text
+                    self._last_bodies[endpoint] = text
+                return {"response": json.loads(text)} if changed else {}
+            if data:
+                return {"request": json.loads(data)}
+        except ValueError:
+            pass
+        return {}
+
+    def event(self, timestamp: float, event: str, data: Dict[str, Any]):
+        """Record a websocket event received at timestamp"""
+        self.stats["events"] += 1
+        self._write({"t": round(timestamp - self._start, 4), "ws": event, "data": data})
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+                logger.info(f"⏺️  Recorded {self.stats['requests']} request(s) and "
+                            f"{self.stats['events']} event(s) to {self.path}")
+
+
+_recorder: Optional[TraceRecorder] = None
+_recorder_checked = False
+_recorder_lock = threading.RLock()
+
+
+def start_recording(path: Path) -> TraceRecorder:
+    """Record this process's ComfyUI traffic to a trace file until exit"""
+    import atexit
+    global _recorder, _recorder_checked
+
+    with _recorder_lock:
+        if _recorder is not None:
+            _recorder.close()
+        _recorder = TraceRecorder(path, get_config("COMFYUI_URL"))
+        _recorder_checked = True
+        atexit.register(_recorder.close)
+    logger.info(f"⏺️  Recording ComfyUI session to {path}")
+    return _recorder
+
+
+def get_recorder() -> Optional[TraceRecorder]:
+    """The active recorder, started from COMFYUI_RECORD on first use; None when not recording"""
+    global _recorder_checked
+    if _recorder_checked:
+        return _recorder
+    with _recorder_lock:
+        if _recorder_checked:
+            return _recorder
+        path = get_config("COMFYUI_RECORD")
+        if path:
+            target = Path(path).expanduser()
+            if target.is_dir() or not target.suffix:
+                target = target / f"session_{time.strftime('%Y%m%dT%H%M%S')}.jsonl.gz"
+            return start_recording(target)
+        _recorder_checked = True
+        return None
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Session Replay
+Re-serves a recorded ComfyUI session locally with its original timing.
+
+Sessions are recorded with COMFYUI_RECORD (see session_recorder).
+ReplayComfyUI is a fake_comfyui server whose prompts run with the recorded
+per-node durations (from websocket events, or spread over the nodes from
+the history timestamps), recorded cache hits and failures, and synthetic
+images of the recorded size. Responses are held back by the recorded
+request latencies, so tunnel jitter is replayed too. Incoming prompts are
+matched to recorded ones by workflow, or by shape when only the seed
+differs; unmatched prompts fall back to the latency model. Scheduler and
+client changes can then be benchmarked offline against a real workload:
+
+    python scripts/session_replay.py info outputs/traces/ep01.jsonl.gz
+    python scripts/session_replay.py serve outputs/traces/ep01.jsonl.gz --port 8190
+    python scripts/load_test.py --replay outputs/traces/ep01.jsonl.gz
+"""
+
+import json
+import time
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from config import configure_logging
+from fake_comfyui import CHECKPOINTS, ExecutionPlan, FakeComfyUI, FakeSettings, OUTPUT_NODES
+from job_scheduler import job_key
+from session_recorder import TRACE_VERSION, endpoint_of
+
+logger = logging.getLogger(__name__)
+
+
+def node_signature(workflow: Dict[str, Any], node_id: str) -> str:
+    """A node's class and literal inputs, ignoring the seed and links (which embed node ids)"""
+    node = workflow[node_id]
+    inputs = {name: value for name, value in node.get("inputs", {}).items()
+              if name != "seed" and not (isinstance(value, list) and len(value) == 2)}
+    return json.dumps([node.get("class_type"), inputs], sort_keys=True)
+
+
+def shape_key(workflow: Dict[str, Any]) -> str:
+    """Key shared by workflows that only differ by seed"""
+    return job_key({"nodes": sorted(node_signature(workflow, node_id) for node_id in workflow)})
+
+
+class SessionTrace:
+    """A recorded session, indexed for replay"""
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: Trace file written by TraceRecorder
+
+        Raises:
+            ValueError: If the file is not a trace of a supported version
+        """
+        self.path = Path(path)
+        self.header: Dict[str, Any] = {}
+        self.prompts: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.images: Dict[Tuple[str, str, str], Tuple[int, int, int]] = {}
+        self.object_info: Optional[Dict[str, Any]] = None
+        self.system_stats: Optional[Dict[str, Any]] = None
+        self.events = 0
+        self.duration = 0.0
+        self._read()
+
+    def _lines(self):
+        import gzip
+
+        opener = gzip.open if self.path.suffix == ".gz" else open
+        with opener(self.path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    yield line
+            except EOFError:
+                # The recording process was killed before closing the file
+                logger.warning(f"⚠️  {self.path} is truncated; replaying what was flushed")
+
+    def _read(self):
+        from urllib.parse import parse_qs, urlsplit
+
+        events: Dict[str, List[Tuple[float, str, Dict[str, Any]]]] = {}
+        for number, line in enumerate(self._lines()):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning(f"Ignoring invalid line {number + 1} in {self.path}")
+                continue
+            if number == 0:
+                if entry.get("version") != TRACE_VERSION:
+                    raise ValueError(f"{self.path} is not a version {TRACE_VERSION} session trace")
+                self.header = entry
+                continue
+            self.duration = max(self.duration, entry.get("t", 0.0))
+
+            if "ws" in entry:
+                self.events += 1
+                # A prompt's first events can precede its POST /prompt entry,
+                # which is written when the response arrives
+                prompt_id = entry["data"].get("prompt_id")
+                if prompt_id:
+                    events.setdefault(prompt_id, []).append((entry["t"], entry["ws"], entry["data"]))
+                continue
+
+            endpoint = endpoint_of(entry["method"], entry["path"])
+            self.latencies.setdefault(endpoint, []).append(entry["ms"] / 1000)
+            status = str(entry.get("status", "error"))
+            counts = self.statuses.setdefault(endpoint, {})
+            counts[status] = counts.get(status, 0) + 1
+
+            if endpoint == "POST /prompt" and entry.get("request"):
+                prompt_id = (entry.get("response") or {}).get("prompt_id") or entry["request"]["prompt_id"]
+                if prompt_id and prompt_id not in self.prompts:
+                    self.prompts[prompt_id] = {"prompt_id": prompt_id, "t": entry["t"],
+                                               "workflow": entry["request"]["workflow"],
+                                               "entry": None, "events": []}
+            elif endpoint == "GET /history":
+                for prompt_id, history in entry.get("entries", {}).items():
+                    if prompt_id in self.prompts:
+                        self.prompts[prompt_id]["entry"] = history
+            elif endpoint == "GET /view" and entry.get("size"):
+                query = {key: values[-1] for key, values in parse_qs(urlsplit(entry["path"]).query).items()}
+                location = (query.get("type", "output"), query.get("subfolder", ""), query.get("filename", ""))
+                self.images[location] = (entry["size"][0], entry["size"][1], entry["bytes"])
+            elif endpoint == "GET /object_info" and "response" in entry:
+                self.object_info = entry["response"]
+            elif endpoint == "GET /system_stats" and "response" in entry:
+                self.system_stats = entry["response"]
+
+        for prompt_id, prompt in self.prompts.items():
+            prompt["events"] = events.get(prompt_id, [])
+
+    def recorded_timing(self, prompt_id: str) -> Dict[str, Any]:
+        """
+        What the server did with a recorded prompt
+
+        Returns:
+            'seconds' per executed node (from websocket events, empty without),
+            'total' execution seconds (None if unknown), 'cached' node ids,
+            the 'failed' node id (None if it succeeded) and its 'images' as
+            (width, height, bytes)
+        """
+        prompt = self.prompts[prompt_id]
+        timing: Dict[str, Any] = {"seconds": {}, "total": None, "cached": [], "failed": None, "images": []}
+
+        messages = (prompt["entry"] or {}).get("status", {}).get("messages", [])
+        stamps = {}
+        for event, data in messages:
+            stamps[event] = data.get("timestamp")
+            if event == "execution_cached":
+                timing["cached"] = data.get("nodes", [])
+            elif event in ("execution_error", "execution_interrupted"):
+                timing["failed"] = data.get("node_id")
+        end = stamps.get("execution_success") or stamps.get("execution_error") or stamps.get("execution_interrupted")
+        if stamps.get("execution_start") and end:
+            timing["total"] = (end - stamps["execution_start"]) / 1000
+
+        # Websocket events give per-node durations: each node runs until the next starts
+        current, started, first = None, None, None
+        for t, event, data in sorted(prompt["events"], key=lambda e: e[0]):
+            if event == "execution_start":
+                first = t
+            elif event == "execution_cached" and not timing["cached"]:
+                timing["cached"] = data.get("nodes", [])
+            elif event in ("executing", "execution_success", "execution_error", "execution_interrupted"):
+                if current is not None:
+                    timing["seconds"][current] = t - started
+                current, started = (data.get("node"), t) if event == "executing" else (None, None)
+                if event != "executing" and first is not None:
+                    timing["total"] = t - first
+                if event == "execution_error":
+                    timing["failed"] = data.get("node_id")
+
+        for node_output in (prompt["entry"] or {}).get("outputs", {}).values():
+            for image in node_output.get("images", []):
+                location = (image.get("type", "output"), image.get("subfolder", ""), image.get("filename", ""))
+                if location in self.images:
+                    timing["images"].append(self.images[location])
+        return timing
+
+    def summary(self) -> Dict[str, Any]:
+        """Counts and latency percentiles per endpoint"""
+        from load_test import percentiles
+
+        return {
+            "server": self.header.get("server"),
+            "created": self.header.get("created"),
+            "seconds": self.duration,
+            "prompts": len(self.prompts),
+            "completed": sum(1 for p in self.prompts.values() if p["entry"]),
+            "events": self.events,
+            "images": len(self.images),
+            "megabytes": sum(size for _, _, size in self.images.values()) / 1e6,
+            "endpoints": {endpoint: {"requests": len(values), "statuses": self.statuses[endpoint],
+                                     **percentiles(values)}
+                          for endpoint, values in sorted(self.latencies.items())},
+        }
+
+
+class ReplayComfyUI(FakeComfyUI):
+    """
+    Fake server that replays a SessionTrace
+
+        with ReplayComfyUI(SessionTrace(path), speed=2) as server:
+            override_config("COMFYUI_URL", server.url)
+    """
+
+    def __init__(self, trace: SessionTrace, speed: float = 1.0, host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            trace: Recorded session
+            speed: Replay this many times faster than recorded
+            host: Interface to listen on
+            port: Port to listen on (0: any free port)
+        """
+        checkpoints = list(CHECKPOINTS)
+        for prompt in trace.prompts.values():
+            for node in prompt["workflow"].values():
+                name = node.get("inputs", {}).get("ckpt_name")
+                if isinstance(name, str) and name not in checkpoints:
+                    checkpoints.append(name)
+        super().__init__(FakeSettings(checkpoints=tuple(checkpoints)), host=host, port=port)
+        self.trace = trace
+        self.speed = speed
+        self._exact: Dict[str, List[str]] = {}
+        self._shapes: Dict[str, List[str]] = {}
+        for prompt_id, prompt in trace.prompts.items():
+            if prompt["entry"] is None and not prompt["events"]:
+                continue  # never saw it finish
+            self._exact.setdefault(job_key(prompt["workflow"]), []).append(prompt_id)
+            self._shapes.setdefault(shape_key(prompt["workflow"]), []).append(prompt_id)
+        self._replayed: set = set()
+        self._latency_index: Dict[str, int] = {}
+        self.stats.update({"matched_exact": 0, "matched_shape": 0, "unmatched": 0})
+
+    def node_schema(self) -> Dict[str, Any]:
+        return self.trace.object_info or super().node_schema()
+
+    def system_stats(self) -> Dict[str, Any]:
+        return self.trace.system_stats or super().system_stats()
+
+    def response_delay(self, endpoint: str, query: Dict[str, str]) -> float:
+        recorded = self.trace.latencies.get(endpoint)
+        if not recorded:
+            return 0.0
+        with self._lock:
+            index = self._latency_index.get(endpoint, 0)
+            self._latency_index[endpoint] = index + 1
+        return recorded[index % len(recorded)] / self.speed
+
+    def match(self, workflow: Dict[str, Any]) -> Tuple[Optional[str], str]:
+        """Recorded prompt to replay for a workflow, preferring ones not replayed yet"""
+        for table, key, kind in ((self._exact, job_key(workflow), "exact"),
+                                 (self._shapes, shape_key(workflow), "shape")):
+            candidates = table.get(key)
+            if candidates:
+                with self._lock:
+                    prompt_id = next((p for p in candidates if p not in self._replayed), candidates[0])
+                    self._replayed.add(prompt_id)
+                return prompt_id, kind
+        return None, "unmatched"
+
+    def plan(self, prompt_id: str, workflow: Dict[str, Any], order: List[str]):
+        model = super().plan(prompt_id, workflow, order)
+        recorded_id, kind = self.match(workflow)
+        with self._lock:
+            self.stats["matched_" + kind if recorded_id else "unmatched"] += 1
+        if recorded_id is None:
+            return model
+
+        recorded = self.trace.prompts[recorded_id]["workflow"]
+        timing = self.trace.recorded_timing(recorded_id)
+        # Node ids differ when the seed does; nodes are matched by signature
+        seconds_by = {node_signature(recorded, n): s for n, s in timing["seconds"].items() if n in recorded}
+        cached_by = {node_signature(recorded, n) for n in timing["cached"] if n in recorded}
+        signatures = {node_id: node_signature(workflow, node_id) for node_id in order}
+        cached = [n for n in order if signatures[n] in cached_by
+                  and workflow[n]["class_type"] not in OUTPUT_NODES]
+
+        if seconds_by:
+            seconds = {n: seconds_by.get(signatures[n], 0.0) for n in order if n not in cached}
+        else:
+            # Only the total is known: the save nodes get the time our PNGs
+            # take, the rest is spread like the latency model would
+            seconds = {n: model.seconds.get(n, 0.0) for n in order if n not in cached}
+            outputs = [n for n in seconds if workflow[n]["class_type"] in OUTPUT_NODES]
+            sizes = [(w, h) for w, h, _ in timing["images"]] or \
+                [self._latent_size(workflow, workflow[n]["inputs"]["images"])[:2] for n in outputs]
+            saving = self.png_seconds(sizes) * self.speed
+            modelled = sum(s for n, s in seconds.items() if n not in outputs)
+            remaining = max(0.0, (timing["total"] or modelled + saving) - saving)
+            sampler = next((n for n in seconds if workflow[n]["class_type"] == "KSampler"), None)
+            if modelled > 0:
+                seconds = {n: s * remaining / modelled for n, s in seconds.items()}
+            elif sampler:
+                seconds[sampler] = remaining
+            for n in outputs:
+                seconds[n] = saving / len(outputs)
+
+        failing = None
+        if timing["failed"]:
+            failed_signature = node_signature(recorded, timing["failed"]) if timing["failed"] in recorded else None
+            failing = next((n for n in order if signatures[n] == failed_signature), order[-1])
+        return ExecutionPlan(cached=cached, seconds={n: s / self.speed for n, s in seconds.items()},
+                             failing=failing, images=timing["images"] or None)
+
+
+def main():
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or replay a recorded ComfyUI session")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    info = subparsers.add_parser("info", help="Summarise a trace")
+    info.add_argument("trace", type=Path)
+    info.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    serve = subparsers.add_parser("serve", help="Replay a trace from a local server")
+    serve.add_argument("trace", type=Path)
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8190)
+    serve.add_argument("--speed", type=float, default=1.0, help="Replay this many times faster")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    try:
+        trace = SessionTrace(args.trace)
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ Could not read {args.trace}: {e}")
+        sys.exit(1)
+
+    if args.command == "info":
+        summary = trace.summary()
+        if args.json:
+            print(json.dumps(summary, indent=2))
+            return
+        print(f"{summary['server']}  {summary['created']}  {summary['seconds']:.0f}s, "
+              f"{summary['completed']}/{summary['prompts']} prompt(s) completed, {summary['events']} event(s), "
+              f"{summary['images']} image(s) / {summary['megabytes']:.1f} MB")
+        for endpoint, stats in summary["endpoints"].items():
+            statuses = ", ".join(f"{status}: {count}" for status, count in sorted(stats["statuses"].items()))
+            print(f"  {endpoint:<20} {stats['requests']:>6}  p50 {stats['p50'] * 1000:7.1f}ms  "
+                  f"p99 {stats['p99'] * 1000:7.1f}ms  ({statuses})")
+        return
+
+    server = ReplayComfyUI(trace, speed=args.speed, host=args.host, port=args.port).start()
+    logger.info(f"🔁 Replaying {len(trace.prompts)} recorded prompt(s) on {server.url} "
+                f"at {args.speed:g}x (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        logger.info(f"📊 {server.stats['prompts']} prompt(s): {server.stats['matched_exact']} exact, "
+                    f"{server.stats['matched_shape']} by shape, {server.stats['unmatched']} unmatched")
+
+
+if __name__ == "__main__":
+    main()
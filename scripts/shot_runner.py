@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Shot-List Runner
+Renders a declarative YAML/JSON shot list through the shared job scheduler.
+
+A shot list references the prompt sets defined in the generator scripts and
+can override generation parameters per shot:
+
+    name: scene1_review
+    parallel: 2
+    defaults:
+      seed: 12345678
+    shots:
+      - set: integrated
+        key: scene1_awakening_integrated
+      - set: character
+        keys: [character_profile_front, character_profile_side]
+        variations: 3
+        checkpoint: deliberate_v3.safetensors
+      - set: noir
+        key: all
+        width: 768
+        height: 512
+
+A top-level `dedup: 0.92` culls variations whose perceptual hash is at least
+that similar to an image already kept for the same shot (see perceptual_hash);
+the first image of a shot is always kept.
+"""
+
+import re
+import sys
+import json
+import importlib
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from config import configure_logging, OUTPUT_DIR
+from comfyui_api import DEFAULT_CHECKPOINT, create_basic_workflow, random_seed, run_workflow
+from job_scheduler import JobScheduler, job_key, DEFAULT_MAX_WORKERS
+from output_retention import record_retrieved
+from output_writer import get_writer
+from perceptual_hash import NearDuplicateFilter, format_hash, phash_images
+from prompt_compiler import compile_request
+import run_metrics
+import run_trace
+from utils import validate_prompt_key, validate_seed, validate_dimensions
+
+logger = logging.getLogger(__name__)
+
+
+class PromptSet(NamedTuple):
+    """A prompt dictionary living in one of the generator scripts"""
+    module: str
+    prompts: str
+    filename_prefix: str
+
+
+# Prompt sets that shot lists can reference by name
+PROMPT_SETS = {
+    "character": PromptSet("character_generator", "CHARACTER_PROMPTS", "character"),
+    "clear_character": PromptSet("clear_character_generator", "REFINED_CHARACTER_PROMPTS", "clear"),
+    "integrated": PromptSet("integrated_generator", "INTEGRATED_SCENES", "integrated"),
+    "noir": PromptSet("noir_generator", "NOIR_SCENES", "noir"),
+    "scene1": PromptSet("scene1_generator", "SCENE_1_PROMPTS", "scene1"),
+}
+
+# Shot-list override name -> generate_image() argument
+OVERRIDE_FIELDS = {
+    "seed": "seed",
+    "width": "width",
+    "height": "height",
+    "steps": "steps",
+    "cfg_scale": "cfg_scale",
+    "sampler": "sampler_name",
+    "scheduler": "scheduler",
+    "checkpoint": "ckpt_name",
+    "variations": "batch_size",
+}
+
+# Shot-list options handled by execute_shot() rather than generate_image()
+SHOT_OPTIONS = ("noir_check", "max_chunks")
+
+# Extra renders for images rejected by the noir check
+NOIR_CHECK_RETRIES = 2
+
+DEFAULT_TIMEOUT = 300
+
+# Shot list names become state file names, so no separators or leading dots
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+
+class Shot(NamedTuple):
+    """One entry of an expanded shot list"""
+    id: str
+    prompt_set: str
+    key: str
+    overrides: Optional[Dict[str, Any]] = None
+
+
+def get_prompt_set(name: str) -> Dict[str, Any]:
+    """Import a generator module on demand and return its prompt dictionary"""
+    if name not in PROMPT_SETS:
+        raise KeyError(f"Unknown prompt set: {name}. Available: {list(PROMPT_SETS)}")
+    prompt_set = PROMPT_SETS[name]
+    module = importlib.import_module(prompt_set.module)
+    return getattr(module, prompt_set.prompts)
+
+
+def resolve_request(shot: Shot) -> Dict[str, Any]:
+    """
+    Build the generate_image() arguments for a shot
+
+    The generator module's build_request() supplies the prompt and its
+    tuned defaults; shot overrides are applied and validated on top, and
+    the prompt texts are compiled (see prompt_compiler).
+    """
+    if shot.prompt_set not in PROMPT_SETS:
+        raise KeyError(f"Unknown prompt set: {shot.prompt_set}")
+
+    module = importlib.import_module(PROMPT_SETS[shot.prompt_set].module)
+    request = module.build_request(shot.key)
+
+    for name, value in (shot.overrides or {}).items():
+        if name in SHOT_OPTIONS:
+            continue
+        if name not in OVERRIDE_FIELDS:
+            raise ValueError(f"Shot {shot.id}: unknown override '{name}'. "
+                             f"Allowed: {sorted(OVERRIDE_FIELDS) + list(SHOT_OPTIONS)}")
+        request[OVERRIDE_FIELDS[name]] = value
+
+    request["seed"] = validate_seed(request["seed"])
+    validate_dimensions(request["width"], request["height"])
+    if not isinstance(request["batch_size"], int) or not 1 <= request["batch_size"] <= 16:
+        raise ValueError(f"Shot {shot.id}: variations must be an integer between 1 and 16")
+
+    max_chunks = (shot.overrides or {}).get("max_chunks")
+    if max_chunks is not None and (not isinstance(max_chunks, int) or max_chunks < 1):
+        raise ValueError(f"Shot {shot.id}: max_chunks must be a positive integer")
+
+    return compile_request(request, max_chunks=max_chunks)
+
+
+def execute_shot(shot: Shot, request: Dict[str, Any], timeout: int = DEFAULT_TIMEOUT,
+                 subdir: Optional[str] = None,
+                 dedup: Optional[NearDuplicateFilter] = None) -> List[str]:
+    """
+    Generate one shot and save its images
+
+    Args:
+        shot: Shot to render
+        request: generate_image() arguments from resolve_request()
+        timeout: Generation timeout in seconds
+        subdir: Optional directory below outputs/ to save into instead of a store shard
+        dedup: Near-duplicate filter for this shot only; culled images are not saved
+
+    Returns:
+        List of saved filenames, relative to outputs/; the files are on disk
+        and recorded in the output store when this returns
+
+    Raises:
+        The write error of the first image that could not be saved
+    """
+    prefix = PROMPT_SETS[shot.prompt_set].filename_prefix
+    if request["seed"] == -1:
+        # Resolve here so the manifest records the seed that was actually used
+        request = dict(request, seed=random_seed())
+    logger.info(f"🎬 Rendering {shot.id} ({shot.prompt_set}/{shot.key}, seed {request['seed']})")
+
+    noir_check = bool((shot.overrides or {}).get("noir_check"))
+    wanted = request["batch_size"]
+    accepted = []
+    for attempt in range(1 + (NOIR_CHECK_RETRIES if noir_check else 0)):
+        if attempt:
+            request = dict(request, seed=random_seed(), batch_size=wanted - len(accepted))
+            logger.info(f"🔁 Re-rendering {request['batch_size']} image(s) of {shot.id} "
+                        f"with seed {request['seed']}")
+
+        with run_trace.span("compile", stage="workflow"):
+            workflow = create_basic_workflow(**request)
+        with run_metrics.labelled(family=shot.prompt_set):
+            outputs = run_workflow(workflow, timeout=timeout)
+        images = [image for node_images in outputs.values() for image in node_images]
+        if not images:
+            raise RuntimeError(f"No images returned for {shot.id}")
+
+        metadata = {
+            "scene": shot.key,
+            "prompt_set": shot.prompt_set,
+            "shot": shot.id,
+            "seed": request["seed"],
+            "params": request,
+            "workflow_hash": job_key(workflow),
+        }
+        if noir_check:
+            with run_trace.span("post-process", step="noir_check"):
+                accepted.extend(_noir_filter(shot, images, metadata))
+        else:
+            accepted.extend((image, metadata) for image in images)
+        if len(accepted) >= wanted:
+            break
+
+    if not accepted:
+        raise RuntimeError(f"Every image of {shot.id} failed the noir check")
+    if noir_check and len(accepted) < wanted:
+        logger.warning(f"⚠️  {shot.id}: only {len(accepted)}/{wanted} image(s) passed the noir check")
+
+    if dedup is not None:
+        with run_trace.span("post-process", step="dedup"):
+            accepted = _cull_duplicates(shot, accepted, dedup)
+        if not accepted:
+            raise RuntimeError(f"No image of {shot.id} was kept after near-duplicate culling")
+
+    # Saved in the background; the server's copy is released once it is on disk
+    writer = get_writer()
+    saved = [writer.submit(image.data, f"{prefix}_{shot.key}", metadata,
+                           subdir=subdir, retrieved=[image])
+             for image, metadata in accepted]
+    # The scheduler records the result in its resume state once this returns,
+    # so only return once the writes are durable
+    writer.wait(saved)
+    return saved
+
+
+def _noir_filter(shot: Shot, images: List[Any], metadata: Dict[str, Any]) -> List[Tuple[Any, Dict[str, Any]]]:
+    """Images that pass the noir style check, each with its scores in the manifest params"""
+    from noir_score import score_images
+
+    passed, rejected = [], []
+    for image, score in zip(images, score_images(image.data for image in images)):
+        if score["reasons"]:
+            rejected.append(image)
+            logger.warning(f"🚫 Rejected off-style image of {shot.id}: {'; '.join(score['reasons'])}")
+        else:
+            scores = {name: round(value, 4) for name, value in score.items() if name != "reasons"}
+            passed.append((image, dict(metadata, params={**metadata["params"], "noir_score": scores})))
+
+    # Never promoted; let the retention collector reclaim ComfyUI's copies
+    record_retrieved(rejected)
+    return passed
+
+
+def _cull_duplicates(shot: Shot, accepted: List[Tuple[Any, Dict[str, Any]]],
+                     dedup: NearDuplicateFilter) -> List[Tuple[Any, Dict[str, Any]]]:
+    """Drop images too similar to one already kept for the shot; the rest carry their phash"""
+    kept, culled = [], []
+    hashes = phash_images(image.data for image, _ in accepted)
+    for (image, metadata), value in zip(accepted, hashes):
+        label = f"{shot.id}/{image.filename}"
+        match = dedup.check(value, label)
+        if match is None:
+            kept.append((image, dict(metadata, phash=format_hash(value))))
+        else:
+            culled.append(image)
+            logger.info(f"♻️  Culled near-duplicate of {match}: {label}")
+
+    record_retrieved(culled)
+    return kept
+
+
+def run_shots(shots: List[Shot], max_workers: int = DEFAULT_MAX_WORKERS,
+              state_file: Optional[Path] = None,
+              timeout: int = DEFAULT_TIMEOUT,
+              dedup_threshold: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Render shots concurrently through the shared scheduler
+
+    All shots are resolved and validated before anything is queued, so an
+    invalid shot list fails fast with ValueError/KeyError.
+
+    Args:
+        shots: Shots to render
+        max_workers: Number of shots in flight at once
+        state_file: JSONL file for resuming; completed shots are skipped
+        timeout: Per-shot generation timeout in seconds
+        dedup_threshold: Perceptual similarity (0-1) above which variations
+            are culled as near-duplicates of an image already kept for the same shot
+
+    Returns:
+        Summary dict with total/succeeded/failed counts, saved files, culled
+        near-duplicates, scheduler stats and output writer stats
+    """
+    planned = []
+    for shot in shots:
+        with run_trace.span("compile", shot=shot.id):
+            planned.append((shot, resolve_request(shot)))
+
+    files = []
+    succeeded = 0
+    filters = []
+    with JobScheduler(max_workers=max_workers, state_file=state_file) as scheduler:
+        futures = []
+        for shot, request in planned:
+            key_payload = dict(request)
+            if request["seed"] == -1:
+                # Random-seed shots are never duplicates of each other
+                key_payload["shot"] = shot.id
+            if (shot.overrides or {}).get("noir_check"):
+                # Checked renders may differ from unchecked ones (re-rolled seeds)
+                key_payload["noir_check"] = True
+            key = job_key(key_payload)
+            job = run_trace.traced(execute_shot, shot.id, prompt_set=shot.prompt_set)
+            # One filter per shot: variations are only compared with their siblings
+            dedup = NearDuplicateFilter(dedup_threshold) if dedup_threshold else None
+            if dedup is not None:
+                filters.append(dedup)
+            futures.append((shot, scheduler.submit(key, job, shot, request, timeout, dedup=dedup)))
+
+        for shot, future in futures:
+            try:
+                saved = future.result()
+                succeeded += 1
+                files.extend(f for f in saved if f not in files)
+            except Exception as e:
+                logger.error(f"❌ Shot {shot.id} failed: {e}")
+
+    return {
+        "total": len(shots),
+        "succeeded": succeeded,
+        "failed": len(shots) - succeeded,
+        "files": files,
+        "culled": sum(f.stats["culled"] for f in filters),
+        "stats": dict(scheduler.stats),
+        "writes": get_writer().report(),
+    }
+
+
+def make_shots(prompt_set: str, keys: List[str], **overrides) -> List[Shot]:
+    """Convenience for the generator scripts: one shot per prompt key"""
+    return [Shot(id=key, prompt_set=prompt_set, key=key, overrides=dict(overrides))
+            for key in keys]
+
+
+def load_document(path: Path) -> Dict[str, Any]:
+    """Parse a YAML or JSON shot list"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    if path.suffix.lower() in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("PyYAML is required for YAML shot lists (pip install pyyaml), "
+                               "or use a .json shot list")
+        return yaml.safe_load(text) or {}
+
+    return json.loads(text)
+
+
+def load_shot_list(path: Path) -> Dict[str, Any]:
+    """
+    Load and expand a shot list file
+
+    Returns:
+        Dict with 'name', 'parallel', 'dedup' (similarity threshold or None)
+        and the expanded list of Shot under 'shots'
+    """
+    path = Path(path)
+    document = load_document(path)
+
+    if not isinstance(document, dict) or not isinstance(document.get("shots"), list):
+        raise ValueError(f"{path}: shot list must be a mapping with a 'shots' list")
+
+    defaults = document.get("defaults", {}) or {}
+    shots = []
+    seen_ids = set()
+
+    for index, entry in enumerate(document["shots"], 1):
+        if not isinstance(entry, dict) or "set" not in entry:
+            raise ValueError(f"{path}: shot #{index} needs a 'set'")
+
+        entry = dict(entry)
+        set_name = entry.pop("set")
+        prompts = get_prompt_set(set_name)
+
+        if "key" in entry:
+            keys = [entry.pop("key")]
+        elif "keys" in entry:
+            keys = list(entry.pop("keys"))
+        else:
+            raise ValueError(f"{path}: shot #{index} needs 'key' or 'keys'")
+
+        if keys == ["all"]:
+            keys = list(prompts)
+
+        shot_id = entry.pop("id", None)
+        overrides = {**defaults, **entry}
+
+        for key in keys:
+            if not validate_prompt_key(key) or key not in prompts:
+                raise KeyError(f"{path}: shot #{index}: unknown {set_name} key '{key}'")
+
+            sid = shot_id if shot_id and len(keys) == 1 else f"{set_name}:{key}"
+            if sid in seen_ids:
+                sid = f"{sid}#{index}"
+            seen_ids.add(sid)
+            shots.append(Shot(id=sid, prompt_set=set_name, key=key, overrides=overrides))
+
+    name = document.get("name", path.stem)
+    if not isinstance(name, str) or not _SAFE_NAME.match(name):
+        raise ValueError(f"{path}: name must be letters, digits, '_', '-' or '.', "
+                         f"starting with a letter or digit (got {name!r})")
+
+    return {
+        "name": name,
+        "parallel": int(document.get("parallel", DEFAULT_MAX_WORKERS)),
+        "dedup": _dedup_threshold(document.get("dedup"), path),
+        "shots": shots,
+    }
+
+
+def _dedup_threshold(value: Any, source: Any) -> Optional[float]:
+    if value is None or value is False:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 < value <= 1:
+        raise ValueError(f"{source}: dedup must be a similarity between 0 and 1")
+    return float(value)
+
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Render a DriftingMe shot list")
+    parser.add_argument("shot_list", type=Path, help="YAML or JSON shot list")
+    parser.add_argument("--parallel", type=int,
+                        help="Shots in flight at once (overrides the shot list)")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Ignore and reset the resume state of this shot list")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT,
+                        help="Per-shot timeout in seconds")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Validate and print the expanded shots without rendering")
+    parser.add_argument("--noir-check", action="store_true",
+                        help="Reject and re-render off-style images in every shot")
+    parser.add_argument("--dedup", type=float, metavar="SIMILARITY",
+                        help="Cull near-duplicate variations at or above this perceptual "
+                             "similarity, e.g. 0.92 (overrides the shot list)")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    try:
+        shot_list = load_shot_list(args.shot_list)
+        shots = shot_list["shots"]
+        dedup = _dedup_threshold(args.dedup, "--dedup") if args.dedup is not None else shot_list["dedup"]
+        if args.noir_check:
+            shots = [shot._replace(overrides={**(shot.overrides or {}), "noir_check": True})
+                     for shot in shots]
+        if args.dry_run:
+            for shot in shots:
+                request = resolve_request(shot)
+                logger.info(f"  • {shot.id}: {request['width']}x{request['height']}, "
+                            f"seed {request['seed']}, {request['batch_size']} variation(s), "
+                            f"{request.get('ckpt_name', DEFAULT_CHECKPOINT)}")
+            logger.info(f"📋 {len(shots)} shot(s) valid")
+            return
+    except (ValueError, KeyError, RuntimeError, OSError) as e:
+        logger.error(f"Invalid shot list: {e}")
+        sys.exit(1)
+
+    state_file = OUTPUT_DIR / ".shot_state" / f"{shot_list['name']}.jsonl"
+    if args.no_resume and state_file.exists():
+        state_file.unlink()
+
+    parallel = args.parallel or shot_list["parallel"]
+    logger.info(f"🎬 DriftingMe Shot List: {shot_list['name']} "
+                f"({len(shots)} shots, {parallel} in parallel)")
+    logger.info("=" * 60)
+
+    summary = run_shots(shots, max_workers=parallel, state_file=state_file,
+                        timeout=args.timeout, dedup_threshold=dedup)
+
+    stats = summary["stats"]
+    logger.info("\n📊 Shot List Complete:")
+    logger.info(f"✅ Successfully generated: {summary['succeeded']}/{summary['total']} shots")
+    logger.info(f"🔁 Resumed: {stats['resumed']}  🔗 Deduplicated: {stats['deduplicated']}")
+    logger.info(f"📁 Files: {len(summary['files'])}")
+    if dedup:
+        logger.info(f"♻️  Near-duplicates culled: {summary['culled']} (similarity >= {dedup:g})")
+    writes = summary["writes"]
+    logger.info(f"💾 Writes: {writes['throughput_mb_s']:.1f}MB/s, "
+                f"queue high-water {writes['high_water']}, blocked {writes['blocked_seconds']:.2f}s")
+
+    if summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Similarity Index
+Finds the outputs that look like a reference image, with their seeds and settings.
+
+Every output's 64-bit perceptual hash (see perceptual_hash) is kept in one
+NumPy array cached at outputs/.similarity/phash_index.npz. A query XORs the
+reference hash against the whole array and counts bits, which takes about a
+millisecond for hundreds of thousands of images, then looks the nearest
+rows up in the manifest for their scene, seed and parameters.
+
+The index is updated incrementally: each refresh only reads manifest rows
+added since the cached rowid, and hashes outputs recorded without one in a
+process pool, writing the hashes back to the manifest. Matches can be
+re-rendered with more steps through shot_runner.
+"""
+
+import os
+import sys
+import time
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from config import configure_logging, get_output_path, OUTPUT_DIR
+from output_store import get_store
+from perceptual_hash import HASH_BITS, format_hash, phash, phash_images
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = OUTPUT_DIR / ".similarity" / "phash_index.npz"
+DEFAULT_NEIGHBOURS = 10
+RERENDER_STEPS = 40
+
+
+def _popcount(values):
+    """Set bits per uint64"""
+    import numpy as np
+
+    if hasattr(np, "bitwise_count"):  # NumPy 2.0+
+        return np.bitwise_count(values)
+    table = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    return table[values.view(np.uint8)].reshape(len(values), 8).sum(axis=1)
+
+
+def _hash_files(paths: List[str]) -> List[Optional[int]]:
+    """Perceptual hashes of files relative to outputs/, None if unreadable (runs in a worker process)"""
+    try:
+        return phash_images(get_output_path(path) for path in paths)
+    except Exception:
+        # One bad file spoils the batch; hash the chunk one by one
+        hashes: List[Optional[int]] = []
+        for path in paths:
+            try:
+                hashes.append(phash(get_output_path(path)))
+            except Exception as e:
+                logger.warning(f"⚠️  Could not hash {path}: {e}")
+                hashes.append(None)
+        return hashes
+
+
+class SimilarityIndex:
+    """Perceptual hashes of all recorded outputs, searchable by Hamming distance"""
+
+    def __init__(self, index_file: Path = INDEX_FILE):
+        """
+        Args:
+            index_file: Cache of the hash array; rebuilt from the manifest if missing
+        """
+        self.index_file = Path(index_file)
+        self._reset()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def _reset(self):
+        import numpy as np
+
+        self.last_rowid = 0
+        self.ids = np.empty(0, dtype="S32")
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def _load(self):
+        import numpy as np
+
+        if not self.index_file.exists():
+            return
+        try:
+            with np.load(self.index_file) as cached:
+                self.ids, self.hashes = cached["ids"], cached["hashes"]
+                self.last_rowid = int(cached["last_rowid"])
+        except Exception as e:
+            logger.warning(f"⚠️  Rebuilding unreadable similarity index {self.index_file}: {e}")
+            self._reset()
+
+    def _save(self):
+        import numpy as np
+
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_file.with_name(self.index_file.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, ids=self.ids, hashes=self.hashes, last_rowid=np.int64(self.last_rowid))
+        os.replace(tmp_path, self.index_file)
+
+    def _append(self, rows: List[Tuple[str, int]]):
+        import numpy as np
+
+        if rows:
+            self.ids = np.concatenate([self.ids, np.array([r[0] for r in rows], dtype="S32")])
+            self.hashes = np.concatenate([self.hashes, np.array([r[1] for r in rows], dtype=np.uint64)])
+
+    def refresh(self, workers: Optional[int] = None, chunk: int = 64) -> Dict[str, int]:
+        """
+        Bring the index up to date with the manifest
+
+        Args:
+            workers: Processes for hashing outputs that have no hash yet
+                (default: one per CPU)
+            chunk: Images per worker task
+
+        Returns:
+            Counts of 'added' rows, 'hashed' back-fills and 'failed' files
+        """
+        store = get_store()
+        if store.last_rowid() < self.last_rowid:
+            logger.info("🔄 Manifest was replaced; rebuilding the similarity index")
+            self._reset()
+
+        counts = {"added": 0, "hashed": 0, "failed": 0}
+        missing = store.missing_phashes()
+        if missing:
+            from concurrent.futures import ProcessPoolExecutor
+
+            logger.info(f"🔍 Hashing {len(missing)} output(s) recorded without a perceptual hash")
+            paths = [path for _, _, path in missing]
+            chunks = [paths[i:i + chunk] for i in range(0, len(paths), chunk)]
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+                hashes = [value for part in pool.map(_hash_files, chunks) for value in part]
+
+            store.set_phashes([(output_id, format_hash(value) if value is not None else "")
+                               for (_, output_id, _), value in zip(missing, hashes)])
+            counts["hashed"] = sum(value is not None for value in hashes)
+            counts["failed"] = len(hashes) - counts["hashed"]
+            # Rows past last_rowid are picked up below with everything else
+            backfilled = [(output_id, value) for (rowid, output_id, _), value in zip(missing, hashes)
+                          if value is not None and rowid <= self.last_rowid]
+            self._append(backfilled)
+            counts["added"] += len(backfilled)
+
+        new_rows = store.phashes_since(self.last_rowid)
+        self._append([(output_id, int(value, 16)) for _, output_id, value in new_rows])
+        counts["added"] += len(new_rows)
+        if new_rows:
+            self.last_rowid = new_rows[-1][0]
+        if counts["added"]:
+            self._save()
+        return counts
+
+    def nearest(self, value: int, k: int = DEFAULT_NEIGHBOURS,
+                max_distance: Optional[int] = None) -> List[Tuple[int, str]]:
+        """
+        Closest hashes to a reference hash
+
+        Args:
+            value: Reference perceptual hash
+            k: Maximum number of matches
+            max_distance: Only return matches within this many differing bits
+
+        Returns:
+            (Hamming distance, output id) pairs, closest first
+        """
+        import numpy as np
+
+        if not len(self.hashes):
+            return []
+        distances = _popcount(self.hashes ^ np.uint64(value))
+        # Distances are 0-64: a histogram gives the radius holding the k nearest
+        # without sorting or partitioning the whole array
+        radius = int(np.searchsorted(np.cumsum(np.bincount(distances, minlength=HASH_BITS + 1)), k))
+        if max_distance is not None:
+            radius = min(radius, max_distance)
+        candidates = np.flatnonzero(distances <= radius)
+        # Closest first; among equals the newest output first
+        candidates = candidates[np.lexsort((-candidates, distances[candidates]))][:k]
+        return [(int(distances[i]), self.ids[i].decode()) for i in candidates]
+
+    def search(self, reference, k: int = DEFAULT_NEIGHBOURS,
+               min_similarity: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Manifest rows of the outputs that look most like a reference
+
+        Args:
+            reference: Perceptual hash, or PNG bytes / path of the reference image
+            k: Maximum number of matches
+            min_similarity: Drop matches below this similarity (0-1)
+
+        Returns:
+            Manifest rows (with decoded params) plus 'distance' and 'similarity'
+        """
+        value = reference if isinstance(reference, int) else phash(reference)
+        max_distance = None if min_similarity is None else int((1 - min_similarity) * HASH_BITS)
+        matches = self.nearest(value, k, max_distance)
+        distances = {output_id: distance for distance, output_id in matches}
+        rows = get_store().get_outputs([output_id for _, output_id in matches])
+        for row in rows:
+            row["distance"] = distances[row["id"]]
+            row["similarity"] = 1 - row["distance"] / HASH_BITS
+        return rows
+
+
+def rerender_shots(rows: List[Dict[str, Any]], steps: int = RERENDER_STEPS) -> List[Any]:
+    """
+    Shots that re-render matched outputs with their recorded seed and settings
+
+    The whole original batch is rendered again: in a batch every variation
+    shares one seed, so a single image cannot be reproduced on its own.
+
+    Args:
+        rows: Matches from SimilarityIndex.search()
+        steps: Sampling steps for the re-render (never fewer than the original)
+    """
+    from shot_runner import OVERRIDE_FIELDS, PROMPT_SETS, Shot
+
+    shots = []
+    for row in rows:
+        if row["prompt_set"] not in PROMPT_SETS or not row["scene"]:
+            logger.warning(f"⚠️  Cannot re-render {row['path']}: prompt set "
+                           f"'{row['prompt_set']}' is not available to shot lists")
+            continue
+        params = row["params"]
+        overrides = {name: params[field] for name, field in OVERRIDE_FIELDS.items() if field in params}
+        overrides["seed"] = row["seed"]
+        overrides["steps"] = max(steps, int(params.get("steps") or 0))
+        shots.append(Shot(id=f"rerender:{row['id'][:12]}", prompt_set=row["prompt_set"],
+                          key=row["scene"], overrides=overrides))
+    return shots
+
+
+def main():
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Find outputs that look like a reference image")
+    parser.add_argument("reference", nargs="?", type=Path, help="Reference image (any PNG/JPEG)")
+    parser.add_argument("--id", dest="output_id", help="Use a recorded output as the reference")
+    parser.add_argument("-k", type=int, default=DEFAULT_NEIGHBOURS, help="Matches to show")
+    parser.add_argument("--min-similarity", type=float, help="Only show matches at least this similar (0-1)")
+    parser.add_argument("--json", action="store_true", help="Print full rows as JSON lines")
+    parser.add_argument("--no-refresh", action="store_true", help="Query the cached index as is")
+    parser.add_argument("--workers", type=int, help="Processes for hashing (default: one per CPU)")
+    parser.add_argument("--rerender", type=int, nargs="?", const=1, metavar="N",
+                        help="Re-render the N best matches (default 1) with their seed and settings")
+    parser.add_argument("--steps", type=int, default=RERENDER_STEPS,
+                        help=f"Sampling steps for --rerender (default: {RERENDER_STEPS})")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    index = SimilarityIndex()
+    if not args.no_refresh:
+        start = time.time()
+        counts = index.refresh(workers=args.workers)
+        logger.info(f"🗂️  {len(index)} output(s) indexed, {counts['added']} new "
+                    f"({time.time() - start:.2f}s)")
+        if counts["failed"]:
+            logger.warning(f"⚠️  {counts['failed']} output(s) could not be hashed")
+
+    if args.output_id:
+        rows = get_store().get_outputs([args.output_id])
+        if not rows or not rows[0]["phash"]:
+            logger.error(f"❌ No hashed output with id {args.output_id}")
+            sys.exit(1)
+        reference = int(rows[0]["phash"], 16)
+    elif args.reference:
+        try:
+            reference = phash(args.reference)
+        except Exception as e:
+            logger.error(f"❌ Could not read {args.reference}: {e}")
+            sys.exit(1)
+    else:
+        return
+
+    start = time.time()
+    rows = index.search(reference, k=args.k, min_similarity=args.min_similarity)
+    elapsed = time.time() - start
+
+    for row in rows:
+        if args.json:
+            print(json.dumps(row))
+        else:
+            params = row["params"]
+            print(f"{row['similarity']:.3f}  {row['path']}  {row['scene']}  seed={row['seed']}  "
+                  f"cfg={params.get('cfg_scale')}  steps={params.get('steps')}  "
+                  f"{params.get('sampler_name')}/{params.get('scheduler')}")
+    logger.info(f"🔎 {len(rows)} match(es) in {elapsed * 1000:.1f}ms")
+
+    if args.rerender and rows:
+        from shot_runner import run_shots
+
+        shots = rerender_shots(rows[:args.rerender], steps=args.steps)
+        if not shots:
+            sys.exit(1)
+        summary = run_shots(shots, max_workers=1)
+        for path in summary["files"]:
+            similarity = 1 - bin(phash(get_output_path(path)) ^ reference).count("1") / HASH_BITS
+            logger.info(f"🎬 {path}  similarity to reference {similarity:.3f}")
+        if summary["failed"]:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,10 @@ Input validation, HTTP session management, and common functions
 import re
 import logging
 import time
-from typing import Optional
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
 
 logger = logging.getLogger(__name__)
 
@@ -54,7 +54,7 @@ def validate_dimensions(width: int, height: int) -> tuple:
     return width, height
 
 
-def create_resilient_session(max_retries: int = 3) -> requests.Session:
+def create_resilient_session(max_retries: int = 3) -> "requests.Session":
     """
     Create HTTP session with automatic retries and connection pooling
     
@@ -64,13 +64,21 @@ def create_resilient_session(max_retries: int = 3) -> requests.Session:
     Returns:
         Configured requests.Session object
     """
+    # requests is slow to import, so only pay for it when a session is needed
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    
     session = requests.Session()
     
     retry_strategy = Retry(
         total=max_retries,
         backoff_factor=2,  # 2, 4, 8 seconds between retries
         status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["GET", "POST"],
+        # POST is not idempotent: a retried /prompt whose first response was
+        # lost queues the job twice. comfyui_api.queue_prompt retries POSTs
+        # itself after checking the server for the earlier submission.
+        allowed_methods=["GET"],
         raise_on_status=False
     )
     
@@ -124,8 +132,8 @@ class RateLimiter:
 api_rate_limiter = RateLimiter(max_calls=10, period=60)
 
 
-def safe_api_call(session: requests.Session, url: str, payload: dict, 
-                  timeout: tuple = (10, 300)) -> requests.Response:
+def safe_api_call(session: "requests.Session", url: str, payload: dict, 
+                  timeout: tuple = (10, 300)) -> "requests.Response":
     """
     Make a safe API call with rate limiting and proper timeout
     
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+DriftingMe Workflow Schema
+Validates workflows against ComfyUI's /object_info before they are queued.
+
+The node schema is fetched once and cached on disk, keyed by server URL and
+ComfyUI version, so a typo in a sampler name or a missing checkpoint is caught
+locally instead of after a round trip and a queue slot. When a workflow fails
+against a cached schema, the schema is re-fetched once in case the server
+changed (e.g. a checkpoint was added) before the error is raised.
+"""
+
+import sys
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+from config import configure_logging, OUTPUT_DIR
+from comfyui_api import get_object_info, get_server_url, get_system_stats
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = OUTPUT_DIR / ".cache" / "object_info"
+
+
+class WorkflowValidationError(ValueError):
+    """Workflow does not match the server's node schema"""
+
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__(f"{len(errors)} workflow error(s):\n  " + "\n  ".join(errors))
+
+
+class Schema:
+    """Node schema of one ComfyUI server"""
+
+    def __init__(self, object_info: Dict[str, Any], version: str, fetched: bool):
+        """
+        Args:
+            object_info: Response of /object_info
+            version: ComfyUI version the schema belongs to
+            fetched: True if fetched from the server in this process
+        """
+        self.nodes = object_info
+        self.version = version
+        self.fetched = fetched
+
+    def options(self, class_type: str, input_name: str) -> List[Any]:
+        """Allowed values of an enum input (e.g. KSampler sampler_name), or []"""
+        spec = self._input_spec(class_type, input_name)
+        return (_enum_options(spec) or []) if spec else []
+
+    def _input_spec(self, class_type: str, input_name: str) -> Optional[list]:
+        inputs = self.nodes.get(class_type, {}).get("input", {})
+        for section in ("required", "optional", "hidden"):
+            if input_name in (inputs.get(section) or {}):
+                return inputs[section][input_name]
+        return None
+
+    def validate(self, workflow: Dict[str, Any]) -> List[str]:
+        """
+        Check node classes, input names, link types, enum values and ranges
+
+        Returns:
+            List of error messages, empty if the workflow is valid
+        """
+        errors = []
+        for node_id, node in workflow.items():
+            class_type = node.get("class_type")
+            info = self.nodes.get(class_type)
+            if info is None:
+                errors.append(f"node {node_id}: unknown node class '{class_type}'")
+                continue
+
+            label = f"node {node_id} ({class_type})"
+            inputs = node.get("inputs", {})
+            declared = info.get("input", {})
+
+            for name in (declared.get("required") or {}):
+                if name not in inputs:
+                    errors.append(f"{label}: missing required input '{name}'")
+
+            for name, value in inputs.items():
+                spec = self._input_spec(class_type, name)
+                if spec is None:
+                    errors.append(f"{label}: unknown input '{name}'")
+                elif _is_link(value):
+                    errors.extend(self._check_link(workflow, label, name, value, spec))
+                else:
+                    error = _check_value(spec, value)
+                    if error:
+                        errors.append(f"{label}: input '{name}' {error}")
+
+        return errors
+
+    def _check_link(self, workflow: Dict[str, Any], label: str, name: str,
+                    link: list, spec: list) -> List[str]:
+        source_id, index = str(link[0]), link[1]
+        source = workflow.get(source_id)
+        if source is None:
+            return [f"{label}: input '{name}' links to missing node {source_id}"]
+
+        outputs = self.nodes.get(source.get("class_type"), {}).get("output", [])
+        if not 0 <= index < len(outputs):
+            return [f"{label}: input '{name}' links to output {index} of {source_id}, "
+                    f"which has {len(outputs)} output(s)"]
+
+        expected, actual = spec[0], outputs[index]
+        if isinstance(expected, str) and expected != "*" and actual != "*" \
+                and actual not in expected.split(","):
+            return [f"{label}: input '{name}' expects {expected}, got {actual} from {source_id}"]
+        return []
+
+
+def _is_link(value: Any) -> bool:
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[1], int) \
+        and isinstance(value[0], str)
+
+
+def _enum_options(spec: list) -> Optional[List[Any]]:
+    """Enum values of an input spec; newer servers use ["COMBO", {"options": [...]}]"""
+    if isinstance(spec[0], list):
+        return spec[0]
+    if spec[0] == "COMBO" and len(spec) > 1:
+        return spec[1].get("options", [])
+    return None
+
+
+def _check_value(spec: list, value: Any) -> Optional[str]:
+    """Check a literal input value against its spec; returns an error or None"""
+    options = _enum_options(spec)
+    if options is not None:
+        if value not in options:
+            shown = ", ".join(map(str, options[:12])) + (", ..." if len(options) > 12 else "")
+            return f"value {value!r} not in [{shown}]"
+        return None
+
+    kind = spec[0]
+    limits = spec[1] if len(spec) > 1 and isinstance(spec[1], dict) else {}
+    if kind in ("INT", "FLOAT"):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                or (kind == "INT" and not isinstance(value, int)):
+            return f"expects {kind}, got {value!r}"
+        if "min" in limits and value < limits["min"]:
+            return f"value {value} below minimum {limits['min']}"
+        if "max" in limits and value > limits["max"]:
+            return f"value {value} above maximum {limits['max']}"
+    elif kind == "STRING" and not isinstance(value, str):
+        return f"expects STRING, got {value!r}"
+    elif kind == "BOOLEAN" and not isinstance(value, bool):
+        return f"expects BOOLEAN, got {value!r}"
+    return None
+
+
+def _cache_file(version: str):
+    import hashlib  # loads OpenSSL; deferred to keep generator startup fast
+
+    server = hashlib.sha256(get_server_url().encode("utf-8")).hexdigest()[:8]
+    safe_version = "".join(c if c.isalnum() or c in ".-" else "_" for c in version)
+    return CACHE_DIR / f"{server}_{safe_version}.json"
+
+
+def _server_version() -> str:
+    system = get_system_stats().get("system", {})
+    return system.get("comfyui_version") or "unknown"
+
+
+_schemas: Dict[str, Schema] = {}
+_schema_lock = threading.Lock()
+
+
+def load_schema(refresh: bool = False) -> Schema:
+    """
+    Get the node schema of the configured server
+
+    The server version is checked once per process; the schema itself is
+    read from the on-disk cache for that version, or fetched and cached.
+
+    Args:
+        refresh: Ignore the caches and fetch /object_info again
+    """
+    url = get_server_url()
+    with _schema_lock:
+        if not refresh and url in _schemas:
+            return _schemas[url]
+
+        version = _server_version()
+        cache_file = _cache_file(version)
+
+        if not refresh and cache_file.exists():
+            with open(cache_file, "r", encoding="utf-8") as f:
+                schema = Schema(json.load(f), version, fetched=False)
+        else:
+            start = time.time()
+            object_info = get_object_info()
+            logger.info(f"📥 Fetched node schema for ComfyUI {version} "
+                        f"({len(object_info)} node classes, {time.time() - start:.1f}s)")
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix(".tmp")
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(object_info, f)
+            tmp_file.replace(cache_file)
+            schema = Schema(object_info, version, fetched=True)
+
+        _schemas[url] = schema
+        return schema
+
+
+def validate_workflow(workflow: Dict[str, Any]):
+    """
+    Validate a workflow before queueing it
+
+    Raises:
+        WorkflowValidationError: If the workflow does not match the schema,
+            also after re-fetching a cached schema
+    """
+    schema = load_schema()
+    errors = schema.validate(workflow)
+
+    if errors and not schema.fetched:
+        logger.info("🔄 Workflow failed against the cached node schema, refreshing it")
+        schema = load_schema(refresh=True)
+        errors = schema.validate(workflow)
+
+    if errors:
+        raise WorkflowValidationError(errors)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect the cached ComfyUI node schema")
+    parser.add_argument("--refresh", action="store_true", help="Fetch /object_info again")
+    parser.add_argument("--list", choices=["samplers", "schedulers", "checkpoints"],
+                        help="Print the allowed values of an enum input")
+
+    args = parser.parse_args()
+    configure_logging()
+
+    try:
+        schema = load_schema(refresh=args.refresh)
+    except OSError as e:
+        logger.error(f"❌ Could not load node schema from {get_server_url()}: {e}")
+        sys.exit(1)
+
+    logger.info(f"📋 ComfyUI {schema.version}: {len(schema.nodes)} node classes")
+
+    if args.list:
+        class_type, input_name = {
+            "samplers": ("KSampler", "sampler_name"),
+            "schedulers": ("KSampler", "scheduler"),
+            "checkpoints": ("CheckpointLoaderSimple", "ckpt_name"),
+        }[args.list]
+        for value in schema.options(class_type, input_name):
+            print(value)
+
+
+if __name__ == "__main__":
+    main()